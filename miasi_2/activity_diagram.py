@@ -1,7 +1,21 @@
+import logging
 import math
-import xml.etree.ElementTree as ET
 import svgwrite
 
+import activity_layout
+import name_index
+import path_simplify
+import render_budget
+import render_profile
+import routing
+import svg_stream
+import svg_text
+import xml_backend
+from records import Shape
+
+log = logging.getLogger(__name__)
+
+
 def wrap_text_by_approx_width(text, max_width, font_size):
     """
     Wrap text into lines that fit within the given max_width in pixels.
@@ -45,492 +59,346 @@ def wrap_text_by_approx_width(text, max_width, font_size):
     return lines
 
 
-def parse_xml_to_svg(xml_file, svg_file):
-    try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        diagrams = root.find('Diagrams')
-        dwg = svgwrite.Drawing(svg_file, profile='full')
-
-        swimlane_style = {'stroke': 'black', 'fill': 'none', 'stroke-width': 2}
-        activity_swimlane2_style = {'stroke': 'black', 'fill': 'none', 'stroke-width': 2}
-        activity_style = {'stroke': 'black', 'fill': 'rgb(122, 207, 245)', 'stroke-width': 1, 'rx': 10, 'ry': 10}
-        decision_node_style = {'stroke': 'black', 'fill': 'rgb(122, 207, 245)', 'stroke-width': 1}
-        connector_style = {'stroke': 'black', 'stroke-width': 1}
-
-        element_positions = {}
-
-        swimlanes_count = 0
-        # Find and place ActivitySwimlane2
-        for swimlane in diagrams.findall(".//ActivitySwimlane2"):
-            x = float(swimlane.get('X', '0'))
-            y = float(swimlane.get('Y', '0'))
-            width = float(swimlane.get('Width', '0'))
-            height = float(swimlane.get('Height', '0'))
-
-            element_positions[swimlanes_count] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': height
-            }
-
-            dwg.add(dwg.rect(insert=(x, y), size=(width, height), **swimlane_style))
-
-            swimlanes_count += 1
-        print(f"Total SwimLanes: {swimlanes_count}")
-
-        partition_headers_count = 0
-        # Find and place ActivityPartitionHeader
-        for partition_header in diagrams.findall(".//ActivityPartitionHeader"):
-            id = partition_header.get('Id')
-            x = float(partition_header.get('X', '0'))
-            y = float(partition_header.get('Y', '0'))
-            width = float(partition_header.get('Width', '200'))
-            height = float(partition_header.get('Height', '40'))
-            name = partition_header.get('Name')
-            text_len = width + 47
-            wrapped_lines = wrap_text_by_approx_width(name, text_len, 11)
-
-            element_positions[id] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': height
-            }
-
-            background_style = {
-                'stroke': 'black',
-                'fill': 'white',
-                'stroke-width': 2
-            }
-
-            dwg.add(dwg.rect(insert=(x, y), size=(width, height), **background_style))
-
-            for i, line in enumerate(wrapped_lines):
-                text_y = y + 11 + i * 12
-                dwg.add(dwg.text(line, insert=(x + width / 2, text_y), fill='black', text_anchor='middle',
-                                 font_size=11, font_family='Arial', font_weight='normal'))
-
-            partition_headers_count += 1
-        print(f"Total ActivityPartitionHeaders: {partition_headers_count}")
-
-        activity_swimlanes_count = 0
-        for compartment in diagrams.findall(".//ActivitySwimlane2Compartment"):
-            x = float(compartment.get('X', '0'))
-            y = float(compartment.get('Y', '0'))
-            width = float(compartment.get('Width', '0'))
-            height = float(compartment.get('Height', '0'))
-            name = compartment.get('Name')
-            background_color = compartment.get('BackgroundColor', 'white')
-            border_color = compartment.get('BorderColor', 'black')
-
-            compartment_style = {
-                'stroke': border_color,
-                'fill': background_color,
-                'stroke-width': 2
-            }
-
-            element_positions[activity_swimlanes_count] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': height
-            }
-
-            dwg.add(dwg.rect(insert=(x, y), size=(width, height), **compartment_style))
-
-            if name:
-                wrapped_lines = wrap_text_by_approx_width(name, width, 11)
-                for i, line in enumerate(wrapped_lines):
-                    text_y = y + 15 + i * 12
-                    dwg.add(dwg.text(line, insert=(x + 5, text_y), fill='black', font_size=11, font_family='Arial',
-                                     font_weight='normal'))
-
-            activity_swimlanes_count += 1
-
-        print(f"Total SwimLanesCompartment: {activity_swimlanes_count}")
-
-        initial_nodes_count = 0
-        # Find and place InitialNode
-        for initial_node in diagrams.findall(".//InitialNode"):
-            id = initial_node.get('Id')
-            background = initial_node.get('Foreground')
-            width = float(initial_node.get('Width', '0'))
-            x = float(initial_node.get('X', '0'))
-            y = float(initial_node.get('Y', '0'))
-
-            radiuss = width / 4
-
-            element_positions[id] = {
-                'type': 'circle',
-                'center': (x, y),
-                'radius': radiuss
-            }
-
-            initial_node_style = {
-                'fill': background,
-            }
-
-            dwg.add(dwg.circle(center=(x + 2 * radiuss, y + radiuss), r=radiuss, **initial_node_style))
-            initial_nodes_count += 1
-        print(f"Total InitialNodes: {initial_nodes_count}")
-
-        activities_count = 0
-        # Find and place Activities
-        for activity in diagrams.findall(".//Activity"):
-            id = activity.get('Id')
-            x = float(activity.get('X', '0'))
-            y = float(activity.get('Y', '0'))
-            width = float(activity.get('Width', '200'))
-            name = activity.get('Name')
-            text_len = width + 47
-            wrapped_lines = wrap_text_by_approx_width(name, text_len, 11)
-
-            rect_height = 20 + (len(wrapped_lines) - 1) * 12
-            element_positions[id] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': rect_height
-            }
-
-            dwg.add(dwg.rect(insert=(x, y), size=(width, rect_height), **activity_style))
-
-            for i, line in enumerate(wrapped_lines):
-                text_y = y + 15 + i * 12
-                dwg.add(dwg.text(line, insert=(x + width / 2, text_y), fill='black', text_anchor='middle',
-                                 font_size=11, font_family='Arial', font_weight='bold'))
-
-            activities_count += 1
-        print(f"Total Activities: {activities_count}")
-
-        actions_count = 0
-        # Find and place ActivityAction
-        for action in diagrams.findall(".//ActivityAction"):
-            id = action.get('Id')
-            x = float(action.get('X', '0'))
-            y = float(action.get('Y', '0'))
-            width = float(action.get('Width', '200'))
-            height = float(action.get('Height', '40'))
-            name = action.get('Name')
-            background = action.get('Background', 'rgb(255, 255, 255)')
-            text_len = width + 47
-            wrapped_lines = wrap_text_by_approx_width(name, text_len, 11)
-            rect_height = height
-
-            element_positions[id] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': rect_height
-            }
-
-            background_style = {
-                'stroke': 'black',
-                'fill': background,
-                'stroke-width': 1,
-                'rx': 10,
-                'ry': 10
-            }
-
-            dwg.add(dwg.rect(insert=(x, y), size=(width, rect_height), **background_style))
-
-            for i, line in enumerate(wrapped_lines):
-                text_y = y + height / 2 - 3 + i * 12
-                dwg.add(dwg.text(line, insert=(x + width / 2, text_y), fill='black', text_anchor='middle',
-                                 font_size=11, font_family='Arial', font_weight='normal'))
-
-            actions_count += 1
-        print(f"Total ActivityActions: {actions_count}")
-
-        final_nodes_count = 0
-        # Find and place FinalNode
-        for final_node in diagrams.findall(".//ActivityFinalNode"):
-            id = final_node.get('Id')
-            background = final_node.get('Foreground')
-            width = float(final_node.get('Width', '0'))
-            x = float(final_node.get('X', '0'))
-            y = float(final_node.get('Y', '0'))
-
-            radius_outer = width / 2
-            radius_inner = radius_outer * 0.6
-
-            element_positions[id] = {
-                'type': 'circle',
-                'center': (x, y),
-                'radius': radius_outer
-            }
-
-            final_node_outer_style = {
-                'fill': 'none',
-                'stroke': 'black',
-                'stroke-width': 1
-            }
-
-            final_node_inner_style = {
-                'fill': background,
-                'stroke': 'none'
-            }
-
-            dwg.add(dwg.circle(center=(x + radius_outer, y + radius_outer), r=radius_outer, **final_node_outer_style))
-            dwg.add(dwg.circle(center=(x + radius_outer, y + radius_outer), r=radius_inner, **final_node_inner_style))
-
-            final_nodes_count += 1
-        print(f"Total ActivityFinalNodes: {final_nodes_count}")
-
-        accept_event_actions_count = 0
-        # Find and place AcceptEventAction
-        for accept_event in diagrams.findall(".//AcceptEventAction"):
-            id = accept_event.get('Id')
-            x = float(accept_event.get('X', '0'))
-            y = float(accept_event.get('Y', '0'))
-            rect_height = float(accept_event.get('Height', '0'))
-            width = float(accept_event.get('Width', '0'))
-            name = accept_event.get('Name')
-            background = accept_event.get('Background', 'rgb(255, 255, 255)')
-            text_len = width + 47
-            wrapped_lines = wrap_text_by_approx_width(name, text_len, 11)
-
-            element_positions[id] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': rect_height
-            }
-
-            arrow_size = width / 10
-            arrow_points = [
-                (x, y),
-                (x + width, y),
-                (x + width, y + rect_height),
-                (x, y + rect_height),
-                (x - arrow_size, y + rect_height),
-                (x, y + rect_height / 2),
-                (x - arrow_size, y)
-            ]
-
-            dwg.add(dwg.polygon(points=arrow_points, fill=background, stroke='black', stroke_width=1))
-
-            for i, line in enumerate(wrapped_lines):
-                text_y = y + 15 + i * 12
-                dwg.add(dwg.text(line, insert=(x + width / 2, text_y), fill='black', text_anchor='middle',
-                                 font_size=11, font_family='Arial', font_weight='normal'))
-
-            accept_event_actions_count += 1
-        print(f"Total AcceptEventActions: {accept_event_actions_count}")
-
-        send_signal_actions_count = 0
-        # Find and place SendSignalAction
-        for send_signal in diagrams.findall(".//SendSignalAction"):
-            id = send_signal.get('Id')
-            x = float(send_signal.get('X', '0'))
-            y = float(send_signal.get('Y', '0'))
-            rect_height = float(send_signal.get('Height', '0'))
-            width = float(send_signal.get('Width', '200'))
-            name = send_signal.get('Name')
-            background = send_signal.get('Background', 'rgb(255, 255, 255)')
-            text_len = width + 47
-            wrapped_lines = wrap_text_by_approx_width(name, text_len, 11)
-
-            element_positions[id] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': rect_height
-            }
-            arrow_size = rect_height
-
-            arrow_points = [
-                (x + width, y),
-                (x, y),
-                (x, y + rect_height),
-                (x + width, y + rect_height),
-                (x + width + arrow_size / 4, y + rect_height / 2)
-            ]
-            dwg.add(dwg.polygon(points=arrow_points, fill=background, stroke='black', stroke_width=1))
-
-            for i, line in enumerate(wrapped_lines):
-                text_y = y + 15 + i * 12
-                dwg.add(dwg.text(line, insert=(x + width / 2, text_y), fill='black', text_anchor='middle',
-                                 font_size=11, font_family='Arial', font_weight='normal'))
-
-
-            send_signal_actions_count += 1
-
-        print(f"Total SendSignalActions: {send_signal_actions_count}")
-
-        decision_nodes_count = 0
-        # Find and place DecisionNode
-        for decision_node in diagrams.findall(".//DecisionNode"):
-            id = decision_node.get('Id')
-            x = float(decision_node.get('X', '0')) + 2
-            y = float(decision_node.get('Y', '0')) + 4
-            width = float(decision_node.get('Width', '20')) - 4
-            height = float(decision_node.get('Height', '40')) - 8
-
-            half_width = width / 2
-            half_height = height / 2
-            points = [
-                (x + half_width, y),
-                (x + width, y + half_height),
-                (x + half_width, y + height),
-                (x, y + half_height)
-            ]
-
-            element_positions[id] = {
-                'type': 'diamond',
-                'center': (x, y),
-                'width': width,
-                'height': height,
-                'points': points
-            }
-            dwg.add(dwg.polygon(points=points, **decision_node_style))
-
-            decision_nodes_count += 1
-        print(f"Total DecisionNodes: {decision_nodes_count}")
-
-        object_nodes_count = 0
-        # Find and place ObjectNode
-        for object_node in diagrams.findall(".//ObjectNode"):
-            id = object_node.get('Id')
-            x = float(object_node.get('X', '0'))
-            y = float(object_node.get('Y', '0'))
-            width = float(object_node.get('Width', '85'))
-            rect_height = float(object_node.get('Height', '40'))
-            background = object_node.get('Background', 'rgb(122, 207, 245)')
-            name = object_node.get('Name')
-            text_len = width + 47
-            wrapped_lines = wrap_text_by_approx_width(name, text_len, 11)
-
-            element_positions[id] = {
-                'type': 'rect',
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': rect_height
-            }
-
-            background_style = {
-                'stroke': 'black',
-                'fill': background,
-                'stroke-width': 1
-            }
-
-            dwg.add(dwg.rect(insert=(x, y), size=(width, rect_height), **background_style))
-
-            for i, line in enumerate(wrapped_lines):
-                text_y = y + 15 + i * 12
-                dwg.add(dwg.text(line, insert=(x + width / 2, text_y), fill='black', text_anchor='middle',
-                                 font_size=11, font_family='Arial', font_weight='normal'))
-
-            object_nodes_count += 1
-        print(f"Total ObjectNodes: {object_nodes_count}")
-
-        control_flows_count = 0
-        # Find and draw ControlFlows
-        for control_flow in diagrams.findall(".//ControlFlow"):
-            from_id = control_flow.get('From')
-            to_id = control_flow.get('To')
-            caption = control_flow.find('.//Caption')
-            if caption is not None:
-                x_caption = float(caption.get('X', '0')) + 30
-                y_caption = float(caption.get('Y', '0')) + 10
-                name = control_flow.get('Name')
-                if name is not None:
-                    dwg.add(dwg.text(name, insert=(x_caption, y_caption), fill='black', text_anchor='middle',
-                                     font_size=11, font_family='Arial', font_weight='normal'))
-
-            if from_id in element_positions and to_id in element_positions:
-
-                points = control_flow.findall(".//Points/Point")
-                points_list = [(float(point.get('X')), float(point.get('Y'))) for point in points]
-
-                if len(points_list) >= 2:
-                    for point in range(len(points_list)):
-                        if point < len(points_list) - 1:
-                            dwg.add(dwg.line(start=(points_list[point]), end=(points_list[point + 1]) , **connector_style))
-
-                # Adding arrow heads
-                if len(points_list) >= 2:
-                    from_edge = points_list[-2]
-                    to_edge = points_list[-1]
-                    arrow_size = 15
-                    angle = math.atan2(to_edge[1] - from_edge[1], to_edge[0] - from_edge[0])
-                    arrow_points = [
-                        (to_edge[0] - arrow_size * math.cos(angle - math.pi / 6),
-                         to_edge[1] - arrow_size * math.sin(angle - math.pi / 6)),
-                        (to_edge[0] - arrow_size * math.cos(angle + math.pi / 6),
-                         to_edge[1] - arrow_size * math.sin(angle + math.pi / 6)),
-                        to_edge
-                    ]
-                    dwg.add(dwg.line(start=(arrow_points[0]), end=(arrow_points[2]),  **connector_style))
-                    dwg.add(dwg.line(start=(arrow_points[1]), end=(arrow_points[2]),  **connector_style))
-
-                control_flows_count += 1
-
-        print(f"Total ControlFlows: {control_flows_count}")
-
-        activity_object_flow_count = 0
-        for activity_object_flow in diagrams.findall(".//ActivityObjectFlow"):
-            from_id = activity_object_flow.get('From')
-            to_id = activity_object_flow.get('To')
-            caption = activity_object_flow.find('.//Caption')
-            if caption is not None:
-                x_caption = float(caption.get('X', '0')) + 30
-                y_caption = float(caption.get('Y', '0')) + 10
-                name = activity_object_flow.get('Name')
-                if name is not None:
-                    dwg.add(dwg.text(name, insert=(x_caption, y_caption), fill='black', text_anchor='middle',
-                                     font_size=11, font_family='Arial', font_weight='normal'))
-
+# Over budget the label is not wrapped, it is cut to one line
+def wrap_label(budget, name, max_width):
+    if render_budget.degrade(budget, 'wrapping'):
+        return [render_budget.label(budget, name)]
+    return wrap_text_by_approx_width(name, max_width, 11)
+
+
+# Straight connector between middles of two placed shapes
+def straight_points(from_shape, to_shape):
+    return [(from_shape.x + from_shape.width / 2, from_shape.y + from_shape.height / 2),
+            (to_shape.x + to_shape.width / 2, to_shape.y + to_shape.height / 2)]
+
+
+# Boxes of all flow nodes, used to route connectors that come without Points
+def build_route_index(diagrams):
+    with render_profile.phase('geometry'):
+        boxes = {}
+        for elem in diagrams.iter():
+            if elem.tag in activity_layout.NODE_TAGS and elem.get('Id') is not None:
+                width, height = activity_layout.node_size(elem)
+                boxes[elem.get('Id')] = (float(elem.get('X', '0')), float(elem.get('Y', '0')), width, height)
+        return routing.build_index(boxes)
+
+
+def route_missing_points(route_index, from_id, to_id):
+    if from_id == to_id or from_id not in route_index['boxes'] or to_id not in route_index['boxes']:
+        return []
+    return routing.route_orthogonal(route_index, from_id, to_id)
+
+
+# Draw already parsed diagram (or whole Diagrams element) into svg_file
+# auto_layout: None - lay out only when coordinates are missing or stale, True - always, False - never
+# simplify_epsilon: bend points closer than this (in px) to the simplified connector are dropped
+# budget: render_budget.Budget, too big diagrams are drawn with cheaper output
+def render_activity_diagram(diagrams, svg_file, auto_layout=None, simplify_epsilon=0.5, budget=None):
+    dwg = svgwrite.Drawing(svg_file, profile='full')
+    svg_stream.save(dwg, render_budget.watch(draw_activity_diagram(dwg, diagrams, auto_layout, simplify_epsilon, budget),
+                                             budget))
+
+
+# Same as render_activity_diagram, but yields SVG text in chunks while the diagram is drawn
+def stream_activity_diagram(diagrams, auto_layout=None, simplify_epsilon=0.5, chunk_size=16384, budget=None):
+    dwg = svgwrite.Drawing(profile='full')
+    elements = draw_activity_diagram(dwg, diagrams, auto_layout, simplify_epsilon, budget)
+    return svg_stream.stream(dwg, render_budget.watch(elements, budget), chunk_size)
+
+
+SWIMLANE_STYLE = {'stroke': 'black', 'fill': 'none', 'stroke-width': 2}
+ACTIVITY_STYLE = {'stroke': 'black', 'fill': 'rgb(122, 207, 245)', 'stroke-width': 1, 'rx': 10, 'ry': 10}
+DECISION_NODE_STYLE = {'stroke': 'black', 'fill': 'rgb(122, 207, 245)', 'stroke-width': 1}
+CONNECTOR_STYLE = {'stroke': 'black', 'stroke-width': 1}
+
+FLOW_TAGS = ('ControlFlow', 'ActivityObjectFlow')
+
+
+# Item of a node drawn as a box with its wrapped name and Background fill
+def labelled_node(budget, node, default_width, default_height, default_background):
+    width = float(node.get('Width', default_width))
+    return (node.tag, node.get('Id'), float(node.get('X', '0')), float(node.get('Y', '0')), width,
+            float(node.get('Height', default_height)), wrap_label(budget, node.get('Name'), width + 47),
+            node.get('Background', default_background), None)
+
+
+# Items of diagram in paint order: swimlanes, nodes, then flows. Every item is a tuple
+#   shape (tag, Id, x, y, width, height, label lines, fill, stroke)
+#   flow  (tag, Id, points or None when not drawn, caption text or None, caption position or None)
+# Labels are wrapped and flows without Points routed here, ITEM_DRAWERS turn one item into elements.
+# Items are made lazily, so budget steps see everything drawn before them.
+def activity_items(diagrams, simplify_epsilon=0.5, budget=None):
+    element_positions = {}
+    route_index = None
+
+    for swimlane in diagrams.findall(".//ActivitySwimlane2"):
+        yield ('ActivitySwimlane2', swimlane.get('Id'), float(swimlane.get('X', '0')), float(swimlane.get('Y', '0')),
+               float(swimlane.get('Width', '0')), float(swimlane.get('Height', '0')), [], None, None)
+
+    for partition_header in diagrams.findall(".//ActivityPartitionHeader"):
+        id = partition_header.get('Id')
+        x = float(partition_header.get('X', '0'))
+        y = float(partition_header.get('Y', '0'))
+        width = float(partition_header.get('Width', '200'))
+        height = float(partition_header.get('Height', '40'))
+        wrapped_lines = wrap_label(budget, partition_header.get('Name'), width + 47)
+        element_positions[id] = Shape('rect', x, y, width, height)
+        yield 'ActivityPartitionHeader', id, x, y, width, height, wrapped_lines, None, None
+
+    for compartment in diagrams.findall(".//ActivitySwimlane2Compartment"):
+        width = float(compartment.get('Width', '0'))
+        name = compartment.get('Name')
+        wrapped_lines = wrap_label(budget, name, width) if name else []
+        yield ('ActivitySwimlane2Compartment', compartment.get('Id'), float(compartment.get('X', '0')),
+               float(compartment.get('Y', '0')), width, float(compartment.get('Height', '0')), wrapped_lines,
+               compartment.get('BackgroundColor', 'white'), compartment.get('BorderColor', 'black'))
+
+    for initial_node in diagrams.findall(".//InitialNode"):
+        id = initial_node.get('Id')
+        x = float(initial_node.get('X', '0'))
+        y = float(initial_node.get('Y', '0'))
+        width = float(initial_node.get('Width', '0'))
+        element_positions[id] = Shape('circle', x, y, width, width / 2)
+        yield 'InitialNode', id, x, y, width, width / 2, [], initial_node.get('Foreground'), None
+
+    for activity in diagrams.findall(".//Activity"):
+        id = activity.get('Id')
+        x = float(activity.get('X', '0'))
+        y = float(activity.get('Y', '0'))
+        width = float(activity.get('Width', '200'))
+        wrapped_lines = wrap_label(budget, activity.get('Name'), width + 47)
+        rect_height = 20 + (len(wrapped_lines) - 1) * 12
+        element_positions[id] = Shape('rect', x, y, width, rect_height)
+        yield 'Activity', id, x, y, width, rect_height, wrapped_lines, None, None
+
+    for action in diagrams.findall(".//ActivityAction"):
+        item = labelled_node(budget, action, '200', '40', 'rgb(255, 255, 255)')
+        element_positions[item[1]] = Shape('rect', *item[2:6])
+        yield item
+
+    for final_node in diagrams.findall(".//ActivityFinalNode"):
+        id = final_node.get('Id')
+        x = float(final_node.get('X', '0'))
+        y = float(final_node.get('Y', '0'))
+        width = float(final_node.get('Width', '0'))
+        element_positions[id] = Shape('circle', x, y, width, width)
+        yield 'ActivityFinalNode', id, x, y, width, width, [], final_node.get('Foreground'), None
+
+    for accept_event in diagrams.findall(".//AcceptEventAction"):
+        item = labelled_node(budget, accept_event, '0', '0', 'rgb(255, 255, 255)')
+        element_positions[item[1]] = Shape('rect', *item[2:6])
+        yield item
+
+    for send_signal in diagrams.findall(".//SendSignalAction"):
+        item = labelled_node(budget, send_signal, '200', '0', 'rgb(255, 255, 255)')
+        element_positions[item[1]] = Shape('rect', *item[2:6])
+        yield item
+
+    for decision_node in diagrams.findall(".//DecisionNode"):
+        id = decision_node.get('Id')
+        x = float(decision_node.get('X', '0')) + 2
+        y = float(decision_node.get('Y', '0')) + 4
+        width = float(decision_node.get('Width', '20')) - 4
+        height = float(decision_node.get('Height', '40')) - 8
+        element_positions[id] = Shape('diamond', x, y, width, height)
+        yield 'DecisionNode', id, x, y, width, height, [], None, None
+
+    for object_node in diagrams.findall(".//ObjectNode"):
+        item = labelled_node(budget, object_node, '85', '40', 'rgb(122, 207, 245)')
+        element_positions[item[1]] = Shape('rect', *item[2:6])
+        yield item
+    log.debug(f"Total nodes: {len(element_positions)}")
+
+    for tag in FLOW_TAGS:
+        flows_count = 0
+        for flow in diagrams.findall(".//" + tag):
+            from_id = flow.get('From')
+            to_id = flow.get('To')
+            caption = flow.find('.//Caption')
+            name = None
+            caption_position = None
+            if caption is not None and flow.get('Name') is not None:
+                name = render_budget.label(budget, flow.get('Name'))
+                caption_position = (float(caption.get('X', '0')) + 30, float(caption.get('Y', '0')) + 10)
+
+            points_list = None
             if from_id in element_positions and to_id in element_positions:
-                from_element = element_positions[from_id]
-                to_element = element_positions[to_id]
-
-                # Check if there are points defined in XML
-                points = activity_object_flow.findall(".//Points/Point")
+                points = flow.findall(".//Points/Point")
                 points_list = [(float(point.get('X')), float(point.get('Y'))) for point in points]
+                if len(points_list) < 2 and render_budget.degrade(budget, 'straight'):
+                    points_list = straight_points(element_positions[from_id], element_positions[to_id])
+                elif len(points_list) < 2:
+                    route_index = route_index or build_route_index(diagrams)
+                    points_list = route_missing_points(route_index, from_id, to_id)
+                points_list = render_budget.straight(budget, path_simplify.simplify_points(points_list, simplify_epsilon))
+                flows_count += 1
+            yield tag, flow.get('Id'), points_list, name, caption_position
+        log.debug(f"Total {tag}s: {flows_count}")
+
+
+def draw_swimlane(dwg, x, y, width, height, lines, fill, stroke):
+    yield dwg.rect(insert=(x, y), size=(width, height), **SWIMLANE_STYLE)
+
+
+def draw_partition_header(dwg, x, y, width, height, lines, fill, stroke):
+    yield dwg.rect(insert=(x, y), size=(width, height), **{'stroke': 'black', 'fill': 'white', 'stroke-width': 2})
+    yield from svg_text.text_lines(lines, x + width / 2, y + 11, 12, fill='black', text_anchor='middle',
+                                   font_size=11, font_family='Arial', font_weight='normal')
+
+
+def draw_compartment(dwg, x, y, width, height, lines, fill, stroke):
+    yield dwg.rect(insert=(x, y), size=(width, height), **{'stroke': stroke, 'fill': fill, 'stroke-width': 2})
+    yield from svg_text.text_lines(lines, x + 5, y + 15, 12, fill='black', font_size=11,
+                                   font_family='Arial', font_weight='normal')
+
+
+def draw_initial_node(dwg, x, y, width, height, lines, fill, stroke):
+    radiuss = width / 4
+    yield dwg.circle(center=(x + 2 * radiuss, y + radiuss), r=radiuss, fill=fill)
+
+
+def draw_activity(dwg, x, y, width, height, lines, fill, stroke):
+    yield dwg.rect(insert=(x, y), size=(width, height), **ACTIVITY_STYLE)
+    yield from svg_text.text_lines(lines, x + width / 2, y + 15, 12, fill='black', text_anchor='middle',
+                                   font_size=11, font_family='Arial', font_weight='bold')
+
+
+def draw_action(dwg, x, y, width, height, lines, fill, stroke):
+    yield dwg.rect(insert=(x, y), size=(width, height),
+                   **{'stroke': 'black', 'fill': fill, 'stroke-width': 1, 'rx': 10, 'ry': 10})
+    yield from svg_text.text_lines(lines, x + width / 2, y + height / 2 - 3, 12, fill='black',
+                                   text_anchor='middle', font_size=11, font_family='Arial', font_weight='normal')
+
+
+def draw_final_node(dwg, x, y, width, height, lines, fill, stroke):
+    radius_outer = width / 2
+    radius_inner = radius_outer * 0.6
+    yield dwg.circle(center=(x + radius_outer, y + radius_outer), r=radius_outer,
+                     **{'fill': 'none', 'stroke': 'black', 'stroke-width': 1})
+    yield dwg.circle(center=(x + radius_outer, y + radius_outer), r=radius_inner, **{'fill': fill, 'stroke': 'none'})
+
+
+def draw_accept_event(dwg, x, y, width, height, lines, fill, stroke):
+    arrow_size = width / 10
+    arrow_points = [
+        (x, y),
+        (x + width, y),
+        (x + width, y + height),
+        (x, y + height),
+        (x - arrow_size, y + height),
+        (x, y + height / 2),
+        (x - arrow_size, y)
+    ]
+    yield dwg.polygon(points=arrow_points, fill=fill, stroke='black', stroke_width=1)
+    yield from svg_text.text_lines(lines, x + width / 2, y + 15, 12, fill='black', text_anchor='middle',
+                                   font_size=11, font_family='Arial', font_weight='normal')
+
+
+def draw_send_signal(dwg, x, y, width, height, lines, fill, stroke):
+    arrow_size = height
+    arrow_points = [
+        (x + width, y),
+        (x, y),
+        (x, y + height),
+        (x + width, y + height),
+        (x + width + arrow_size / 4, y + height / 2)
+    ]
+    yield dwg.polygon(points=arrow_points, fill=fill, stroke='black', stroke_width=1)
+    yield from svg_text.text_lines(lines, x + width / 2, y + 15, 12, fill='black', text_anchor='middle',
+                                   font_size=11, font_family='Arial', font_weight='normal')
+
+
+def draw_decision_node(dwg, x, y, width, height, lines, fill, stroke):
+    half_width = width / 2
+    half_height = height / 2
+    points = [
+        (x + half_width, y),
+        (x + width, y + half_height),
+        (x + half_width, y + height),
+        (x, y + half_height)
+    ]
+    yield dwg.polygon(points=points, **DECISION_NODE_STYLE)
+
+
+def draw_object_node(dwg, x, y, width, height, lines, fill, stroke):
+    yield dwg.rect(insert=(x, y), size=(width, height), **{'stroke': 'black', 'fill': fill, 'stroke-width': 1})
+    yield from svg_text.text_lines(lines, x + width / 2, y + 15, 12, fill='black', text_anchor='middle',
+                                   font_size=11, font_family='Arial', font_weight='normal')
+
+
+# Caption, segments and arrow head of ControlFlow or ActivityObjectFlow
+def draw_flow(dwg, points_list, name, caption_position):
+    if name is not None:
+        yield dwg.text(name, insert=caption_position, fill='black', text_anchor='middle',
+                       font_size=11, font_family='Arial', font_weight='normal')
+    if points_list is None or len(points_list) < 2:
+        return
+
+    for start_point, end_point in zip(points_list, points_list[1:]):
+        yield dwg.line(start=start_point, end=end_point, **CONNECTOR_STYLE)
+
+    # Adding arrow heads
+    from_edge = points_list[-2]
+    to_edge = points_list[-1]
+    arrow_size = 15
+    angle = math.atan2(to_edge[1] - from_edge[1], to_edge[0] - from_edge[0])
+    arrow_points = [
+        (to_edge[0] - arrow_size * math.cos(angle - math.pi / 6),
+         to_edge[1] - arrow_size * math.sin(angle - math.pi / 6)),
+        (to_edge[0] - arrow_size * math.cos(angle + math.pi / 6),
+         to_edge[1] - arrow_size * math.sin(angle + math.pi / 6)),
+        to_edge
+    ]
+    yield dwg.line(start=(arrow_points[0]), end=(arrow_points[2]), **CONNECTOR_STYLE)
+    yield dwg.line(start=(arrow_points[1]), end=(arrow_points[2]), **CONNECTOR_STYLE)
+
+
+# Tag of item -> generator of its elements, called with dwg and the rest of the item after its Id
+ITEM_DRAWERS = {
+    'ActivitySwimlane2': draw_swimlane,
+    'ActivityPartitionHeader': draw_partition_header,
+    'ActivitySwimlane2Compartment': draw_compartment,
+    'InitialNode': draw_initial_node,
+    'Activity': draw_activity,
+    'ActivityAction': draw_action,
+    'ActivityFinalNode': draw_final_node,
+    'AcceptEventAction': draw_accept_event,
+    'SendSignalAction': draw_send_signal,
+    'DecisionNode': draw_decision_node,
+    'ObjectNode': draw_object_node,
+    'ControlFlow': draw_flow,
+    'ActivityObjectFlow': draw_flow,
+}
+
+
+# Yield elements of diagram in paint order: swimlanes, nodes, then flows
+def draw_activity_diagram(dwg, diagrams, auto_layout=None, simplify_epsilon=0.5, budget=None):
+    if auto_layout or (auto_layout is None and activity_layout.needs_layout(diagrams)):
+        with render_profile.phase('geometry'):
+            activity_layout.layout_activity_diagram(diagrams)
+        log.info("Diagram laid out automatically")
+
+    for item in activity_items(diagrams, simplify_epsilon, budget):
+        yield svg_stream.Owner(item[1])
+        yield from ITEM_DRAWERS[item[0]](dwg, *item[2:])
+
+
+# With index_db the parsed export also updates the name index (see name_index)
+def parse_xml_to_svg(xml_file, svg_file, auto_layout=None, simplify_epsilon=0.5, index_db=None):
+    try:
+        root = xml_backend.parse_file(xml_file)
+        if index_db is not None:
+            name_index.update_db(index_db, xml_file, root)
+        diagrams = root.find('Diagrams')
 
-                if len(points_list) >= 2:
-                    # Draw the line using the extracted points
-                    for point_idx in range(len(points_list) - 1):
-                        start_point = points_list[point_idx]
-                        end_point = points_list[point_idx + 1]
-                        dwg.add(dwg.line(start=start_point, end=end_point, **connector_style))
-
-                if len(points_list) >= 2:
-                    from_edge = points_list[-2]
-                    to_edge = points_list[-1]
-                    arrow_size = 15
-                    angle = math.atan2(to_edge[1] - from_edge[1], to_edge[0] - from_edge[0])
-                    arrow_points = [
-                        (to_edge[0] - arrow_size * math.cos(angle - math.pi / 6),
-                         to_edge[1] - arrow_size * math.sin(angle - math.pi / 6)),
-                        (to_edge[0] - arrow_size * math.cos(angle + math.pi / 6),
-                         to_edge[1] - arrow_size * math.sin(angle + math.pi / 6)),
-                        to_edge
-                    ]
-                    dwg.add(dwg.line(start=(arrow_points[0]), end=(arrow_points[2]), **connector_style))
-                    dwg.add(dwg.line(start=(arrow_points[1]), end=(arrow_points[2]), **connector_style))
-
-                activity_object_flow_count += 1
-        print(f"Total ControlFlows: {activity_object_flow_count}")
-
-        dwg.save()
+        render_activity_diagram(diagrams, svg_file, auto_layout, simplify_epsilon)
 
     except Exception as e:
-        print(f"Error processing XML and generating SVG: {e}")
+        log.error(f"Error processing XML and generating SVG: {e}")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     xml_input_file = 'sumxmls/simple_activity2_hard.xml'
     svg_output_file = 'activity_diagram.svg'
 
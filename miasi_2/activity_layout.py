@@ -0,0 +1,222 @@
+import layout
+import routing
+
+
+# Swimlane aware layered layout for activity diagrams. Flow goes from top to bottom, every
+# ActivitySwimlane2Compartment becomes a column and nodes stay inside the column of the lane
+# they are nested in. Positions are written back to X, Y, Width and Height attributes and
+# connector Points are rebuilt by the router, so the regular renderer draws the result without changes.
+
+NODE_TAGS = ('InitialNode', 'Activity', 'ActivityAction', 'ActivityFinalNode', 'AcceptEventAction',
+             'SendSignalAction', 'DecisionNode', 'ObjectNode')
+FLOW_TAGS = ('ControlFlow', 'ActivityObjectFlow')
+
+# Size used when shape in the file has none (width, height)
+DEFAULT_SIZES = {
+    'InitialNode': (40, 20),
+    'ActivityFinalNode': (20, 20),
+    'DecisionNode': (20, 40),
+    'ObjectNode': (85, 40),
+}
+
+LANE_PADDING = 30
+HEADER_HEIGHT = 15
+LAYER_GAP = 50
+NODE_GAP = 30
+
+
+def default_size(node):
+    if node.tag in DEFAULT_SIZES:
+        return DEFAULT_SIZES[node.tag]
+    # Actions get width from their name, same 11px font as in the renderer
+    name = node.get('Name') or ''
+    return (min(200, max(100, len(name) * 7 + 20)), 40)
+
+
+def node_size(node):
+    width, height = default_size(node)
+    return (float(node.get('Width', width)), float(node.get('Height', height)))
+
+
+# Swimlane compartments in left to right order, each with the node shapes nested inside
+def collect_lanes(diagrams):
+    lanes = []
+    for swimlane in diagrams.iter('ActivitySwimlane2'):
+        compartments = {compartment.get('Id'): compartment for compartment in swimlane.iter('ActivitySwimlane2Compartment')}
+        headers = {header.get('Id'): header for header in swimlane.iter('ActivityPartitionHeader')}
+        compartment_ids = [value.get('Value') for value in swimlane.findall('./CompartmentIds/Value')]
+        header_ids = [value.get('Value') for value in swimlane.findall('./VerticalPartitionIds/Value')]
+        # Ids lists are ordered and paired, fall back to document order if they are missing
+        if not compartment_ids:
+            compartment_ids = list(compartments)
+        for i, compartment_id in enumerate(compartment_ids):
+            compartment = compartments.get(compartment_id)
+            if compartment is None:
+                continue
+            header = headers.get(header_ids[i]) if i < len(header_ids) else None
+            nodes = [node for node in compartment.iter() if node.tag in NODE_TAGS]
+            lanes.append({'swimlane': swimlane, 'compartment': compartment, 'header': header, 'nodes': nodes})
+    return lanes
+
+
+def collect_flows(diagrams):
+    return [flow for flow in diagrams.iter() if flow.tag in FLOW_TAGS]
+
+
+# Layout is needed when shapes have no coordinates, share one spot or left their lane
+def needs_layout(diagrams):
+    nodes = [node for node in diagrams.iter() if node.tag in NODE_TAGS]
+    spots = set()
+    for node in nodes:
+        if node.get('X') is None or node.get('Y') is None:
+            return True
+        spot = (node.get('X'), node.get('Y'))
+        if spot in spots:
+            return True
+        spots.add(spot)
+
+    for lane in collect_lanes(diagrams):
+        compartment = lane['compartment']
+        if compartment.get('X') is None or compartment.get('Width') is None:
+            return True
+        left = float(compartment.get('X'))
+        right = left + float(compartment.get('Width'))
+        for node in lane['nodes']:
+            x = float(node.get('X'))
+            if x < left or x + node_size(node)[0] > right:
+                return True
+    return False
+
+
+def set_bounds(elem, x, y, width, height):
+    elem.set('X', str(int(round(x))))
+    elem.set('Y', str(int(round(y))))
+    elem.set('Width', str(int(round(width))))
+    elem.set('Height', str(int(round(height))))
+
+
+def write_points(flow, points):
+    points_elem = flow.find('./Points')
+    if points_elem is None:
+        points_elem = flow.makeelement('Points', {})
+        flow.append(points_elem)
+    for point in list(points_elem):
+        points_elem.remove(point)
+    for x, y in points:
+        points_elem.append(points_elem.makeelement('Point', {'X': str(float(x)), 'Y': str(float(y))}))
+
+    # Renderer places caption 30px right and 10px below its X and Y, put label at middle of route
+    caption = flow.find('./Caption')
+    if caption is not None:
+        middle = points[len(points) // 2 - 1] if len(points) > 2 else points[0]
+        following = points[len(points) // 2] if len(points) > 2 else points[-1]
+        caption.set('X', str(int((middle[0] + following[0]) / 2) - 30))
+        caption.set('Y', str(int((middle[1] + following[1]) / 2) - 10))
+
+
+# Lay out whole diagram in place
+def layout_activity_diagram(diagrams, origin=(40, 40)):
+    lanes = collect_lanes(diagrams)
+    lane_of = {}
+    for i, lane in enumerate(lanes):
+        for node in lane['nodes']:
+            lane_of[node.get('Id')] = i
+
+    shapes = {}
+    for node in diagrams.iter():
+        if node.tag in NODE_TAGS and node.get('Id') is not None:
+            shapes[node.get('Id')] = node
+    # Nodes outside of any swimlane get own column after the lanes
+    free_lane = len(lanes)
+    for node_id in shapes:
+        lane_of.setdefault(node_id, free_lane)
+
+    flows = collect_flows(diagrams)
+    edges = [(flow.get('From'), flow.get('To')) for flow in flows
+             if flow.get('From') in shapes and flow.get('To') in shapes]
+
+    node_ids = list(shapes)
+    sizes = {node_id: node_size(node) for node_id, node in shapes.items()}
+
+    acyclic = layout.remove_cycles(node_ids, edges)
+    layer = layout.assign_layers(node_ids, acyclic)
+    chained_edges, dummies = layout.insert_dummy_nodes(layer, acyclic)
+
+    def lane_key(node):
+        # Dummy node of an edge belongs to the lane of edge source
+        return lane_of[node[1]] if isinstance(node, tuple) else lane_of[node]
+
+    layer_count = max(layer.values()) + 1 if layer else 0
+    layers = [[] for _ in range(layer_count)]
+    for node in node_ids + dummies:
+        layers[layer[node]].append(node)
+    for order in layers:
+        order.sort(key=lane_key)
+    layers = layout.minimize_crossings(layers, chained_edges, group=lane_key)
+
+    # Column width of every lane is the widest row of its nodes in any layer
+    lane_count = free_lane + 1
+    lane_widths = [0] * lane_count
+    rows = []
+    for order in layers:
+        row = {}
+        for node in order:
+            if node in sizes:
+                row.setdefault(lane_of[node], []).append(node)
+        for lane_index, members in row.items():
+            width = sum(sizes[node][0] for node in members) + NODE_GAP * (len(members) - 1)
+            lane_widths[lane_index] = max(lane_widths[lane_index], width)
+        rows.append(row)
+
+    lane_x = []
+    x = origin[0]
+    for lane_index in range(lane_count):
+        if lane_index < len(lanes):
+            lane_widths[lane_index] = max(lane_widths[lane_index], 120) + 2 * LANE_PADDING
+        elif lane_widths[lane_index]:
+            lane_widths[lane_index] += 2 * LANE_PADDING
+        lane_x.append(x)
+        x += lane_widths[lane_index]
+
+    boxes = {}
+    y = origin[1] + (HEADER_HEIGHT if lanes else 0) + LANE_PADDING
+    for row in rows:
+        row_height = 0
+        for lane_index, members in row.items():
+            width = sum(sizes[node][0] for node in members) + NODE_GAP * (len(members) - 1)
+            cursor = lane_x[lane_index] + (lane_widths[lane_index] - width) / 2
+            row_height = max(row_height, max(sizes[node][1] for node in members))
+            for node in members:
+                boxes[node] = (cursor, y, sizes[node][0], sizes[node][1])
+                cursor += sizes[node][0] + NODE_GAP
+        # Nodes of one layer share vertical center
+        for members in row.values():
+            for node in members:
+                box_x, box_y, box_width, box_height = boxes[node]
+                boxes[node] = (box_x, box_y + (row_height - box_height) / 2, box_width, box_height)
+        y += row_height + LAYER_GAP
+    bottom = y - LAYER_GAP + LANE_PADDING
+
+    for node_id, box in boxes.items():
+        set_bounds(shapes[node_id], *box)
+
+    # Lanes stretch over whole height, swimlane frame around all of them
+    frames = {}
+    for lane_index, lane in enumerate(lanes):
+        top = origin[1]
+        set_bounds(lane['compartment'], lane_x[lane_index], top + HEADER_HEIGHT,
+                   lane_widths[lane_index], bottom - top - HEADER_HEIGHT)
+        if lane['header'] is not None:
+            set_bounds(lane['header'], lane_x[lane_index], top, lane_widths[lane_index], HEADER_HEIGHT)
+        frame = frames.setdefault(id(lane['swimlane']), [lane['swimlane'], lane_x[lane_index], lane_x[lane_index]])
+        frame[2] = lane_x[lane_index] + lane_widths[lane_index]
+    for swimlane, left, right in frames.values():
+        set_bounds(swimlane, left, origin[1], right - left, bottom - origin[1])
+
+    route_index = routing.build_index(boxes)
+    for flow in flows:
+        source, target = flow.get('From'), flow.get('To')
+        if source in boxes and target in boxes and source != target:
+            write_points(flow, routing.route_orthogonal(route_index, source, target))
+
+    return boxes
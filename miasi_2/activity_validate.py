@@ -0,0 +1,241 @@
+import argparse
+import json
+import sys
+
+import activity_layout
+import xml_backend
+
+
+# Validation of activity diagrams without rendering, every check is linear in nodes + flows.
+# Renderer silently skips flows whose ends it does not draw and element types it does not know,
+# this pass reports them together with problems of the flow graph itself:
+#   dangling_edges          flows with missing or not drawn From/To shape
+#   unsupported             shapes and connectors the renderer does not draw
+#   unreachable             nodes no InitialNode (or AcceptEventAction without incoming flow) leads to
+#   cannot_finish           nodes with no path to ActivityFinalNode or FlowFinalNode
+#   cycles_without_decision cycles (strongly connected parts) with no DecisionNode to leave them
+#   hidden_unsupported      activity nodes of the model of unsupported type, not placed on any diagram
+# Hidden elements are reported for information only, they do not make the report fail.
+
+CONTAINER_TAGS = ('ActivitySwimlane2', 'ActivitySwimlane2Compartment', 'ActivityPartitionHeader')
+SHAPE_PARENTS = ('Shapes', 'DiagramElementChildren')
+FINAL_TAGS = ('ActivityFinalNode', 'FlowFinalNode')
+DECISION_TAGS = ('DecisionNode',)
+
+# Activity node types of UML models, the renderer draws only activity_layout.NODE_TAGS
+MODEL_NODE_TAGS = activity_layout.NODE_TAGS + ('JoinNode', 'ForkNode', 'MergeNode', 'FlowFinalNode',
+                                               'CallBehaviorAction', 'ActivityParameterNode', 'CentralBufferNode',
+                                               'DataStoreNode', 'InputPin', 'OutputPin')
+
+PROBLEM_KEYS = ('dangling_edges', 'unsupported', 'unreachable', 'cannot_finish', 'cycles_without_decision')
+
+
+def describe(elem):
+    return {'id': elem.get('Id'), 'type': elem.tag, 'name': elem.get('Name')}
+
+
+# Nodes reachable from starts, adjacency is a list of neighbour index lists
+def reachable(starts, adjacency):
+    seen = [False] * len(adjacency)
+    stack = list(starts)
+    for start in starts:
+        seen[start] = True
+    while stack:
+        node = stack.pop()
+        for neighbour in adjacency[node]:
+            if not seen[neighbour]:
+                seen[neighbour] = True
+                stack.append(neighbour)
+    return seen
+
+
+# Tarjan's strongly connected components without recursion
+def strongly_connected(adjacency):
+    count = len(adjacency)
+    index = [None] * count
+    low = [0] * count
+    on_stack = [False] * count
+    stack = []
+    components = []
+    counter = 0
+    for root in range(count):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            node, position = work[-1]
+            if position < len(adjacency[node]):
+                work[-1] = (node, position + 1)
+                neighbour = adjacency[node][position]
+                if index[neighbour] is None:
+                    index[neighbour] = low[neighbour] = counter
+                    counter += 1
+                    stack.append(neighbour)
+                    on_stack[neighbour] = True
+                    work.append((neighbour, 0))
+                elif on_stack[neighbour]:
+                    low[node] = min(low[node], index[neighbour])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+def validate_activity_diagram(diagram):
+    nodes = []
+    unsupported = []
+    for elem in diagram.iter():
+        if elem.get('Id') is None or elem.getparent() is None or elem.getparent().tag not in SHAPE_PARENTS:
+            continue
+        if elem.tag in CONTAINER_TAGS:
+            continue
+        nodes.append(elem)
+        if elem.tag not in activity_layout.NODE_TAGS:
+            unsupported.append(describe(elem))
+
+    positions = {node.get('Id'): i for i, node in enumerate(nodes)}
+    adjacency = [[] for _ in nodes]
+    reverse = [[] for _ in nodes]
+    dangling = []
+    edge_count = 0
+    for connectors in diagram.iter('Connectors'):
+        for flow in connectors:
+            if not isinstance(flow.tag, str):
+                continue
+            if flow.tag not in activity_layout.FLOW_TAGS:
+                unsupported.append(describe(flow))
+            source = positions.get(flow.get('From'))
+            target = positions.get(flow.get('To'))
+            if source is not None and target is not None:
+                adjacency[source].append(target)
+                reverse[target].append(source)
+                edge_count += 1
+            # Flow to or from a shape the renderer does not draw is dropped too
+            problems = [end for end, position in (('From', source), ('To', target))
+                        if position is None or nodes[position].tag not in activity_layout.NODE_TAGS]
+            if flow.tag in activity_layout.FLOW_TAGS and problems:
+                entry = describe(flow)
+                entry.update({'from': flow.get('From'), 'to': flow.get('To'), 'missing': problems})
+                dangling.append(entry)
+
+    # AcceptEventAction with no incoming flow is enabled when activity starts, same as InitialNode
+    initials = [i for i, node in enumerate(nodes)
+                if node.tag == 'InitialNode' or (node.tag == 'AcceptEventAction' and not reverse[i])]
+    finals = [i for i, node in enumerate(nodes) if node.tag in FINAL_TAGS]
+    from_initial = reachable(initials, adjacency)
+    to_final = reachable(finals, reverse)
+
+    cycles = []
+    for component in strongly_connected(adjacency):
+        if len(component) == 1 and component[0] not in adjacency[component[0]]:
+            continue
+        if any(nodes[member].tag in DECISION_TAGS for member in component):
+            continue
+        cycles.append([describe(nodes[member]) for member in sorted(component)])
+
+    report = {
+        'id': diagram.get('Id'),
+        'name': diagram.get('Name'),
+        'nodes': len(nodes),
+        'edges': edge_count,
+        'has_initial': bool(initials),
+        'has_final': bool(finals),
+        'dangling_edges': dangling,
+        'unsupported': unsupported,
+        # Without InitialNode (or final node) everything would be listed, missing node is reported by the flag
+        'unreachable': [describe(node) for i, node in enumerate(nodes) if initials and not from_initial[i]],
+        'cannot_finish': [describe(node) for i, node in enumerate(nodes) if finals and not to_final[i]],
+        'cycles_without_decision': cycles,
+    }
+    report['ok'] = not any(report[key] for key in PROBLEM_KEYS) and report['has_initial'] and report['has_final']
+    return report
+
+
+# Activity nodes of model with type renderer does not draw and no shape on any diagram
+def hidden_unsupported(root):
+    models = root.find('Models')
+    diagrams = root.find('Diagrams')
+    if models is None:
+        return []
+    shown = set()
+    if diagrams is not None:
+        for elem in diagrams.iter():
+            if elem.get('Model') is not None:
+                shown.add(elem.get('Model'))
+    return [describe(elem) for elem in models.iter(*MODEL_NODE_TAGS)
+            if elem.get('Id') is not None and elem.tag not in activity_layout.NODE_TAGS and elem.get('Id') not in shown]
+
+
+def validate_root(root):
+    diagrams = root.find('Diagrams')
+    reports = [validate_activity_diagram(diagram) for diagram in diagrams.iter('ActivityDiagram')] \
+        if diagrams is not None else []
+    return {'diagrams': reports, 'hidden_unsupported': hidden_unsupported(root),
+            'ok': all(report['ok'] for report in reports)}
+
+
+def validate_file(xml_file):
+    report = validate_root(xml_backend.parse_file(xml_file))
+    report['file'] = xml_file
+    return report
+
+
+# Validate many exports on a thread pool, unreadable files give report with 'error'
+def validate_files(xml_files, workers=None):
+    reports = []
+    for xml_file, (report, error) in zip(xml_files, xml_backend.run_batch(validate_file, [(f,) for f in xml_files],
+                                                                          workers)):
+        reports.append(report if error is None else {'file': xml_file, 'error': error, 'ok': False})
+    return reports
+
+
+def print_summary(report):
+    if 'error' in report:
+        print(f"{report['file']}: ERROR {report['error']}")
+        return
+    for diagram in report['diagrams']:
+        state = 'ok' if diagram['ok'] else 'FAIL'
+        counts = ', '.join(f'{key}={len(diagram[key])}' for key in PROBLEM_KEYS if diagram[key])
+        flags = [flag for flag in ('has_initial', 'has_final') if not diagram[flag]]
+        details = '; '.join(part for part in (counts, ' '.join(f'no {flag[4:]}' for flag in flags)) if part)
+        print(f"{report['file']}: {diagram['name']} {state} ({diagram['nodes']} nodes, {diagram['edges']} flows)"
+              + (f' {details}' if details else ''))
+    if report['hidden_unsupported']:
+        types = sorted({elem['type'] for elem in report['hidden_unsupported']})
+        print(f"{report['file']}: {len(report['hidden_unsupported'])} hidden unsupported model elements "
+              f"({', '.join(types)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate activity diagrams of Visual Paradigm exports')
+    parser.add_argument('xml_files', nargs='+')
+    parser.add_argument('--json', action='store_true', help='print full reports as JSON')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    reports = validate_files(xml_backend.expand_sources(args.xml_files), args.workers)
+    if args.json:
+        print(json.dumps(reports, indent=2, ensure_ascii=False))
+    else:
+        for report in reports:
+            print_summary(report)
+    sys.exit(0 if all(report['ok'] for report in reports) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
-from lxml import etree
 import svgwrite
-import math
+import os
+
+import layout
+import layout_cache
+import render_profile
+import routing
+import svg_stream
+import svg_text
+import xml_backend
 
 
 def parse_uml_xml(xml_file):
-    tree = etree.parse(xml_file)
-    root = tree.getroot()
-    return root
+    return xml_backend.parse_file(xml_file)
 
 
 def map_uml_to_svg(uml_root):
@@ -15,67 +20,121 @@ def map_uml_to_svg(uml_root):
     return classes, associations
 
 
-def calculate_class_positions(classes, class_size, canvas_size):
-    radius = min(canvas_size) // 2 - class_size[0]
-    angle_step = 2 * math.pi / len(classes)
-    center = (canvas_size[0] // 2, canvas_size[1] // 2)
-
-    class_positions = {}
-    for idx, cls in enumerate(classes):
-        angle = idx * angle_step
-        class_x = center[0] + radius * math.cos(angle) - class_size[0] // 2
-        class_y = center[1] + radius * math.sin(angle) - class_size[1] // 2
-        class_positions[cls.get('name')] = (class_x, class_y)
-
-    return class_positions
+# Box size grows with the amount of members and the longest label inside the box
+def class_box_size(cls):
+    labels = [f"Class: {cls.get('name')}"]
+    labels += [f"+ {attr.get('name')}: {attr.get('type')}" for attr in cls.findall('.//attribute')]
+    labels += [f"+ {method.get('name')}(): {method.get('return')}" for method in cls.findall('.//method')]
+    members = len(labels) - 1
+    width = max(200, max(len(label) for label in labels) * 9 + 20)
+    height = max(60, 50 + members * 20)
+    return (width, height)
 
 
-def generate_svg(classes, associations, output_file):
-    canvas_size = (1200, 1200)
-    class_size = (200, 150)
-    dwg = svgwrite.Drawing(output_file, profile='full', size=canvas_size)
+# Place classes using association graph, 'layered' suits inheritance trees, 'force' general graphs
+# With `cache_dir` and `cache_key` layout is reused or warm started from the previous run
+def calculate_class_positions(classes, associations, class_sizes, mode='auto', cache_dir=None, cache_key=None):
+    names = [cls.get('name') for cls in classes]
+    known = set(names)
+    hierarchy_types = ('inheritance', 'implementation')
 
-    class_positions = calculate_class_positions(classes, class_size, canvas_size)
+    edges = []
+    hierarchy_edges = 0
+    for assoc in associations:
+        from_class = assoc.get('from')
+        to_class = assoc.get('to')
+        if from_class not in known or to_class not in known:
+            continue
+        # Parent ('to' end) goes above its children
+        if assoc.get('type', 'association') in hierarchy_types:
+            edges.append((to_class, from_class))
+            hierarchy_edges += 1
+        else:
+            edges.append((from_class, to_class))
+
+    if mode == 'auto':
+        mode = 'layered' if edges and hierarchy_edges * 3 >= len(edges) else 'force'
+
+    if cache_dir is not None and cache_key is not None:
+        positions = layout_cache.cached_layout(cache_key, names, edges, class_sizes, mode, cache_dir)
+    elif mode == 'layered':
+        positions = layout.layered_layout(names, edges, class_sizes)
+    elif mode == 'force':
+        positions = layout.force_layout(names, edges, class_sizes)
+    else:
+        raise ValueError(f'Unknown layout mode: {mode}')
+
+    return layout.normalize_positions(positions, class_sizes)
+
+
+# connector_style: 'orthogonal' routes lines around classes, 'curved' draws the old quadratic curves
+def generate_svg(classes, associations, output_file, layout_mode='auto', layout_cache_dir=None,
+                 connector_style='orthogonal'):
+    dwg = svgwrite.Drawing(output_file, profile='full')
+    svg_stream.save(dwg, draw_class_elements(dwg, classes, associations, layout_mode, layout_cache_dir,
+                                             os.path.abspath(output_file), connector_style))
+
+
+# Same as generate_svg, but yields SVG text in chunks while the diagram is drawn.
+# cache_key names the layout cache entry, generate_svg uses path of the output file.
+def stream_svg(classes, associations, layout_mode='auto', layout_cache_dir=None, cache_key=None,
+               connector_style='orthogonal', chunk_size=16384):
+    dwg = svgwrite.Drawing(profile='full')
+    return svg_stream.stream(dwg, draw_class_elements(dwg, classes, associations, layout_mode, layout_cache_dir,
+                                                      cache_key, connector_style), chunk_size)
+
+
+# Yield elements of diagram in paint order: classes, then connectors. Canvas size is set on dwg after layout.
+def draw_class_elements(dwg, classes, associations, layout_mode='auto', layout_cache_dir=None, cache_key=None,
+                        connector_style='orthogonal'):
+    with render_profile.phase('geometry'):
+        class_sizes = {cls.get('name'): class_box_size(cls) for cls in classes}
+        class_positions, canvas_size = calculate_class_positions(classes, associations, class_sizes, layout_mode,
+                                                                 layout_cache_dir, cache_key)
+    dwg['width'], dwg['height'] = canvas_size
 
     # Draw classes
     for cls in classes:
+        yield svg_stream.Owner(cls.get('name'))
         class_name = cls.get('name')
         class_type = cls.get('type')
         class_x, class_y = class_positions[class_name]
+        class_size = class_sizes[class_name]
 
         if class_type == 'class':
-            dwg.add(dwg.rect(insert=(class_x, class_y), size=class_size, fill='white', stroke='black'))
+            yield dwg.rect(insert=(class_x, class_y), size=class_size, fill='white', stroke='black')
         elif class_type == 'abstract':
-            dwg.add(dwg.rect(insert=(class_x, class_y), size=class_size, fill='white', stroke='black',
-                             stroke_dasharray="5,5"))
+            yield dwg.rect(insert=(class_x, class_y), size=class_size, fill='white', stroke='black',
+                           stroke_dasharray="5,5")
         elif class_type == 'interface':
-            dwg.add(dwg.rect(insert=(class_x, class_y), size=class_size, fill='lightblue', stroke='black'))
+            yield dwg.rect(insert=(class_x, class_y), size=class_size, fill='lightblue', stroke='black')
 
-        dwg.add(dwg.text(f"Class: {class_name}", insert=(class_x + 10, class_y + 20), fill='black'))
+        yield dwg.text(f"Class: {class_name}", insert=(class_x + 10, class_y + 20), fill='black')
 
-        dwg.add(dwg.line(start=(class_x, class_y + 30), end=(class_x + class_size[0], class_y + 30), stroke='black'))
+        yield dwg.line(start=(class_x, class_y + 30), end=(class_x + class_size[0], class_y + 30), stroke='black')
 
         attr_y = class_y + 40
+        lines = []
         for attr in cls.findall('.//attribute'):
             attr_name = attr.get('name')
             attr_type = attr.get('type')
             visibility = attr.get('visibility')
             visibility_symbol = {'public': '+', 'protected': '#', 'private': '-'}[visibility]
-            dwg.add(
-                dwg.text(f'{visibility_symbol} {attr_name}: {attr_type}', insert=(class_x + 10, attr_y), fill='black'))
-            attr_y += 20
+            lines.append(f'{visibility_symbol} {attr_name}: {attr_type}')
+        yield from svg_text.text_lines(lines, class_x + 10, attr_y, 20, fill='black')
+        attr_y += 20 * len(lines)
 
-        dwg.add(dwg.line(start=(class_x, attr_y - 10), end=(class_x + class_size[0], attr_y - 10), stroke='black',
-                         stroke_dasharray="5,5"))
+        yield dwg.line(start=(class_x, attr_y - 10), end=(class_x + class_size[0], attr_y - 10), stroke='black',
+                       stroke_dasharray="5,5")
 
+        lines = []
         for method in cls.findall('.//method'):
             method_name = method.get('name')
             return_type = method.get('return')
             visibility = method.get('visibility')
             visibility_symbol = {'public': '+', 'protected': '#', 'private': '-'}[visibility]
-            dwg.add(dwg.text(f'{visibility_symbol} {method_name}(): {return_type}', insert=(class_x + 10, attr_y),
-                             fill='blue'))
-            attr_y += 20
+            lines.append(f'{visibility_symbol} {method_name}(): {return_type}')
+        yield from svg_text.text_lines(lines, class_x + 10, attr_y, 20, fill='blue')
 
     # Draw associations
     def adjust_to_border(start, end, rect_pos, rect_size):
@@ -126,46 +185,59 @@ def generate_svg(classes, associations, output_file):
                                              end[0], end[1]), stroke='black', fill='none')
         return path
 
+    def draw_orthogonal_line(dwg, points):
+        path = dwg.path(d="M " + " L ".join(f"{x},{y}" for x, y in points), stroke='black', fill='none')
+        return path
+
+    route_index = routing.build_index({name: (pos[0], pos[1], class_sizes[name][0], class_sizes[name][1])
+                                       for name, pos in class_positions.items()})
+
     for assoc in associations:
         from_class = assoc.get('from')
         to_class = assoc.get('to')
         assoc_type = assoc.get('type', 'association')
 
         if from_class in class_positions and to_class in class_positions:
+            yield svg_stream.Owner(f'{from_class}->{to_class}')
             from_pos = class_positions[from_class]
             to_pos = class_positions[to_class]
 
-            from_center = (from_pos[0] + class_size[0] // 2, from_pos[1] + class_size[1] // 2)
-            to_center = (to_pos[0] + class_size[0] // 2, to_pos[1] + class_size[1] // 2)
+            from_size = class_sizes[from_class]
+            to_size = class_sizes[to_class]
 
-            from_border = adjust_to_border(from_center, to_center, from_pos, class_size)
-            to_border = adjust_to_border(to_center, from_center, to_pos, class_size)
+            from_center = (from_pos[0] + from_size[0] // 2, from_pos[1] + from_size[1] // 2)
+            to_center = (to_pos[0] + to_size[0] // 2, to_pos[1] + to_size[1] // 2)
 
-            path = draw_curved_line(dwg, from_border, to_border)
+            if connector_style == 'orthogonal' and from_class != to_class:
+                route = routing.route_orthogonal(route_index, from_class, to_class)
+                to_border = route[-1]
+                path = draw_orthogonal_line(dwg, route)
+            else:
+                from_border = adjust_to_border(from_center, to_center, from_pos, from_size)
+                to_border = adjust_to_border(to_center, from_center, to_pos, to_size)
+                path = draw_curved_line(dwg, from_border, to_border)
 
             if assoc_type == 'association':
-                dwg.add(path)
+                yield path
             elif assoc_type == 'aggregation':
-                dwg.add(path)
-                dwg.add(dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
-                                            (to_border[0], to_border[1] + 5), (to_border[0] - 10, to_border[1])],
-                                    fill='white', stroke='black'))
+                yield path
+                yield dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
+                                          (to_border[0], to_border[1] + 5), (to_border[0] - 10, to_border[1])],
+                                  fill='white', stroke='black')
             elif assoc_type == 'composition':
-                dwg.add(path)
-                dwg.add(dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
-                                            (to_border[0], to_border[1] + 5), (to_border[0] - 10, to_border[1])],
-                                    fill='black'))
+                yield path
+                yield dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
+                                          (to_border[0], to_border[1] + 5), (to_border[0] - 10, to_border[1])],
+                                  fill='black')
             elif assoc_type == 'inheritance':
-                dwg.add(path)
-                dwg.add(dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
-                                            (to_border[0], to_border[1] + 5)], fill='white', stroke='black'))
+                yield path
+                yield dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
+                                          (to_border[0], to_border[1] + 5)], fill='white', stroke='black')
             elif assoc_type == 'implementation':
                 path.dasharray([5, 5])  # Dashed line for interface implementation
-                dwg.add(path)
-                dwg.add(dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
-                                            (to_border[0], to_border[1] + 5)], fill='white', stroke='black'))
-
-    dwg.save()
+                yield path
+                yield dwg.polygon(points=[(to_border[0], to_border[1] - 5), (to_border[0] + 10, to_border[1]),
+                                          (to_border[0], to_border[1] + 5)], fill='white', stroke='black')
 
 
 def main():
@@ -174,7 +246,7 @@ def main():
 
     uml_root = parse_uml_xml(xml_file)
     classes, associations = map_uml_to_svg(uml_root)
-    generate_svg(classes, associations, output_file)
+    generate_svg(classes, associations, output_file, layout_cache_dir='.layout_cache')
 
 
 if __name__ == "__main__":
@@ -1,8 +1,23 @@
-import lxml.etree as ET
+import logging
+
 import svgwrite
 
-# Parse all model classes
-def parse_model_classes(elem):
+import name_index
+import path_simplify
+import render_budget
+import render_profile
+import svg_stream
+import svg_text
+import xml_backend
+from records import Attribute, ClassBox, ClassShape, Connector, ModelClass, Operation, Parameter
+
+log = logging.getLogger(__name__)
+
+
+# Parse all model classes, types is the table of build_type_table (built here when not given)
+def parse_model_classes(elem, types=None):
+    if types is None:
+        types = build_type_table(elem)
     m_classes_raw = elem.findall('.//Class')
 
     # Remove all nested and not needed classes
@@ -25,18 +40,18 @@ def parse_model_classes(elem):
         operations = []
         # Get all attributes
         for child in m_class_raw.findall('.//Attribute'):
-            attributes.append({'Name': child.attrib['Name'], 'Visibility': child.attrib['Visibility'], 'type': get_type(child), 'modifier': child.attrib['TypeModifier']})
+            attributes.append(Attribute(child.attrib['Name'], child.attrib['Visibility'], get_type(child, types), child.attrib['TypeModifier']))
         # Get all operations
         for child in m_class_raw.findall('.//Operation'):
             params = []
             # Get all parameters in operation
             for param in child.findall('.//Parameter'):
-                params.append({'Name': param.get('Name'), 'type': get_type(param), 'modifier': child.attrib['TypeModifier']})
-            operations.append({'Name': child.attrib['Name'], 'Visibility': child.attrib['Visibility'], 'Parameters': params, 'return_type': get_return_type(child), 'modifier': child.attrib['TypeModifier']})
+                params.append(Parameter(param.get('Name'), get_type(param, types), child.attrib['TypeModifier']))
+            operations.append(Operation(child.attrib['Name'], child.attrib['Visibility'], params, get_return_type(child, types), child.attrib['TypeModifier']))
 
         # We assume, that class supposed to have at least 1 attribute or 1 operation, if not, it's not a class (for us)
         if len(attributes) > 0 or len(operations) > 0:
-            classes_return[m_class_raw.get('Id')] = {'Name': name, 'Attributes': attributes, 'Operations': operations}
+            classes_return[m_class_raw.get('Id')] = ModelClass(name, attributes, operations)
 
     return classes_return
 
@@ -48,51 +63,88 @@ def parse_diagram_classes(elem):
     classes_return = {}
 
     for m_class_raw in m_classes_raw:
-        x = m_class_raw.get('X')
-        y = m_class_raw.get('Y')
-        width = m_class_raw.get('Width')
-        height = m_class_raw.get('Height')
+        x = int(m_class_raw.get('X'))
+        y = int(m_class_raw.get('Y'))
+        width = int(m_class_raw.get('Width'))
+        height = int(m_class_raw.get('Height'))
         id = m_class_raw.get('Id')
         master = m_class_raw.get('Model')  # ID of model class
         color = rgb_to_hex(m_class_raw.find('.//FillColor').get('Color'))
         font_shift = parse_font_shift(m_class_raw)
-        classes_return[master] = {'x': x, 'y': y, 'width': width, 'height': height, 'color': color, 'id': id, 'shift': font_shift}
+        classes_return[master] = ClassShape(id, x, y, width, height, color, font_shift)
 
     return classes_return
 
 
-# Get type of attribute, operation or something else
-def get_type(elem):
-    type = elem.find('.//Type')
-    to_return = None
-    if type is not None:
-        datatype = type.find('.//DataType')
-        internal_class = type.find('.//Class')
-
-        if internal_class is not None:
-            to_return = internal_class.get('Name')
-        elif datatype is not None:
-            to_return = datatype.get('Name')
-    else:
-        to_return = elem.get('Type', None)
-    return to_return
+# Display names of all types of one project, so member types are resolved by one lookup:
+#   type Id -> name                             classes and data types of the model
+#   type Idref -> name                          types of other projects, known by name of reference
+#   TemplateTypeBindInfo Id -> generic name     e.g. 'ArrayList<Pokój>'
+# project_render builds it once per export and every class diagram of the export shares it.
+def build_type_table(models):
+    types = {}
+    references = {}
+    for elem in models.iter('Class', 'DataType'):
+        if elem.get('Id') is not None:
+            types[elem.get('Id')] = elem.get('Name')
+        elif elem.get('Idref') is not None:
+            references.setdefault(elem.get('Idref'), elem.get('Name'))
+    for idref, name in references.items():
+        types.setdefault(idref, name)
+
+    for bind_info in models.iter('TemplateTypeBindInfo'):
+        if bind_info.get('Id') is not None:
+            binding_name(bind_info, types)
+    return types
+
+
+# Name of type referenced by the first child of holder (<Type>, <ReturnType>, <BindedType>)
+def referenced_name(holder, types):
+    for ref in holder:
+        if isinstance(ref.tag, str) and ref.get('Idref') is not None:
+            return types.get(ref.get('Idref'), ref.get('Name'))
+    return None
+
+
+# Bound type with its arguments, arguments are bindings too (ArrayList<Map<String, Klient>>)
+def binding_name(bind_info, types):
+    key = bind_info.get('Id')
+    if key is not None and key in types:
+        return types[key]
+    name = bind_info.get('BindedType')
+    binded = bind_info.find('BindedType')
+    if binded is not None:
+        name = referenced_name(binded, types) or name
+    arguments = [binding_name(argument, types) for argument in
+                 bind_info.iterfind('Details/TemplateTypeBindDetails/Arguments/TemplateTypeBindInfo')]
+    arguments = [argument for argument in arguments if argument]
+    if name and arguments:
+        name = f"{name}<{', '.join(arguments)}>"
+    if key is not None:
+        types[key] = name
+    return name
+
+
+# Type of member: template binding, then type reference in holder_tag, then plain attribute
+def member_type(elem, holder_tag, types):
+    for bind_info in elem.iterfind('TemplateTypeBindInfo/TemplateTypeBindInfo'):
+        name = binding_name(bind_info, types)
+        if name:
+            return name
+    holder = elem.find(holder_tag)
+    if holder is not None:
+        return referenced_name(holder, types)
+    return elem.get(holder_tag, None)
+
+
+# Get type of attribute, parameter or something else
+def get_type(elem, types):
+    return member_type(elem, 'Type', types)
 
 
 # Get return type of operation
-def get_return_type(elem):
-    type = elem.find('.//ReturnType')
-    to_return = None
-    if type is not None:
-        datatype = type.find('.//DataType')
-        internal_class = type.find('.//Class')
-
-        if internal_class is not None:
-            to_return = internal_class.get('Name')
-        elif datatype is not None:
-            to_return = datatype.get('Name')
-    else:
-        to_return = elem.get('ReturnType', None)
-    return to_return
+def get_return_type(elem, types):
+    return member_type(elem, 'ReturnType', types)
 
 
 # Parse line points
@@ -106,10 +158,10 @@ def parse_points(elem):
         id = points_obj.getparent().get('Id')
 
         for child in points_obj.iterchildren():
-            x = child.attrib.get('X')
-            y = child.attrib.get('Y')
-            point_points.append({'x': x, 'y': y})
-        points.append({'points': point_points, 'id': id})
+            x = float(child.attrib.get('X'))
+            y = float(child.attrib.get('Y'))
+            point_points.append((x, y))
+        points.append(Connector(id, point_points))
     return points
 
 
@@ -134,179 +186,218 @@ def rgb_to_hex(rgb_string):
     return f'#{r:02X}{g:02X}{b:02X}'
 
 
-# Main parse and draw function
-def parse(xml_file, output_file):
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+CANVAS_SIZE = ('2000px', '1600px')
 
-    # SVG setup
-    dwg = svgwrite.Drawing(output_file, profile='full', size=('2000px', '1600px'))
 
+# Draw one class diagram. Already parsed model classes can be passed in when several diagrams
+# of one project are rendered, so the model is parsed only once.
+# budget (render_budget.Budget) makes the renderer degrade output of too big diagrams
+def render_class_diagram(models, diagram, output_file, simplify_epsilon=0.5, model_classes=None, budget=None,
+                         fragments=None):
+    # SVG setup
+    dwg = svgwrite.Drawing(output_file, profile='full', size=CANVAS_SIZE)
+    svg_stream.save(dwg, render_budget.watch(
+        draw_class_diagram(dwg, models, diagram, simplify_epsilon, model_classes, budget, fragments), budget))
+    log.info('SVG file ' + output_file + ' created successfully.')
+
+
+# Same as render_class_diagram, but yields SVG text in chunks while the diagram is drawn
+def stream_class_diagram(models, diagram, simplify_epsilon=0.5, model_classes=None, chunk_size=16384,
+                         budget=None, fragments=None):
+    dwg = svgwrite.Drawing(profile='full', size=CANVAS_SIZE)
+    elements = draw_class_diagram(dwg, models, diagram, simplify_epsilon, model_classes, budget, fragments)
+    return svg_stream.stream(dwg, render_budget.watch(elements, budget), chunk_size)
+
+
+# Box of one class with name and members, drawn with its top left corner at (x, y)
+def draw_class_box(dwg, class_info, x, y, budget=None):
+    name = class_info.name
+    attributes = class_info.attributes
+    operations = class_info.operations
+    width = class_info.width
+    height = class_info.height
+    color = class_info.color
+    shift = class_info.shift
+
+    # Draw box of class
+    yield dwg.rect(insert=(x, y), size=(width, height), fill=color, stroke='black')
+
+    # Add name to box
+    yield dwg.text(render_budget.label(budget, name), insert=(x + width / 2, y + shift),
+                   text_anchor='middle', font_size='11px',
+                   font_family='Arial')
+
+    # Add separator between name and the rest
+    yield dwg.line(start=(x, y + shift + 2), end=(x + width, y + shift + 2),
+                   stroke='black')
+
+    # Cursor that shows where to write
+    write_at = y + shift * 2 + 1.3
+
+    # Over budget only the box with name is drawn
+    if (attributes or operations) and render_budget.degrade(budget, 'members'):
+        return
+
+    # List all attributes of class
+    lines = []
+    for attribute in attributes:
+        # Budget can run out in the middle of a long list, rest of it is left out
+        if render_budget.degrade(budget, 'members'):
+            break
+        visibility = ''
+        type = ''
+        if attribute.visibility == 'private':
+            visibility = '-'
+        elif attribute.visibility == 'public':
+            visibility = '+'
+        elif attribute.visibility == 'package':
+            visibility = '~'
+        elif attribute.visibility == 'protected':
+            visibility = '#'
+
+        if attribute.type is not None:
+            type = f": {attribute.type}"
+
+        # Writes attribute like "+ Name: int"
+        lines.append(render_budget.line(budget, f"{visibility} {attribute.name}{type}"))
+    yield from svg_text.text_lines(lines, x + 2, write_at, shift, True, text_anchor='start', font_size='10px',
+                                   font_family='Arial')
+    write_at += shift * len(lines)
+
+    # If cursor moved and class has operations, draw separator
+    if write_at != y + shift * 2 + 1.3 and len(operations) > 0:
+        yield dwg.line(start=(x, write_at - shift+2), end=(x + width, write_at - shift+2),
+                   stroke='black')
+        write_at += 1
+
+    # List all operations
+    lines = []
+    for operation in operations:
+        if render_budget.degrade(budget, 'members'):
+            break
+        visibility = ''
+        return_type = ''
+        parameters = ''
+        modifier = operation.modifier
+        if operation.visibility == 'private':
+            visibility = '-'
+        elif operation.visibility == 'public':
+            visibility = '+'
+        elif operation.visibility == 'package':
+            visibility = '~'
+        elif operation.visibility == 'protected':
+            visibility = '#'
+
+        if operation.return_type is not None:
+            return_type = f": {operation.return_type}"
+
+        # Get string of all parameters of this operation
+        if len(operation.parameters) > 0:
+            parameters_objs = operation.parameters
+            for i in range(len(parameters_objs)):
+                parameter_type = f': {parameters_objs[i].type}' if parameters_objs[i].type is not None else ''
+                parameters += f'{parameters_objs[i].name}{parameter_type}{parameters_objs[i].modifier}'
+                if i < len(parameters_objs) - 1:
+                    parameters += ', '
+
+        # Write operation like "+ Name(smt: int): void"
+        lines.append(render_budget.line(budget, f"{visibility}{operation.name}({parameters}){return_type}{modifier}"))
+    yield from svg_text.text_lines(lines, x + 2, write_at, shift, True, text_anchor='start', font_size='10px',
+                                   font_family='Arial')
+
+
+# Yield elements of diagram in paint order: classes, then connectors
+# fragments (fragment_cache.FragmentCache) reuses class boxes drawn on other diagrams of the project
+def draw_class_diagram(dwg, models, diagram, simplify_epsilon=0.5, model_classes=None, budget=None,
+                       fragments=None):
     # Define arrow marker for lines
     arrow_marker = dwg.marker(id='arrow', insert=(10, 5), size=(10, 10), orient='auto')
     arrow_marker.add(dwg.path(d='M0,0 L0,10 L10,5 Z', fill='black'))
 
-    dot_marker = dwg.marker(insert=(5, 5), size=(10, 10), orient='auto')
+    dot_marker = dwg.marker(id='dot', insert=(5, 5), size=(10, 10), orient='auto')
     dot_marker.add(dwg.circle(center=(5, 5), r=3, fill='black'))
     dwg.defs.add(dot_marker)
     dwg.defs.add(arrow_marker)
 
-    x_arrow_marker = dwg.marker(insert=(0, 10), size=(20, 20), orient='auto')
+    x_arrow_marker = dwg.marker(id='x_arrow', insert=(0, 10), size=(20, 20), orient='auto')
     x_arrow_marker.add(dwg.line(start=(5, 0), end=(15, 20), stroke='black', stroke_width=1))
     x_arrow_marker.add(dwg.line(start=(5, 20), end=(15, 0), stroke='black', stroke_width=1))
     dwg.defs.add(x_arrow_marker)
 
     # Extracting classes and points
-    model_classes = parse_model_classes(root.find('.//Models'))
-    diagram_classes = parse_diagram_classes(root.find('.//Diagrams'))
-    points = parse_points(root)
+    with render_profile.phase('extract'):
+        if model_classes is None:
+            model_classes = parse_model_classes(models)
+        diagram_classes = parse_diagram_classes(diagram)
+        points = parse_points(diagram)
 
     combined_classes = {}
 
     # Combining of model and diagram classes
     for model_class_id, model_class in model_classes.items():
-        id = model_class_id
-        name = model_class.get('Name')
-        attributes = model_class.get('Attributes')
-        operations = model_class.get('Operations')
-        x = diagram_classes[id]['x']
-        y = diagram_classes[id]['y']
-        width = diagram_classes[id]['width']
-        height = diagram_classes[id]['height']
-        color = diagram_classes[id]['color']
-        shift = diagram_classes[id]['shift']
-        combined_classes[id] = {'id': id, 'name': name, 'attributes': attributes, 'operations': operations, 'x': x, 'y': y, 'width': width, 'height': height, 'color': color, 'shift': shift}
+        # Class is not shown on this diagram
+        if model_class_id not in diagram_classes:
+            continue
+        combined_classes[model_class_id] = ClassBox(model_class_id, model_class, diagram_classes[model_class_id])
 
     # Draw classes
     for class_id, class_info in combined_classes.items():
-        name = class_info.get('name')
-        attributes = class_info.get('attributes')
-        operations = class_info.get('operations')
-        x = int(class_info['x'])
-        y = int(class_info['y'])
-        width = int(class_info['width'])
-        height = int(class_info['height'])
-        color = class_info['color']
-        shift = int(class_info['shift'])
-
-        # Draw box of class
-        dwg.add(dwg.rect(insert=(x, y), size=(width, height), fill=color, stroke='black'))
-
-        # Add name to box
-        dwg.add(
-            dwg.text(name, insert=(x + width / 2, y + shift),
-                     text_anchor='middle', font_size='11px',
-                     font_family='Arial'))
-
-        # Add separator between name and the rest
-        dwg.add(dwg.line(start=(x, y + shift + 2), end=(x + width, y + shift + 2),
-                         stroke='black'))
-
-        # Cursor that shows where to write
-        write_at = y + shift * 2 + 1.3
-
-        # List all attributes of class
-        for attribute in attributes:
-            visibility = ''
-            type = ''
-            if attribute.get('Visibility') == 'private':
-                visibility = '-'
-            elif attribute.get('Visibility') == 'public':
-                visibility = '+'
-            elif attribute.get('Visibility') == 'package':
-                visibility = '~'
-            elif attribute.get('Visibility') == 'protected':
-                visibility = '#'
-
-            if attribute.get('type') is not None:
-                type = f": {attribute.get('type')}"
-
-            # Writes attribute like "+ Name: int"
-            dwg.add(dwg.text(f"{visibility} {attribute.get('Name')}{type}", insert=(x + 2, write_at), text_anchor='start',
-                                 font_size='10px',
-                                 font_family='Arial'))
-            write_at += shift
-
-        # If cursor moved and class has operations, draw separator
-        if write_at != y + shift * 2 + 1.3 and len(operations) > 0:
-            dwg.add(dwg.line(start=(x, write_at - shift+2), end=(x + width, write_at - shift+2),
-                         stroke='black'))
-            write_at += 1
-
-        # List all operations
-        for operation in operations:
-            visibility = ''
-            return_type = ''
-            parameters = ''
-            modifier = operation.get('modifier')
-            if operation.get('Visibility') == 'private':
-                visibility = '-'
-            elif operation.get('Visibility') == 'public':
-                visibility = '+'
-            elif operation.get('Visibility') == 'package':
-                visibility = '~'
-            elif operation.get('Visibility') == 'protected':
-                visibility = '#'
-
-            if operation.get('return_type') is not None:
-                return_type = f": {operation.get('return_type')}"
-
-            # Get string of all parameters of this operation
-            if len(operation.get('Parameters')) > 0:
-                parameters_objs = operation.get('Parameters')
-                for i in range(len(parameters_objs)):
-                    parameter_type = f': {parameters_objs[i].get("type")}' if parameters_objs[i].get("type") is not None else ''
-                    parameters += f'{parameters_objs[i].get("Name")}{parameter_type}{parameters_objs[i].get("modifier")}'
-                    if i < len(parameters_objs) - 1:
-                        parameters += ', '
-
-            # Write operation like "+ Name(smt: int): void"
-            dwg.add(dwg.text(f"{visibility}{operation.get('Name')}({parameters}){return_type}{modifier}", insert=(x + 2, write_at), text_anchor='start',
-                             font_size='10px',
-                             font_family='Arial'))
-            write_at += shift
-
-        # Draw all connections of classes
+        yield svg_stream.Owner(class_id)
+        # Box drawn on an earlier diagram of the project is reused, budget may cut members, so not then
+        if fragments is not None and budget is None:
+            key = (class_id, class_info.width, class_info.height, class_info.color, class_info.shift)
+            yield fragments.place(key, lambda: draw_class_box(dwg, class_info, 0, 0), class_info.x, class_info.y)
+        else:
+            yield from draw_class_box(dwg, class_info, class_info.x, class_info.y, budget)
+
+    # Draw all connections of classes
+    previous = None
+    for x in range(len(points)):
+        yield svg_stream.Owner(points[x].id)
+        # Drop duplicated and collinear bend points before they go to SVG
+        actual_points = render_budget.straight(budget, path_simplify.simplify_points(points[x].points, simplify_epsilon))
+        for i in range(len(actual_points)):
+            if previous is None:
+                previous = actual_points[i]
+                continue
+
+            actual_point = actual_points[i]
+
+            # If it first connection, draw line with 'x'
+            if i == 1:
+                yield dwg.line(start=previous,
+                               end=actual_point, stroke='black',
+                               marker_start=x_arrow_marker.get_funciri())
+
+            # If it last connection, draw 2 lines on top of each other. One with arrow, one with black dot
+            if i == len(actual_points) - 1:
+                yield dwg.line(start=previous,
+                               end=actual_point, stroke='black',
+                               marker_end=arrow_marker.get_funciri())
+                yield dwg.line(start=previous,
+                               end=actual_point, stroke='black',
+                               marker_end=dot_marker.get_funciri())
+                break
+
+            # If it's line between first and last, draw line with nothing
+            yield dwg.line(start=previous, end=actual_point,
+                           stroke='black')
+
+            previous = actual_point
         previous = None
-        for x in range(len(points)):
-            actual_points = points[x].get('points')
-            for i in range(len(actual_points)):
-                if previous is None:
-                    previous = actual_points[i]
-                    continue
-
-                actual_point = actual_points[i]
-
-                # If it first connection, draw line with 'x'
-                if i == 1:
-                    dwg.add(dwg.line(start=(previous.get('x'), previous.get('y')),
-                                     end=(actual_point.get('x'), actual_point.get('y')), stroke='black',
-                                     marker_start=x_arrow_marker.get_funciri())),
-
-                # If it last connection, draw 2 lines on top of each other. One with arrow, one with black dot
-                if i == len(actual_points) - 1:
-                    dwg.add(dwg.line(start=(previous.get('x'), previous.get('y')),
-                                     end=(actual_point.get('x'), actual_point.get('y')), stroke='black',
-                                     marker_end=arrow_marker.get_funciri()))
-                    dwg.add(dwg.line(start=(previous.get('x'), previous.get('y')),
-                                     end=(actual_point.get('x'), actual_point.get('y')), stroke='black',
-                                     marker_end=dot_marker.get_funciri()))
-                    break
-
-                # If it's line between first and last, draw line with nothing
-                dwg.add(
-                    dwg.line(start=(previous.get('x'), previous.get('y')), end=(actual_point.get('x'), actual_point.get('y')),
-                             stroke='black'))
-
-                previous = actual_point
-            previous = None
-
-    # Save the SVG file
-    dwg.save()
-    print('SVG file ' + output_file + ' created successfully.')
+
+
+# Main parse and draw function
+# With index_db the parsed export also updates the name index (see name_index)
+def parse(xml_file, output_file, simplify_epsilon=0.5, index_db=None):
+    root = xml_backend.parse_file(xml_file)
+    if index_db is not None:
+        name_index.update_db(index_db, xml_file, root)
+    render_class_diagram(root.find('.//Models'), root.find('.//Diagrams'), output_file, simplify_epsilon)
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     xml_file = 'sumxmls/simple_class_huge.xml'
     output_file = 'class_diagram.svg'
 
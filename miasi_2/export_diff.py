@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import preview_server
+import project_render
+import svg_stream
+import xml_backend
+
+
+# Structural diff of two versions of one export.
+# Every element gets a Merkle hash of its tag, attributes and child hashes. Both trees are walked
+# together from the root and pairs of subtrees with equal hashes are skipped whole, so only the
+# changed branches are compared element by element. Elements are matched by Id, changes are:
+#   added / removed     Id exists only in the new / old export
+#   moved               only position changed: X, Y, connector Points or Caption, or another parent
+#   modified            anything else of the element itself changed (name, size, type, style...)
+# Each change says if it is a shape or connector of a diagram or a model element.
+
+# Changed on every save, not a change of the model
+IGNORED_ATTRS = ('PmLastModified',)
+POSITION_ATTRS = ('X', 'Y')
+POSITION_CHILDREN = ('Points', 'Point', 'Caption')
+
+STYLE = '''<style>
+g.diff-added * { stroke: #1a9c1a; stroke-width: 3px; }
+g.diff-modified * { stroke: #e08a00; stroke-width: 3px; }
+g.diff-moved * { stroke: #1f6fd1; stroke-width: 2px; stroke-dasharray: 6,3; }
+g.diff-removed * { stroke: #d11f1f; stroke-width: 2px; stroke-dasharray: 4,4; opacity: 0.6; }
+</style>'''
+
+
+def own_attributes(elem):
+    return {name: value for name, value in elem.attrib.items() if name not in IGNORED_ATTRS}
+
+
+# Hash of every element of tree, children are hashed before their parents.
+# Children with skipped_tags do not count in the hash of their parent.
+def subtree_hashes(root, skipped_tags=()):
+    hashes = {}
+    for elem in reversed(list(root.iter())):
+        if not isinstance(elem.tag, str):
+            continue
+        digest = hashlib.sha1(elem.tag.encode('utf-8'))
+        for name, value in sorted(own_attributes(elem).items()):
+            digest.update(f'\x00{name}={value}'.encode('utf-8'))
+        for child in elem:
+            if isinstance(child.tag, str) and child.tag not in skipped_tags:
+                digest.update(hashes[child])
+        hashes[elem] = digest.digest()
+    return hashes
+
+
+# Children of elem keyed by Id, children without Id by tag and their position among same tags
+def keyed_children(elem):
+    keyed = {}
+    counts = {}
+    for child in elem:
+        if not isinstance(child.tag, str):
+            continue
+        key = child.get('Id')
+        if key is None:
+            counts[child.tag] = counts.get(child.tag, 0) + 1
+            key = (child.tag, counts[child.tag])
+        keyed[key] = child
+    return keyed
+
+
+def id_elements(elem):
+    return [child for child in elem.iter() if isinstance(child.tag, str) and child.get('Id') is not None]
+
+
+# Ids of elements inside subtrees that differ between the trees, identical subtrees are pruned
+def changed_ids(old_root, new_root, old_hashes, new_hashes):
+    ids = set()
+    stack = [(old_root, new_root)]
+    while stack:
+        old, new = stack.pop()
+        if old_hashes[old] == new_hashes[new]:
+            continue
+        if old.get('Id') is not None:
+            ids.add(old.get('Id'))
+        if new.get('Id') is not None:
+            ids.add(new.get('Id'))
+        old_children = keyed_children(old)
+        new_children = keyed_children(new)
+        for key, child in old_children.items():
+            if key in new_children:
+                stack.append((child, new_children[key]))
+            else:
+                ids.update(elem.get('Id') for elem in id_elements(child))
+        for key, child in new_children.items():
+            if key not in old_children:
+                ids.update(elem.get('Id') for elem in id_elements(child))
+    return ids
+
+
+def index_ids(root):
+    return {elem.get('Id'): elem for elem in root.iter() if isinstance(elem.tag, str) and elem.get('Id') is not None}
+
+
+# What the element is: connector, shape of a diagram or model element
+def element_kind(elem):
+    node = elem.getparent()
+    while node is not None and node.tag not in ('Models', 'Diagrams'):
+        node = node.getparent()
+    if node is None or node.tag == 'Models':
+        return 'model'
+    if elem.get('From') is not None and elem.get('To') is not None:
+        return 'connector'
+    return 'shape'
+
+
+# Own content of element without its Id-bearing descendants: attributes and (tag, attributes) of the rest
+def own_content(elem):
+    parts = {}
+    stack = [child for child in elem if isinstance(child.tag, str) and child.get('Id') is None]
+    while stack:
+        child = stack.pop()
+        parts.setdefault(child.tag, []).append(sorted(own_attributes(child).items()))
+        stack.extend(grand for grand in child if isinstance(grand.tag, str) and grand.get('Id') is None)
+    return own_attributes(elem), parts
+
+
+def parent_id(elem):
+    node = elem.getparent()
+    while node is not None and node.get('Id') is None:
+        node = node.getparent()
+    return node.get('Id') if node is not None else None
+
+
+def compare(old, new):
+    old_attributes, old_parts = own_content(old)
+    new_attributes, new_parts = own_content(new)
+    attributes = sorted(name for name in set(old_attributes) | set(new_attributes)
+                        if old_attributes.get(name) != new_attributes.get(name))
+    children = sorted(tag for tag in set(old_parts) | set(new_parts) if old_parts.get(tag) != new_parts.get(tag))
+    reparented = parent_id(old) != parent_id(new)
+    if not attributes and not children and not reparented:
+        return None, []
+    if all(name in POSITION_ATTRS for name in attributes) and all(tag in POSITION_CHILDREN for tag in children):
+        return 'moved', attributes + children
+    return 'modified', attributes + children
+
+
+def describe(elem, change, details=None):
+    entry = {'id': elem.get('Id'), 'change': change, 'kind': element_kind(elem), 'type': elem.tag,
+             'name': elem.get('Name')}
+    if details:
+        entry['details'] = details
+    return entry
+
+
+def diff_roots(old_root, new_root):
+    old_hashes = subtree_hashes(old_root)
+    new_hashes = subtree_hashes(new_root)
+    candidates = changed_ids(old_root, new_root, old_hashes, new_hashes)
+    if not candidates:
+        return []
+    old_ids = index_ids(old_root)
+    new_ids = index_ids(new_root)
+
+    changes = []
+    for elem_id in sorted(candidates):
+        old = old_ids.get(elem_id)
+        new = new_ids.get(elem_id)
+        if old is None:
+            changes.append(describe(new, 'added'))
+        elif new is None:
+            changes.append(describe(old, 'removed'))
+        else:
+            change, details = compare(old, new)
+            if change is not None:
+                changes.append(describe(new, change, details))
+    return changes
+
+
+def diff_files(old_file, new_file):
+    return diff_roots(xml_backend.parse_file(old_file), xml_backend.parse_file(new_file))
+
+
+def summary(changes):
+    counts = {}
+    for change in changes:
+        key = f"{change['kind']} {change['change']}"
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+# Id -> change used to color fragments of one diagram. Fragments of renderers are owned by shape
+# Ids or by model Ids (classes), so a changed shape marks its model element too and shapes
+# of changed model elements are marked as modified.
+def highlight_map(changes, root):
+    marks = {change['id']: change['change'] for change in changes}
+    changed_models = set()
+    elements = index_ids(root)
+    for change in changes:
+        if change['kind'] == 'shape' and change['id'] in elements:
+            model_id = elements[change['id']].get('Model')
+            if model_id is not None:
+                marks.setdefault(model_id, change['change'])
+        if change['kind'] != 'model' or change['id'] not in elements:
+            continue
+        # Changed attribute or operation marks its class (and other owners) too
+        node = elements[change['id']]
+        while node is not None and node.tag != 'Models':
+            if node.get('Id') is not None:
+                changed_models.add(node.get('Id'))
+            node = node.getparent()
+    diagrams = root.find('Diagrams')
+    if diagrams is not None:
+        for elem in diagrams.iter():
+            if elem.get('Model') in changed_models and elem.get('Id') not in marks:
+                marks[elem.get('Id')] = 'modified'
+    for model_id in changed_models:
+        marks.setdefault(model_id, 'modified')
+    return marks
+
+
+def draw_fragments(root, diagram):
+    index = project_render.build_model_index(root)
+    dwg, elements = project_render.DRAWERS[diagram.tag](index, diagram)
+    return preview_server.collect_fragments(dwg, elements)
+
+
+# Diagram of new export drawn by its renderer with changed fragments colored, removed
+# fragments of the old version are drawn on top of it. Returns SVG text.
+def render_diff_svg(old_root, new_root, diagram_id, changes):
+    new_diagram = next(d for d in new_root.find('Diagrams') if d.get('Id') == diagram_id)
+    header, fragments = draw_fragments(new_root, new_diagram)
+    new_marks = highlight_map(changes, new_root)
+    removed = highlight_map([change for change in changes if change['change'] == 'removed'], old_root)
+
+    parts = [svg_stream.XML_DECLARATION, header, STYLE]
+    for key, svg in fragments:
+        mark = new_marks.get(key.split('#')[0])
+        parts.append(f'<g class="diff-{mark}">{svg}</g>' if mark else svg)
+
+    old_diagrams = old_root.find('Diagrams')
+    old_diagram = next((d for d in old_diagrams if d.get('Id') == diagram_id), None) if old_diagrams is not None else None
+    if removed and old_diagram is not None and old_diagram.tag == new_diagram.tag:
+        for key, svg in draw_fragments(old_root, old_diagram)[1]:
+            if key.split('#')[0] in removed:
+                parts.append(f'<g class="diff-removed">{svg}</g>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+# Ids of supported diagrams of new export that contain any change
+def changed_diagrams(old_root, new_root, changes):
+    marks = highlight_map(changes, new_root)
+    removed = {change['id'] for change in changes if change['change'] == 'removed'}
+    old_ids = index_ids(old_root)
+    result = []
+    diagrams = new_root.find('Diagrams')
+    for diagram in diagrams if diagrams is not None else ():
+        if diagram.tag not in project_render.DRAWERS:
+            continue
+        touched = diagram.get('Id') in marks or any(elem.get('Id') in marks for elem in diagram.iter())
+        old_diagram = old_ids.get(diagram.get('Id'))
+        if not touched and old_diagram is not None:
+            touched = any(elem.get('Id') in removed for elem in old_diagram.iter())
+        if touched:
+            result.append(diagram)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Structural diff of two versions of a Visual Paradigm export')
+    parser.add_argument('old_file')
+    parser.add_argument('new_file')
+    parser.add_argument('--json', action='store_true', help='print all changes as JSON')
+    parser.add_argument('--svg', metavar='DIR', help='write highlighted SVG of every changed diagram into DIR')
+    args = parser.parse_args()
+
+    old_root = xml_backend.parse_file(args.old_file)
+    new_root = xml_backend.parse_file(args.new_file)
+    changes = diff_roots(old_root, new_root)
+
+    if args.json:
+        print(json.dumps(changes, indent=2, ensure_ascii=False))
+    else:
+        for change in changes:
+            details = f" ({', '.join(change['details'])})" if 'details' in change else ''
+            print(f"{change['change']:9} {change['kind']:9} {change['type']} '{change['name'] or ''}' "
+                  f"[{change['id']}]{details}")
+        print(', '.join(f'{count} {key}' for key, count in sorted(summary(changes).items())) or 'no changes')
+
+    if args.svg:
+        os.makedirs(args.svg, exist_ok=True)
+        for number, diagram in enumerate(changed_diagrams(old_root, new_root, changes), start=1):
+            svg_file = os.path.join(args.svg, project_render.diagram_file_name(number, diagram))
+            with open(svg_file, 'w', encoding='utf-8') as f:
+                f.write(render_diff_svg(old_root, new_root, diagram.get('Id'), changes))
+            print(f"{diagram.tag} '{diagram.get('Name')}' -> {svg_file}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
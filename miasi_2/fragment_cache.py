@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+import svgwrite
+
+
+# Drawn fragments of model elements shown on several diagrams of one project.
+# A class box (box, name, separators, attribute and operation lines) is drawn once at the origin,
+# its serialized children are kept here under key of everything that changes its look
+# (model element Id, shape size, fill and font shift). Every later diagram places the same
+# children with translate() instead of drawing them again.
+# Cache is bounded: least recently used fragments are dropped over max_entries, so memory stays
+# flat over project-wide batch renders. Diagrams of one project render on threads, access is locked.
+
+DEFAULT_ENTRIES = 256
+
+
+# Group with already serialized children, placed at (x, y)
+class Placed(svgwrite.container.Group):
+    def __init__(self, children, x, y):
+        super().__init__(transform=f'translate({x},{y})')
+        self.children = children
+
+    def get_xml(self):
+        xml = super().get_xml()
+        xml.extend(self.children)
+        return xml
+
+
+class FragmentCache:
+    def __init__(self, max_entries=DEFAULT_ENTRIES):
+        self.max_entries = max_entries
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Children of fragment under key, draw() yields its svgwrite elements at the origin when it is missing
+    def fragment(self, key, draw):
+        with self.lock:
+            children = self.fragments.get(key)
+            if children is not None:
+                self.fragments.move_to_end(key)
+                self.hits += 1
+                return children
+            self.misses += 1
+        # Drawing runs unlocked, two threads may draw the same fragment, the result is the same
+        children = [element.get_xml() for element in draw()]
+        with self.lock:
+            self.fragments[key] = children
+            self.fragments.move_to_end(key)
+            while len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last=False)
+                self.evictions += 1
+        return children
+
+    def place(self, key, draw, x, y):
+        return Placed(self.fragment(key, draw), x, y)
+
+    def stats(self):
+        return {'entries': len(self.fragments), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
@@ -0,0 +1,403 @@
+import math
+import random
+
+
+# Automatic placement of boxes connected by edges.
+#
+# Every function works on plain data: `nodes` is a list of hashable ids, `edges` is a list of
+# (from_id, to_id) tuples and `sizes` maps an id to its (width, height). Results are dicts
+# mapping an id to the (x, y) of the top left corner of its box.
+
+
+# Remove cycles by reversing back edges found with iterative DFS
+def remove_cycles(nodes, edges):
+    adjacency = {node: [] for node in nodes}
+    for source, target in edges:
+        if source != target:
+            adjacency[source].append(target)
+
+    state = {}  # 1 - on stack, 2 - done
+    back_edges = set()
+
+    for start in nodes:
+        if start in state:
+            continue
+        state[start] = 1
+        stack = [(start, iter(adjacency[start]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                child_state = state.get(child)
+                if child_state is None:
+                    state[child] = 1
+                    stack.append((child, iter(adjacency[child])))
+                    break
+                if child_state == 1:
+                    back_edges.add((node, child))
+            else:
+                state[node] = 2
+                stack.pop()
+
+    acyclic = []
+    for source, target in edges:
+        if source == target:
+            continue
+        if (source, target) in back_edges:
+            acyclic.append((target, source))
+        else:
+            acyclic.append((source, target))
+    return acyclic
+
+
+# Longest path layering, sources end up in layer 0
+def assign_layers(nodes, edges):
+    incoming = {node: 0 for node in nodes}
+    outgoing = {node: [] for node in nodes}
+    for source, target in edges:
+        outgoing[source].append(target)
+        incoming[target] += 1
+
+    layer = {node: 0 for node in nodes}
+    queue = [node for node in nodes if incoming[node] == 0]
+    for node in queue:
+        for target in outgoing[node]:
+            layer[target] = max(layer[target], layer[node] + 1)
+            incoming[target] -= 1
+            if incoming[target] == 0:
+                queue.append(target)
+    return layer
+
+
+# Split edges spanning several layers into chains of dummy nodes
+def insert_dummy_nodes(layer, edges):
+    chained_edges = []
+    dummies = []
+    for source, target in edges:
+        span = layer[target] - layer[source]
+        if span <= 1:
+            chained_edges.append((source, target))
+            continue
+        previous = source
+        for i in range(1, span):
+            dummy = ('dummy', source, target, i)
+            layer[dummy] = layer[source] + i
+            dummies.append(dummy)
+            chained_edges.append((previous, dummy))
+            previous = dummy
+        chained_edges.append((previous, target))
+    return chained_edges, dummies
+
+
+# Count crossings between two neighbouring layers, O(E log V)
+def count_crossings(upper_order, lower_order, down_edges):
+    upper_index = {node: i for i, node in enumerate(upper_order)}
+    lower_index = {node: i for i, node in enumerate(lower_order)}
+    pairs = []
+    for node in upper_order:
+        for target in down_edges.get(node, ()):
+            if target in lower_index:
+                pairs.append((upper_index[node], lower_index[target]))
+    pairs.sort()
+
+    # Every pair of edges whose lower ends are in reversed order is a crossing, count with Fenwick tree
+    tree = [0] * (len(lower_order) + 1)
+    crossings = 0
+    for seen, (upper, lower) in enumerate(pairs):
+        i = lower + 1
+        not_greater = 0
+        while i > 0:
+            not_greater += tree[i]
+            i -= i & -i
+        crossings += seen - not_greater
+        i = lower + 1
+        while i <= len(lower_order):
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+# Reorder nodes inside layers with the barycenter heuristic, keeping the best order seen.
+# Optional `group` maps a node to a key nodes are kept sorted by first (e.g. swimlane).
+def minimize_crossings(layers, edges, sweeps=8, group=None):
+    down_edges = {}
+    up_edges = {}
+    for source, target in edges:
+        down_edges.setdefault(source, []).append(target)
+        up_edges.setdefault(target, []).append(source)
+
+    def total_crossings(orders):
+        return sum(count_crossings(orders[i], orders[i + 1], down_edges) for i in range(len(orders) - 1))
+
+    best = [list(order) for order in layers]
+    best_crossings = total_crossings(best)
+
+    current = [list(order) for order in layers]
+    for sweep in range(sweeps):
+        if best_crossings == 0:
+            break
+        if sweep % 2 == 0:
+            layer_indexes = range(1, len(current))
+            neighbours, step = up_edges, -1
+        else:
+            layer_indexes = range(len(current) - 2, -1, -1)
+            neighbours, step = down_edges, 1
+
+        for i in layer_indexes:
+            fixed_index = {node: j for j, node in enumerate(current[i + step])}
+            barycenters = {}
+            for j, node in enumerate(current[i]):
+                linked = [fixed_index[other] for other in neighbours.get(node, ()) if other in fixed_index]
+                barycenters[node] = sum(linked) / len(linked) if linked else j
+            if group is None:
+                current[i].sort(key=lambda node: barycenters[node])
+            else:
+                current[i].sort(key=lambda node: (group(node), barycenters[node]))
+
+        crossings = total_crossings(current)
+        if crossings < best_crossings:
+            best_crossings = crossings
+            best = [list(order) for order in current]
+
+    return best
+
+
+# Sugiyama style layered layout, edges point downwards
+def layered_layout(nodes, edges, sizes, layer_gap=80, node_gap=40, order_hint=None):
+    if not nodes:
+        return {}
+
+    acyclic = remove_cycles(nodes, edges)
+    layer = assign_layers(nodes, acyclic)
+    chained_edges, dummies = insert_dummy_nodes(layer, acyclic)
+
+    layer_count = max(layer.values()) + 1
+    layers = [[] for _ in range(layer_count)]
+    for node in list(nodes) + dummies:
+        layers[layer[node]].append(node)
+
+    # Start from previous horizontal order if caller knows one, it keeps diagrams stable
+    if order_hint:
+        for order in layers:
+            order.sort(key=lambda node: order_hint.get(node, math.inf))
+
+    layers = minimize_crossings(layers, chained_edges)
+
+    def size_of(node):
+        return sizes[node] if node in sizes else (0, 0)
+
+    # Vertical position comes from the tallest box of every layer
+    layer_y = []
+    y = 0
+    for order in layers:
+        layer_y.append(y)
+        y += max(size_of(node)[1] for node in order) + layer_gap
+
+    # Horizontal position, centers pulled towards the parents and overlaps pushed right
+    up_edges = {}
+    for source, target in chained_edges:
+        up_edges.setdefault(target, []).append(source)
+
+    center_x = {}
+    for i, order in enumerate(layers):
+        cursor = 0
+        for node in order:
+            width = size_of(node)[0]
+            desired = cursor + width / 2
+            parents = [center_x[parent] for parent in up_edges.get(node, ()) if parent in center_x]
+            if parents:
+                desired = max(desired, sum(parents) / len(parents))
+            center_x[node] = desired
+            cursor = desired + width / 2 + node_gap
+
+    positions = {}
+    for i, order in enumerate(layers):
+        for node in order:
+            if node in sizes:
+                width, height = sizes[node]
+                positions[node] = (center_x[node] - width / 2, layer_y[i])
+    return positions
+
+
+# Barnes-Hut quadtree cell: [mass, mass_x, mass_y, cell_size, children, leaf_index]
+def build_quadtree(indexes, xs, ys, x0, y0, cell_size, depth=0):
+    mass = len(indexes)
+    mass_x = sum(xs[i] for i in indexes) / mass
+    mass_y = sum(ys[i] for i in indexes) / mass
+    if mass == 1 or depth > 24:
+        return [mass, mass_x, mass_y, cell_size, None, indexes[0]]
+
+    half = cell_size / 2
+    quadrants = ([], [], [], [])
+    for i in indexes:
+        quadrants[(xs[i] >= x0 + half) + 2 * (ys[i] >= y0 + half)].append(i)
+
+    children = []
+    for quadrant, members in enumerate(quadrants):
+        if members:
+            children.append(build_quadtree(members, xs, ys, x0 + half * (quadrant & 1), y0 + half * (quadrant >> 1),
+                                           half, depth + 1))
+    return [mass, mass_x, mass_y, cell_size, children, None]
+
+
+# Approximate repulsion acting on one point, far cells are treated as a single mass
+def repulsion(tree, index, x, y, strength, theta=0.8):
+    force_x = force_y = 0.0
+    stack = [tree]
+    while stack:
+        mass, mass_x, mass_y, cell_size, children, leaf = stack.pop()
+        if leaf == index:
+            continue
+        dx = x - mass_x
+        dy = y - mass_y
+        distance_sq = dx * dx + dy * dy
+        if children is None or cell_size * cell_size < theta * theta * distance_sq:
+            if distance_sq < 0.01:
+                dx, dy, distance_sq = random.uniform(-1, 1), random.uniform(-1, 1), 1.0
+            factor = strength * mass / distance_sq
+            force_x += dx * factor
+            force_y += dy * factor
+        else:
+            stack.extend(children)
+    return force_x, force_y
+
+
+# Push apart boxes that still overlap, neighbours are found with a uniform grid
+def remove_overlaps(xs, ys, widths, heights, gap, movable=None, passes=4):
+    cell = max(max(widths), max(heights)) + gap
+    checked = range(len(xs)) if movable is None else movable
+    for _ in range(passes):
+        grid = {}
+        for i in range(len(xs)):
+            grid.setdefault((int(xs[i] // cell), int(ys[i] // cell)), []).append(i)
+
+        moved = False
+        for i in checked:
+            cell_x, cell_y = int(xs[i] // cell), int(ys[i] // cell)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in grid.get((cell_x + dx, cell_y + dy), ()):
+                        j_movable = movable is None or j in movable
+                        if j == i or (j_movable and j < i):
+                            continue
+                        overlap_x = (widths[i] + widths[j]) / 2 + gap - abs(xs[i] - xs[j])
+                        overlap_y = (heights[i] + heights[j]) / 2 + gap - abs(ys[i] - ys[j])
+                        if overlap_x <= 0 or overlap_y <= 0:
+                            continue
+                        moved = True
+                        # Pinned boxes stay where they are, the movable one takes the whole shift
+                        share = 0.5 if j_movable else 1.0
+                        if overlap_x < overlap_y:
+                            shift = overlap_x if xs[i] < xs[j] else -overlap_x
+                            xs[i] -= shift * share
+                            if j_movable:
+                                xs[j] += shift * share
+                        else:
+                            shift = overlap_y if ys[i] < ys[j] else -overlap_y
+                            ys[i] -= shift * share
+                            if j_movable:
+                                ys[j] += shift * share
+        if not moved:
+            break
+
+
+# Force directed layout (Fruchterman-Reingold) with Barnes-Hut repulsion, O(n log n) per iteration.
+# `initial` warm starts the solver from known positions, when `movable` is given only those nodes
+# move and the rest stays pinned, so the cost follows the size of the change instead of the graph.
+def force_layout(nodes, edges, sizes, iterations=None, gap=40, seed=1, initial=None, movable=None):
+    if not nodes:
+        return {}
+
+    rng = random.Random(seed)
+    index = {node: i for i, node in enumerate(nodes)}
+    count = len(nodes)
+    widths = [sizes[node][0] for node in nodes]
+    heights = [sizes[node][1] for node in nodes]
+    links = [(index[source], index[target]) for source, target in edges
+             if source in index and target in index and source != target]
+
+    # Ideal distance between connected boxes
+    k = sum(math.hypot(w, h) for w, h in zip(widths, heights)) / count + gap
+    columns = math.ceil(math.sqrt(count))
+
+    if initial:
+        xs = [initial[node][0] + widths[i] / 2 for i, node in enumerate(nodes)]
+        ys = [initial[node][1] + heights[i] / 2 for i, node in enumerate(nodes)]
+        temperature = 2 * k
+    else:
+        # Start on a grid, so big graphs do not have to untangle from a random cloud
+        xs = [(i % columns) * k + rng.uniform(-k / 4, k / 4) for i in range(count)]
+        ys = [(i // columns) * k + rng.uniform(-k / 4, k / 4) for i in range(count)]
+        temperature = k * columns / 4
+
+    if movable is None:
+        moving = list(range(count))
+        fixed = []
+    else:
+        moving = [index[node] for node in movable if node in index]
+        moving_set = set(moving)
+        fixed = [i for i in range(count) if i not in moving_set]
+        links = [(i, j) for i, j in links if i in moving_set or j in moving_set]
+    if not moving:
+        return {node: (xs[i] - widths[i] / 2, ys[i] - heights[i] / 2) for node, i in index.items()}
+
+    if iterations is None:
+        iterations = max(30, min(150, int(4000 / math.sqrt(len(moving)))))
+    cooling = (k / 20 / temperature) ** (1 / iterations) if temperature > k / 20 else 1
+    strength = k * k
+
+    # Pinned nodes never move, their tree is built only once
+    fixed_tree = None
+    if fixed:
+        min_x, min_y = min(xs[i] for i in fixed), min(ys[i] for i in fixed)
+        span = max(max(xs[i] for i in fixed) - min_x, max(ys[i] for i in fixed) - min_y) + 1
+        fixed_tree = build_quadtree(fixed, xs, ys, min_x, min_y, span)
+
+    for _ in range(iterations):
+        min_x, min_y = min(xs[i] for i in moving), min(ys[i] for i in moving)
+        span = max(max(xs[i] for i in moving) - min_x, max(ys[i] for i in moving) - min_y) + 1
+        tree = build_quadtree(moving, xs, ys, min_x, min_y, span)
+
+        moves_x = {}
+        moves_y = {}
+        for i in moving:
+            moves_x[i], moves_y[i] = repulsion(tree, i, xs[i], ys[i], strength)
+            if fixed_tree is not None:
+                fixed_x, fixed_y = repulsion(fixed_tree, i, xs[i], ys[i], strength)
+                moves_x[i] += fixed_x
+                moves_y[i] += fixed_y
+
+        for i, j in links:
+            dx = xs[i] - xs[j]
+            dy = ys[i] - ys[j]
+            distance = math.hypot(dx, dy) or 0.01
+            factor = distance / k
+            if i in moves_x:
+                moves_x[i] -= dx * factor
+                moves_y[i] -= dy * factor
+            if j in moves_x:
+                moves_x[j] += dx * factor
+                moves_y[j] += dy * factor
+
+        for i in moving:
+            length = math.hypot(moves_x[i], moves_y[i])
+            if length > 0:
+                step = min(length, temperature) / length
+                xs[i] += moves_x[i] * step
+                ys[i] += moves_y[i] * step
+        temperature *= cooling
+
+    remove_overlaps(xs, ys, widths, heights, gap / 2, None if movable is None else set(moving))
+
+    return {node: (xs[i] - widths[i] / 2, ys[i] - heights[i] / 2) for node, i in index.items()}
+
+
+# Move layout so it starts at (margin, margin) and return canvas size needed to show it
+def normalize_positions(positions, sizes, margin=40):
+    if not positions:
+        return positions, (2 * margin, 2 * margin)
+    min_x = min(x for x, y in positions.values())
+    min_y = min(y for x, y in positions.values())
+    max_x = max(x + sizes[node][0] for node, (x, y) in positions.items())
+    max_y = max(y + sizes[node][1] for node, (x, y) in positions.items())
+    shifted = {node: (x - min_x + margin, y - min_y + margin) for node, (x, y) in positions.items()}
+    return shifted, (max_x - min_x + 2 * margin, max_y - min_y + 2 * margin)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+import layout
+
+
+# Layout results are stored per diagram in a JSON file, together with the graph they were made for.
+# Same graph -> positions are reused as they are. Slightly changed graph -> solver starts from the
+# old positions and moves only the changed nodes and their neighbourhood.
+
+
+# Hash of everything that influences the layout: nodes, their sizes, edges and layout mode
+def graph_hash(nodes, edges, sizes, mode):
+    digest = hashlib.sha1(mode.encode('utf-8'))
+    for node in sorted(nodes):
+        width, height = sizes[node]
+        digest.update(f'n|{node}|{width}|{height}\n'.encode('utf-8'))
+    for source, target in sorted(edges):
+        digest.update(f'e|{source}|{target}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_file(cache_dir, key):
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{name}.json')
+
+
+def load_entry(cache_dir, key):
+    try:
+        with open(cache_file(cache_dir, key), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_entry(cache_dir, key, entry):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_file(cache_dir, key)
+    # Write to temporary file first, so a crash never leaves half written cache behind
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(entry, file)
+    os.replace(path + '.tmp', path)
+
+
+# Nodes whose box or edges changed since previous layout, plus their neighbours up to `hops` away
+def affected_nodes(nodes, edges, sizes, previous, hops=1):
+    old_sizes = previous['sizes']
+    old_edges = {tuple(edge) for edge in previous['edges']}
+    new_edges = set(edges)
+
+    changed = {node for node in nodes if node not in old_sizes or tuple(old_sizes[node]) != tuple(sizes[node])}
+    for source, target in old_edges.symmetric_difference(new_edges):
+        changed.add(source)
+        changed.add(target)
+    changed.intersection_update(nodes)
+
+    neighbours = {}
+    for source, target in edges:
+        neighbours.setdefault(source, []).append(target)
+        neighbours.setdefault(target, []).append(source)
+
+    affected = set(changed)
+    frontier = changed
+    for _ in range(hops):
+        next_frontier = set()
+        for node in frontier:
+            for neighbour in neighbours.get(node, ()):
+                if neighbour not in affected:
+                    next_frontier.add(neighbour)
+        affected.update(next_frontier)
+        frontier = next_frontier
+    return affected
+
+
+# Starting point for nodes missing in previous layout: middle of already placed neighbours
+def seed_positions(nodes, edges, sizes, old_positions):
+    positions = {node: tuple(old_positions[node]) for node in nodes if node in old_positions}
+    if positions:
+        fallback_x = max(x for x, y in positions.values()) + 200
+        fallback_y = min(y for x, y in positions.values())
+    else:
+        fallback_x = fallback_y = 0
+
+    neighbours = {}
+    for source, target in edges:
+        neighbours.setdefault(source, []).append(target)
+        neighbours.setdefault(target, []).append(source)
+
+    for node in nodes:
+        if node in positions:
+            continue
+        placed = [positions[other] for other in neighbours.get(node, ()) if other in positions]
+        if placed:
+            positions[node] = (sum(x for x, y in placed) / len(placed) + 40,
+                               sum(y for x, y in placed) / len(placed) + 40)
+        else:
+            positions[node] = (fallback_x, fallback_y)
+            fallback_y += sizes[node][1] + 40
+    return positions
+
+
+# Layout through the cache, `key` identifies the diagram (e.g. its output file)
+def cached_layout(key, nodes, edges, sizes, mode, cache_dir):
+    current_hash = graph_hash(nodes, edges, sizes, mode)
+    previous = load_entry(cache_dir, key)
+
+    if previous is not None and previous.get('hash') == current_hash:
+        return {node: tuple(position) for node, position in previous['positions'].items()}
+
+    warm = previous is not None and previous.get('mode') == mode
+    if mode == 'layered':
+        # Layered layout is cheap, previous horizontal order only keeps it from reshuffling
+        order_hint = None
+        if warm:
+            order_hint = {node: position[0] for node, position in previous['positions'].items()}
+        positions = layout.layered_layout(nodes, edges, sizes, order_hint=order_hint)
+    elif mode == 'force':
+        if warm:
+            initial = seed_positions(nodes, edges, sizes, previous['positions'])
+            movable = affected_nodes(nodes, edges, sizes, previous)
+            positions = layout.force_layout(nodes, edges, sizes, initial=initial, movable=movable)
+        else:
+            positions = layout.force_layout(nodes, edges, sizes)
+    else:
+        raise ValueError(f'Unknown layout mode: {mode}')
+
+    save_entry(cache_dir, key, {
+        'hash': current_hash,
+        'mode': mode,
+        'sizes': {node: list(sizes[node]) for node in nodes},
+        'edges': [list(edge) for edge in edges],
+        'positions': {node: list(position) for node, position in positions.items()},
+    })
+    return positions
@@ -0,0 +1,225 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import xml_backend
+
+
+# Persistent index of element names across many exports.
+# For every export it keeps model elements (actions, use cases, actors, states, classes with their
+# attributes and operations) and diagrams they are drawn on. Words of names and Ids are stored as
+# an inverted index in SQLite, so "which diagrams mention Klient" is answered without opening
+# any XML. Index is updated per file: unchanged exports (same mtime and size) are skipped,
+# changed ones have their entries replaced in one transaction.
+#
+#   python name_index.py update sumxmls/*.xml
+#   python name_index.py query klient            words are matched as prefixes, all of them must match
+#   python name_index.py query --type UseCase rezerwacja
+
+DEFAULT_DB = 'name_index.sqlite'
+
+# Model elements indexed by their Name
+INDEXED_TAGS = ('ActivityAction', 'UseCase', 'Actor', 'State2', 'Class')
+
+# Class members, indexed with name of their class as owner
+MEMBER_TAGS = ('Attribute', 'Operation')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY, path TEXT, element_id TEXT, type TEXT, name TEXT, owner TEXT,
+    diagram_id TEXT, diagram_name TEXT, diagram_type TEXT);
+CREATE TABLE IF NOT EXISTS terms (term TEXT, entry INTEGER);
+CREATE INDEX IF NOT EXISTS entries_path ON entries (path);
+CREATE INDEX IF NOT EXISTS terms_term ON terms (term, entry);
+CREATE INDEX IF NOT EXISTS terms_entry ON terms (entry);
+'''
+
+# Fields of one entry, in column order of `entries`
+FIELDS = ('element_id', 'type', 'name', 'owner', 'diagram_id', 'diagram_name', 'diagram_type')
+
+
+def words(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def connect(db_file=DEFAULT_DB):
+    connection = sqlite3.connect(db_file, timeout=30)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+# Members of zip bundles ('bundle.zip!member.xml') are stamped by their archive
+def file_stamp(path):
+    stat = os.stat(xml_backend.split_member(path)[0])
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Diagrams every model element is drawn on: model Id -> [(diagram Id, Name, tag)]
+def placements(root):
+    shown = {}
+    diagrams = root.find('Diagrams')
+    if diagrams is None:
+        return shown
+    for diagram in diagrams:
+        if not isinstance(diagram.tag, str):
+            continue
+        place = (diagram.get('Id'), diagram.get('Name'), diagram.tag)
+        for elem in diagram.iter():
+            model_id = elem.get('Model')
+            if model_id is not None and place not in shown.setdefault(model_id, []):
+                shown[model_id].append(place)
+    return shown
+
+
+# Index entries (dicts with FIELDS) of one parsed export
+def extract_entries(root):
+    entries = []
+    shown = placements(root)
+    models = root.find('Models')
+
+    # Members are drawn inside their class, placed_id is the Id of the class then
+    def add(element_id, element_type, name, owner=None, placed_id=None):
+        # Element drawn on several diagrams gets one entry per diagram, not drawn one gets single entry
+        places = shown.get(placed_id or element_id) or [(None, None, None)]
+        for diagram_id, diagram_name, diagram_type in places:
+            entries.append({'element_id': element_id, 'type': element_type, 'name': name, 'owner': owner,
+                            'diagram_id': diagram_id, 'diagram_name': diagram_name,
+                            'diagram_type': diagram_type})
+
+    if models is not None:
+        for elem in models.iter(*INDEXED_TAGS, *MEMBER_TAGS):
+            if elem.get('Id') is None:
+                continue
+            if elem.tag not in MEMBER_TAGS:
+                add(elem.get('Id'), elem.tag, elem.get('Name'))
+                continue
+            # Member belongs to the nearest class around it, members outside classes are not indexed
+            owner = next(elem.iterancestors('Class'), None)
+            if owner is not None:
+                add(elem.get('Id'), elem.tag, elem.get('Name'), owner.get('Name'), owner.get('Id'))
+
+    diagrams = root.find('Diagrams')
+    if diagrams is not None:
+        for diagram in diagrams:
+            if isinstance(diagram.tag, str):
+                entries.append({'element_id': diagram.get('Id'), 'type': diagram.tag, 'name': diagram.get('Name'),
+                                'owner': None, 'diagram_id': diagram.get('Id'),
+                                'diagram_name': diagram.get('Name'), 'diagram_type': diagram.tag})
+    return entries
+
+
+# Replace entries of one export. root can be passed by a renderer that has already parsed the file,
+# otherwise the file is parsed only when it changed since the last update.
+# Returns number of entries written, None when the file was up to date.
+def update_file(connection, xml_file, root=None):
+    path = os.path.abspath(xml_file)
+    stamp = file_stamp(path)
+    row = connection.execute('SELECT mtime_ns, size FROM files WHERE path = ?', (path,)).fetchone()
+    if row is not None and tuple(row) == stamp:
+        return None
+    if root is None:
+        root = xml_backend.parse_file(path)
+    entries = extract_entries(root)
+
+    with connection:
+        remove_file(connection, path)
+        for entry in entries:
+            cursor = connection.execute(
+                f'INSERT INTO entries (path, {", ".join(FIELDS)}) VALUES (?{", ?" * len(FIELDS)})',
+                (path,) + tuple(entry[field] for field in FIELDS))
+            terms = set(words(entry['name'])) | set(words(entry['owner']))
+            if entry['element_id']:
+                terms.add(entry['element_id'].lower())
+            connection.executemany('INSERT INTO terms VALUES (?, ?)', [(term, cursor.lastrowid) for term in terms])
+        connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (path,) + stamp)
+    return len(entries)
+
+
+# update_file on index in db_file, for renderers that have the export parsed anyway
+def update_db(db_file, xml_file, root=None):
+    connection = connect(db_file)
+    try:
+        return update_file(connection, xml_file, root)
+    finally:
+        connection.close()
+
+
+def remove_file(connection, path):
+    connection.execute('DELETE FROM terms WHERE entry IN (SELECT id FROM entries WHERE path = ?)', (path,))
+    connection.execute('DELETE FROM entries WHERE path = ?', (path,))
+    connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+
+# Drop exports that were indexed but do not exist any more, returns their paths
+def prune(connection):
+    gone = [path for (path,) in connection.execute('SELECT path FROM files')
+            if not os.path.exists(xml_backend.split_member(path)[0])]
+    with connection:
+        for path in gone:
+            remove_file(connection, path)
+    return gone
+
+
+# Entries whose name, owner class or Id has a word starting with every word of text
+def query(connection, text, element_type=None, limit=100):
+    conditions = []
+    params = []
+    for word in set(words(text)):
+        conditions.append('id IN (SELECT entry FROM terms WHERE term >= ? AND term < ?)')
+        params += [word, word + '\U0010ffff']
+    if not conditions:
+        return []
+    if element_type is not None:
+        conditions.append('type = ?')
+        params.append(element_type)
+    rows = connection.execute(f'SELECT path, {", ".join(FIELDS)} FROM entries WHERE {" AND ".join(conditions)} '
+                              f'ORDER BY path, diagram_name, type, name LIMIT ?', params + [limit])
+    return [dict(zip(('path',) + FIELDS, row)) for row in rows]
+
+
+def print_entry(entry):
+    name = f"{entry['owner']}.{entry['name']}" if entry['owner'] else entry['name']
+    where = f"{entry['diagram_type']} '{entry['diagram_name']}'" if entry['diagram_id'] else 'not on any diagram'
+    print(f"{entry['type']} '{name}' [{entry['element_id']}] in {where} ({entry['path']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index of element names across Visual Paradigm exports')
+    parser.add_argument('--db', default=DEFAULT_DB, help='index file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help='index new and changed exports')
+    update_parser.add_argument('xml_files', nargs='+')
+    query_parser = commands.add_parser('query', help='find elements by words of their names or Id')
+    query_parser.add_argument('text', nargs='+')
+    query_parser.add_argument('--type', help='only elements of this type, e.g. UseCase or Operation')
+    query_parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    connection = connect(args.db)
+    if args.command == 'update':
+        failed = False
+        for xml_file in xml_backend.expand_sources(args.xml_files):
+            try:
+                count = update_file(connection, xml_file)
+            except Exception as e:
+                print(f'{xml_file}: ERROR {e}')
+                failed = True
+                continue
+            print(f'{xml_file}: ' + ('up to date' if count is None else f'{count} entries'))
+        for path in prune(connection):
+            print(f'{path}: removed from index')
+        sys.exit(1 if failed else 0)
+
+    started = time.perf_counter()
+    entries = query(connection, ' '.join(args.text), args.type, args.limit)
+    for entry in entries:
+        print_entry(entry)
+    print(f'{len(entries)} entries in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+
+if __name__ == "__main__":
+    main()
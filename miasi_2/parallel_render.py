@@ -0,0 +1,238 @@
+import logging
+import math
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import svgwrite
+
+import activity_diagram
+import activity_layout
+import render_budget
+import svg_stream
+import xml_backend
+
+log = logging.getLogger(__name__)
+
+
+# Multi-process rendering of one huge activity diagram.
+# Export is parsed once in the main process and activity_diagram.activity_items lays out, wraps
+# labels and routes flows there. Geometry of every item is packed into flat arrays in one shared
+# memory block (numbers as doubles/ints, Ids, labels and colors as one UTF-8 blob). Worker processes
+# attach to the block by name, so the model is never pickled, and each of them draws one index range
+# of items with activity_diagram.ITEM_DRAWERS and serializes it to an SVG fragment. Fragments come
+# back in paint order and are concatenated between SVG header and closing tag.
+# With a budget the time limit is checked while items are made (labels, wrapping and routes degrade
+# there), elements and labels counted by the workers are merged into it afterwards.
+
+# Kind of item in shared arrays is index of its tag here
+ITEM_TAGS = tuple(activity_diagram.ITEM_DRAWERS)
+
+# name of array -> typecode
+#   shapes 4 numbers (x, y, width, height) and 6 ints (kind, Id, first line, line count, fill, stroke)
+#   connectors 5 ints (kind, Id, first point, point count, caption text) and 2 numbers (caption position)
+ARRAYS = (('shapes', 'd'), ('shape_info', 'i'), ('lines', 'i'), ('points', 'd'), ('connectors', 'i'),
+          ('captions', 'd'), ('string_offsets', 'q'), ('strings', 'B'))
+
+
+# Flat geometry of a diagram, filled by extract_geometry
+def new_geometry():
+    geometry = {name: array(typecode) for name, typecode in ARRAYS}
+    geometry['string_ids'] = {}
+    geometry['string_offsets'].append(0)
+    return geometry
+
+
+# Index of string in the blob, None is -1
+def add_string(geometry, value):
+    if value is None:
+        return -1
+    string_ids = geometry['string_ids']
+    if value not in string_ids:
+        string_ids[value] = len(string_ids)
+        geometry['strings'].frombytes(value.encode('utf-8'))
+        geometry['string_offsets'].append(len(geometry['strings']))
+    return string_ids[value]
+
+
+def add_shape(geometry, tag, id, x, y, width, height, lines, fill, stroke):
+    geometry['shapes'].extend((x, y, width, height))
+    geometry['shape_info'].extend((ITEM_TAGS.index(tag), add_string(geometry, id), len(geometry['lines']),
+                                   len(lines), add_string(geometry, fill), add_string(geometry, stroke)))
+    geometry['lines'].extend(add_string(geometry, line) for line in lines)
+
+
+# Connector that is not drawn gets point count -1, only its caption is drawn
+def add_connector(geometry, tag, id, points, name, caption_position):
+    first = len(geometry['points']) // 2
+    for x, y in points or ():
+        geometry['points'].extend((x, y))
+    geometry['connectors'].extend((ITEM_TAGS.index(tag), add_string(geometry, id), first,
+                                   -1 if points is None else len(points), add_string(geometry, name)))
+    geometry['captions'].extend(caption_position or (math.nan, math.nan))
+
+
+# Items of activity_diagram.activity_items packed into arrays, shapes come before connectors
+def extract_geometry(diagrams, simplify_epsilon=0.5, budget=None):
+    geometry = new_geometry()
+    for item in activity_diagram.activity_items(diagrams, simplify_epsilon, budget):
+        if item[0] in activity_diagram.FLOW_TAGS:
+            add_connector(geometry, *item)
+        else:
+            add_shape(geometry, *item)
+    del geometry['string_ids']
+    return geometry
+
+
+# Copy geometry arrays into one shared memory block, returns block and layout workers need to attach
+def share_geometry(geometry):
+    layout = []
+    offset = 0
+    for name, typecode in ARRAYS:
+        nbytes = len(geometry[name]) * geometry[name].itemsize
+        layout.append((name, typecode, offset, nbytes))
+        # Keep every array 8-byte aligned
+        offset += (nbytes + 7) // 8 * 8
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, typecode, start, nbytes in layout:
+        block.buf[start:start + nbytes] = geometry[name].tobytes()
+    return block, layout
+
+
+# Typed views into shared block, they have to be released before block is closed
+def open_views(buffer, layout):
+    views = {}
+    for name, typecode, start, nbytes in layout:
+        views[name] = buffer[start:start + nbytes].cast(typecode)
+    return views
+
+
+def release_views(views):
+    for view in views.values():
+        view.release()
+
+
+def get_string(views, index):
+    if index < 0:
+        return None
+    offsets = views['string_offsets']
+    return bytes(views['strings'][offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+
+# Item number `item` back as a tuple of activity_diagram.activity_items
+def read_item(views, item, shape_count):
+    if item < shape_count:
+        x, y, width, height = views['shapes'][4 * item:4 * item + 4]
+        kind, id, first, count, fill, stroke = views['shape_info'][6 * item:6 * item + 6]
+        lines = [get_string(views, line) for line in views['lines'][first:first + count]]
+        return ITEM_TAGS[kind], get_string(views, id), x, y, width, height, lines, get_string(views, fill), \
+            get_string(views, stroke)
+    index = item - shape_count
+    kind, id, first, count, name = views['connectors'][5 * index:5 * index + 5]
+    points = None
+    if count >= 0:
+        coordinates = views['points'][2 * first:2 * (first + count)]
+        points = list(zip(coordinates[0::2], coordinates[1::2]))
+    caption_position = None
+    if name >= 0:
+        caption_position = tuple(views['captions'][2 * index:2 * index + 2])
+    return ITEM_TAGS[kind], get_string(views, id), points, get_string(views, name), caption_position
+
+
+# Draw items start..end and serialize them to one SVG fragment, returns fragment and budget report
+def render_slice(views, start, end):
+    dwg = svgwrite.Drawing(profile='full')
+    budget = render_budget.Budget()
+    shape_count = len(views['shape_info']) // 6
+    parts = []
+    for item in range(start, end):
+        tag, id, *geometry = read_item(views, item, shape_count)
+        elements = activity_diagram.ITEM_DRAWERS[tag](dwg, *geometry)
+        parts.extend(element.tostring() for element in render_budget.watch(elements, budget))
+    return ''.join(parts), budget.report()
+
+
+worker_block = None
+worker_layout = None
+
+
+def init_worker(block_name, layout):
+    global worker_block, worker_layout
+    worker_block = shared_memory.SharedMemory(name=block_name)
+    worker_layout = layout
+
+
+def render_worker_slice(start, end):
+    views = open_views(worker_block.buf, worker_layout)
+    try:
+        return render_slice(views, start, end)
+    finally:
+        release_views(views)
+
+
+# Index ranges of roughly the same size, a few per worker so slow slices even out
+def split_ranges(count, workers, slices_per_worker=4):
+    size = max(1, math.ceil(count / (workers * slices_per_worker)))
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+# Render already parsed diagram with `workers` processes (None - one per CPU)
+# budget (render_budget.Budget) gets the counts of all slices
+def render_activity_parallel(diagrams, svg_file, workers=None, auto_layout=None, simplify_epsilon=0.5,
+                             budget=None):
+    if auto_layout or (auto_layout is None and activity_layout.needs_layout(diagrams)):
+        activity_layout.layout_activity_diagram(diagrams)
+
+    geometry = extract_geometry(diagrams, simplify_epsilon, budget)
+    count = len(geometry['shape_info']) // 6 + len(geometry['connectors']) // 5
+    workers = workers or os.cpu_count() or 1
+
+    block, layout = share_geometry(geometry)
+    del geometry
+    try:
+        if workers == 1:
+            views = open_views(block.buf, layout)
+            try:
+                results = [render_slice(views, 0, count)]
+            finally:
+                release_views(views)
+        else:
+            ranges = split_ranges(count, workers)
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(block.name, layout)) as executor:
+                results = list(executor.map(render_worker_slice, *zip(*ranges))) if ranges else []
+    finally:
+        block.close()
+        block.unlink()
+
+    if budget is not None:
+        for fragment, report in results:
+            render_budget.merge(budget, report)
+
+    with open(svg_file, 'w', encoding='utf-8') as f:
+        f.write(svg_stream.XML_DECLARATION)
+        f.write(svg_stream.svg_header(svgwrite.Drawing(svg_file, profile='full')))
+        for fragment, report in results:
+            f.write(fragment)
+        f.write('</svg>')
+    log.info(f"SVG file {svg_file} created from {count} elements")
+
+
+def parse_xml_to_svg(xml_file, svg_file, workers=None, auto_layout=None, simplify_epsilon=0.5, budget=None):
+    root = xml_backend.parse_file(xml_file)
+    render_activity_parallel(root.find('Diagrams'), svg_file, workers, auto_layout, simplify_epsilon, budget)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    xml_file = sys.argv[1] if len(sys.argv) > 1 else 'sumxmls/simple_activity2_hard.xml'
+    svg_file = sys.argv[2] if len(sys.argv) > 2 else 'activity_diagram.svg'
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    parse_xml_to_svg(xml_file, svg_file, workers)
+
+
+if __name__ == "__main__":
+    main()
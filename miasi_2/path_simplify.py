@@ -0,0 +1,84 @@
+import math
+
+
+# Simplification of connector bend points before they are written to SVG.
+# Points are (x, y) tuples of numbers, first and last point are always kept.
+
+
+def is_orthogonal(points):
+    for (ax, ay), (bx, by) in zip(points, points[1:]):
+        if ax != bx and ay != by:
+            return False
+    return True
+
+
+# Drop points closer than epsilon to the last kept one (zero length segments included)
+def remove_duplicates(points, epsilon):
+    kept = [points[0]]
+    for point in points[1:-1]:
+        if math.hypot(point[0] - kept[-1][0], point[1] - kept[-1][1]) > epsilon:
+            kept.append(point)
+    last = points[-1]
+    if len(kept) > 1 and math.hypot(last[0] - kept[-1][0], last[1] - kept[-1][1]) <= epsilon:
+        kept.pop()
+    kept.append(last)
+    return kept
+
+
+# Fast path for routes made only of horizontal and vertical segments
+def merge_collinear(points):
+    merged = []
+    for point in points:
+        if merged and merged[-1] == point:
+            continue
+        if len(merged) >= 2:
+            (ax, ay), (bx, by) = merged[-2], merged[-1]
+            if (ax == bx == point[0]) or (ay == by == point[1]):
+                merged[-1] = point
+                continue
+        merged.append(point)
+    return merged
+
+
+def distance_to_segment(point, start, end):
+    px, py = point
+    sx, sy = start
+    ex, ey = end
+    dx = ex - sx
+    dy = ey - sy
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - sx, py - sy)
+    t = max(0.0, min(1.0, ((px - sx) * dx + (py - sy) * dy) / length_sq))
+    return math.hypot(px - (sx + t * dx), py - (sy + t * dy))
+
+
+# Douglas-Peucker without recursion, keeps points farther than epsilon from simplified line
+def douglas_peucker(points, epsilon):
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest = None
+        farthest_distance = epsilon
+        for i in range(first + 1, last):
+            distance = distance_to_segment(points[i], points[first], points[last])
+            if distance > farthest_distance:
+                farthest = i
+                farthest_distance = distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_points(points, epsilon=0.5):
+    points = [(float(x), float(y)) for x, y in points]
+    if len(points) < 3:
+        return points
+    points = remove_duplicates(points, epsilon)
+    if is_orthogonal(points):
+        return merge_collinear(points)
+    return douglas_peucker(points, epsilon)
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import html
+import json
+import os
+from urllib.parse import urlsplit
+
+import project_render
+import svg_stream
+import xml_backend
+
+
+# Live preview of one diagram of an export.
+# Export file is watched, on every change it is parsed again and the diagram is drawn into fragments
+# keyed by Id of the model element they belong to (svg_stream.Owner). Only fragments that were added,
+# removed or changed are pushed to connected browsers over Server-Sent Events and the page patches
+# its inline SVG in place, instead of loading the whole document again.
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%TITLE%</title>
+<style>body { margin: 0; font-family: Arial, sans-serif; } #status { padding: 4px 8px; background: #eee; }</style>
+</head>
+<body>
+<div id="status">watching %TITLE%</div>
+%SVG%
+<script>
+const svgRoot = document.querySelector('svg');
+const status = document.getElementById('status');
+function group(key) {
+    return svgRoot.querySelector('g[data-key="' + CSS.escape(key) + '"]');
+}
+const events = new EventSource('/events');
+events.addEventListener('patch', event => {
+    for (const op of JSON.parse(event.data)) {
+        if (op.op === 'reset') {
+            location.reload();
+            return;
+        }
+        const current = group(op.key);
+        if (op.op === 'remove' && current) {
+            current.remove();
+        } else if (op.op === 'change' && current) {
+            current.innerHTML = op.svg;
+        } else if (op.op === 'add') {
+            const g = document.createElementNS('http://www.w3.org/2000/svg', 'g');
+            g.setAttribute('data-key', op.key);
+            g.innerHTML = op.svg;
+            const previous = op.after === null ? null : group(op.after);
+            if (previous) {
+                previous.after(g);
+            } else {
+                svgRoot.insertBefore(g, svgRoot.querySelector('defs').nextSibling);
+            }
+        }
+    }
+    status.textContent = 'updated ' + new Date().toLocaleTimeString();
+});
+events.addEventListener('failure', event => {
+    status.textContent = 'cannot render: ' + JSON.parse(event.data).message;
+});
+</script>
+</body>
+</html>
+'''
+
+
+# Group drawn elements by their owner, returns (svg header, [(key, svg text)]) in paint order.
+# Elements drawn before any owner go under key '', repeated keys get '#2', '#3'... suffix.
+def collect_fragments(dwg, elements):
+    fragments = []
+    counts = {}
+    key = ''
+    parts = []
+    for element in elements:
+        if isinstance(element, svg_stream.Owner):
+            if parts:
+                fragments.append((key, ''.join(parts)))
+            parts = []
+            owner = str(element.id)
+            counts[owner] = counts.get(owner, 0) + 1
+            key = owner if counts[owner] == 1 else f'{owner}#{counts[owner]}'
+            continue
+        parts.append(element.tostring())
+    if parts:
+        fragments.append((key, ''.join(parts)))
+    # Header is read last, renderer may set canvas size while drawing
+    return svg_stream.svg_header(dwg), fragments
+
+
+def build_snapshot(xml_file, diagram_type=None, diagram_ref=None, options=None):
+    root = xml_backend.parse_file(xml_file)
+    diagram = project_render.find_diagram(root, diagram_type, diagram_ref)
+    if diagram is None:
+        raise ValueError('no matching diagram in export')
+    index = project_render.build_model_index(root)
+    dwg, elements = project_render.DRAWERS[diagram.tag](index, diagram, **(options or {}))
+    return collect_fragments(dwg, elements)
+
+
+# Patch turning old snapshot into new one. Header change or reordered fragments reset the page.
+def diff_snapshots(old, new):
+    old_header, old_fragments = old
+    new_header, new_fragments = new
+    old_map = dict(old_fragments)
+    new_map = dict(new_fragments)
+    if old_header != new_header:
+        return [{'op': 'reset'}]
+    old_order = [key for key, _ in old_fragments if key in new_map]
+    new_order = [key for key, _ in new_fragments if key in old_map]
+    if old_order != new_order:
+        return [{'op': 'reset'}]
+
+    patch = [{'op': 'remove', 'key': key} for key, _ in old_fragments if key not in new_map]
+    previous = None
+    for key, svg in new_fragments:
+        if key not in old_map:
+            patch.append({'op': 'add', 'key': key, 'after': previous, 'svg': svg})
+        elif old_map[key] != svg:
+            patch.append({'op': 'change', 'key': key, 'svg': svg})
+        previous = key
+    return patch
+
+
+def snapshot_svg(snapshot):
+    header, fragments = snapshot
+    groups = ''.join(f'<g data-key="{html.escape(key)}">{svg}</g>' for key, svg in fragments)
+    return header + groups + '</svg>'
+
+
+class PreviewServer:
+    def __init__(self, xml_file, diagram_type=None, diagram_ref=None, options=None, interval=0.5):
+        self.xml_file = xml_file
+        self.diagram_type = diagram_type
+        self.diagram_ref = diagram_ref
+        self.options = options or {}
+        self.interval = interval
+        self.snapshot = None
+        self.stamp = None
+        self.clients = set()
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.xml_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def refresh(self):
+        stamp = self.file_stamp()
+        if stamp is None or stamp == self.stamp:
+            return
+        self.stamp = stamp
+        try:
+            snapshot = await asyncio.to_thread(build_snapshot, self.xml_file, self.diagram_type, self.diagram_ref,
+                                               self.options)
+        except Exception as e:
+            # Export may be half written, previous snapshot stays until the next change
+            self.broadcast('failure', {'message': str(e)})
+            return
+        patch = diff_snapshots(self.snapshot, snapshot) if self.snapshot is not None else []
+        self.snapshot = snapshot
+        if patch:
+            print(f'{self.xml_file} changed, {len(patch)} patch operations')
+            self.broadcast('patch', patch)
+
+    def broadcast(self, event, data):
+        message = f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
+        for queue in self.clients:
+            queue.put_nowait(message)
+
+    async def watch(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()).strip():
+                pass
+            path = urlsplit(request_line[1]).path if len(request_line) > 1 else ''
+            if path == '/events':
+                await self.events(writer)
+                return
+            if self.snapshot is None:
+                self.send(writer, 404, 'text/plain; charset=utf-8', 'export could not be rendered yet')
+            elif path == '/':
+                title = html.escape(os.path.basename(self.xml_file))
+                body = PAGE.replace('%TITLE%', title).replace('%SVG%', snapshot_svg(self.snapshot))
+                self.send(writer, 200, 'text/html; charset=utf-8', body)
+            elif path == '/svg':
+                self.send(writer, 200, 'image/svg+xml', svg_stream.XML_DECLARATION + snapshot_svg(self.snapshot))
+            else:
+                self.send(writer, 404, 'text/plain; charset=utf-8', 'unknown path')
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def send(self, writer, status, content_type, body):
+        payload = body.encode('utf-8')
+        reason = 'OK' if status == 200 else 'Not Found'
+        writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n'
+                     f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + payload)
+
+    async def events(self, writer):
+        queue = asyncio.Queue()
+        self.clients.add(queue)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n')
+            await writer.drain()
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies and browser from closing idle stream
+                    message = b': ping\n\n'
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+
+async def serve(preview, host='127.0.0.1', port=8766):
+    await preview.refresh()
+    server = await asyncio.start_server(preview.handle, host, port)
+    print(f'Preview of {preview.xml_file} on http://{host}:{port}/')
+    async with server:
+        await asyncio.gather(server.serve_forever(), preview.watch())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live SVG preview of a Visual Paradigm export')
+    parser.add_argument('xml_file')
+    parser.add_argument('--type', help='diagram type: activity, state, class or usecase')
+    parser.add_argument('--diagram', help='Id or Name of diagram')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between checks of export file')
+    args = parser.parse_args()
+
+    preview = PreviewServer(args.xml_file, args.type, args.diagram, interval=args.interval)
+    try:
+        asyncio.run(serve(preview, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
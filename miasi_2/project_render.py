@@ -0,0 +1,224 @@
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import svgwrite
+
+import activity_diagram
+import class_new_diagram
+import fragment_cache
+import name_index
+import render_budget
+import render_profile
+import state_diagram
+import svg_stream
+import use_case_diagram
+import xml_backend
+
+
+# Render every diagram of a multi-diagram Visual Paradigm export.
+# Export is parsed once, model index is built once and every diagram gets its own SVG.
+# Diagrams are rendered concurrently on a thread pool, they only read the shared model.
+
+
+# Everything renderers need from project models, built once per export
+def build_model_index(root):
+    models = root.find('Models')
+    elements = {}
+    if models is not None:
+        for elem in models.iter():
+            elem_id = elem.get('Id')
+            if elem_id is not None:
+                elements[elem_id] = elem
+
+    types = None
+    model_classes = None
+    fragments = None
+    if models is not None and root.find('./Diagrams/ClassDiagram') is not None:
+        with render_profile.phase('extract'):
+            types = class_new_diagram.build_type_table(models)
+            model_classes = class_new_diagram.parse_model_classes(models, types)
+        fragments = fragment_cache.FragmentCache()
+
+    return {'root': root, 'models': models, 'elements': elements, 'types': types, 'model_classes': model_classes,
+            'fragments': fragments}
+
+
+# Adapters take renderer options (auto_layout, simplify_epsilon, budget) as keywords, unknown ones are ignored
+def render_activity(index, diagram, svg_file, auto_layout=None, simplify_epsilon=0.5, budget=None, **options):
+    activity_diagram.render_activity_diagram(diagram, svg_file, auto_layout, simplify_epsilon, budget)
+
+
+def render_state(index, diagram, svg_file, simplify_epsilon=0.5, budget=None, **options):
+    state_diagram.render_state_diagram(index['models'], diagram, svg_file, simplify_epsilon, budget)
+
+
+def render_class(index, diagram, svg_file, simplify_epsilon=0.5, budget=None, **options):
+    class_new_diagram.render_class_diagram(index['models'], diagram, svg_file, simplify_epsilon,
+                                           model_classes=index['model_classes'], budget=budget,
+                                           fragments=index['fragments'])
+
+
+def render_usecase(index, diagram, svg_file, budget=None, **options):
+    with render_profile.phase('extract'):
+        actors, use_cases, relationships, systems = use_case_diagram.extract_usecase_diagram(index['root'], diagram)
+    use_case_diagram.draw_usecase_diagram(actors, use_cases, relationships, systems, svg_file, budget)
+
+
+RENDERERS = {
+    'ActivityDiagram': render_activity,
+    'StateDiagram': render_state,
+    'ClassDiagram': render_class,
+    'UseCaseDiagram': render_usecase,
+}
+
+
+# Drawers return empty drawing and generator of its elements (see svg_stream), nothing is saved
+def draw_activity(index, diagram, auto_layout=None, simplify_epsilon=0.5, budget=None, **options):
+    dwg = svgwrite.Drawing(profile='full')
+    return dwg, render_budget.watch(
+        activity_diagram.draw_activity_diagram(dwg, diagram, auto_layout, simplify_epsilon, budget), budget)
+
+
+def draw_state(index, diagram, simplify_epsilon=0.5, budget=None, **options):
+    dwg = svgwrite.Drawing(profile='full', size=state_diagram.CANVAS_SIZE)
+    return dwg, render_budget.watch(
+        state_diagram.draw_state_diagram(dwg, index['models'], diagram, simplify_epsilon, budget), budget)
+
+
+def draw_class(index, diagram, simplify_epsilon=0.5, budget=None, **options):
+    dwg = svgwrite.Drawing(profile='full', size=class_new_diagram.CANVAS_SIZE)
+    return dwg, render_budget.watch(class_new_diagram.draw_class_diagram(
+        dwg, index['models'], diagram, simplify_epsilon, index['model_classes'], budget, index['fragments']), budget)
+
+
+def draw_usecase(index, diagram, budget=None, **options):
+    dwg = svgwrite.Drawing(profile='tiny')
+    with render_profile.phase('extract'):
+        parts = use_case_diagram.extract_usecase_diagram(index['root'], diagram)
+    return dwg, render_budget.watch(use_case_diagram.draw_usecase_elements(dwg, *parts, budget), budget)
+
+
+DRAWERS = {
+    'ActivityDiagram': draw_activity,
+    'StateDiagram': draw_state,
+    'ClassDiagram': draw_class,
+    'UseCaseDiagram': draw_usecase,
+}
+
+TYPE_ALIASES = {
+    'activity': 'ActivityDiagram',
+    'state': 'StateDiagram',
+    'class': 'ClassDiagram',
+    'usecase': 'UseCaseDiagram',
+}
+
+
+# First supported diagram matching type (tag or alias) and Id or Name, None when there is none
+def find_diagram(root, diagram_type=None, diagram_ref=None):
+    diagrams = root.find('Diagrams')
+    if diagrams is None:
+        return None
+    diagram_type = TYPE_ALIASES.get(diagram_type, diagram_type)
+    for diagram in diagrams:
+        if diagram.tag not in RENDERERS:
+            continue
+        if diagram_ref is not None and diagram_ref not in (diagram.get('Id'), diagram.get('Name')):
+            continue
+        if diagram_type is not None and diagram.tag != diagram_type:
+            continue
+        return diagram
+    return None
+
+
+def diagram_file_name(number, diagram):
+    name = re.sub(r'[^\w.-]+', '_', diagram.get('Name') or diagram.get('Id') or 'diagram').strip('_')
+    return f'{number:03d}_{diagram.tag}_{name}.svg'
+
+
+# Budget is a render_budget.Budget or is made from max_elements, max_labels and max_seconds options,
+# its report (what was degraded) goes to result['budget']
+# With sink (render_archive.ArchiveSink) the diagram is streamed into the archive as entry svg_file
+# together with its metrics, nothing is written to the filesystem.
+def render_one(index, diagram, svg_file, budget=None, sink=None, **options):
+    result = {'id': diagram.get('Id'), 'name': diagram.get('Name'), 'type': diagram.tag, 'file': None, 'error': None}
+    renderer = RENDERERS.get(diagram.tag)
+    if renderer is None:
+        result['error'] = 'unsupported diagram type'
+        return result
+    if budget is None:
+        budget = render_budget.from_options(options)
+    started = time.perf_counter()
+    try:
+        if sink is None:
+            renderer(index, diagram, svg_file, budget=budget, **options)
+        else:
+            dwg, elements = DRAWERS[diagram.tag](index, diagram, budget=budget, **options)
+            spool = sink.spool(svg_stream.stream(dwg, elements))
+        result['file'] = svg_file
+    except Exception as e:
+        result['error'] = str(e)
+    if budget is not None:
+        result['budget'] = budget.report()
+    if sink is not None and result['error'] is None:
+        metrics = {key: result[key] for key in ('id', 'name', 'type')}
+        metrics['seconds'] = round(time.perf_counter() - started, 4)
+        if budget is not None:
+            metrics['budget'] = result['budget']
+        sink.write(svg_file, spool, metrics)
+    return result
+
+
+# Parse export once and render all its diagrams into output_dir, returns one result per diagram
+# With index_db the already parsed export also updates the name index (see name_index).
+# Other options go to render_one, budget limits (max_elements...) apply to each diagram separately.
+# With sink option output_dir is only the prefix of entry names in the archive.
+def render_project(xml_file, output_dir, workers=None, index_db=None, **options):
+    root = xml_backend.parse_file(xml_file)
+    index = build_model_index(root)
+    if index_db is not None:
+        name_index.update_db(index_db, xml_file, root)
+    diagrams = root.find('Diagrams')
+    if diagrams is None:
+        return []
+
+    if options.get('sink') is None:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = [(diagram, os.path.join(output_dir, diagram_file_name(number, diagram)))
+            for number, diagram in enumerate(diagrams, start=1) if isinstance(diagram.tag, str)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_one, index, diagram, svg_file, **options) for diagram, svg_file in jobs]
+        return [future.result() for future in futures]
+
+
+# Render many exports in one process, without forking. Every export is parsed and rendered
+# on its own pool thread (lxml parses with GIL released) into output_dir/<export name>/,
+# exports of the same name get a hash of their path appended (xml_backend.unique_names).
+# Zip bundles are expanded to their XML members, .gz exports are read as they are.
+# With sink (render_archive.ArchiveSink) all diagrams go into one archive instead of separate files.
+# Returns list of (xml_file, results of render_project or None, error or None).
+def render_batch(xml_files, output_dir, workers=None, index_db=None, sink=None):
+    xml_files = xml_backend.expand_sources(xml_files)
+    jobs = [(xml_file, os.path.join(output_dir, name), 1, index_db)
+            for xml_file, name in zip(xml_files, xml_backend.unique_names(xml_files))]
+    outcomes = xml_backend.run_batch(lambda *job: render_project(*job, sink=sink), jobs, workers)
+    return [(xml_file, results, error) for xml_file, (results, error) in zip(xml_files, outcomes)]
+
+
+def main():
+    xml_file = sys.argv[1] if len(sys.argv) > 1 else 'sumxmls/simple_usecase_NEW.xml'
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'project_svgs'
+    index_db = sys.argv[3] if len(sys.argv) > 3 else None
+
+    for result in render_project(xml_file, output_dir, index_db=index_db):
+        if result['file']:
+            print(f"{result['type']} '{result['name']}' -> {result['file']}")
+        else:
+            print(f"{result['type']} '{result['name']}' skipped: {result['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Compact records for parsed diagram elements.
+#
+# Renderers used to keep every element as dict with string keys (and sometimes string numbers).
+# These classes use __slots__, so one element takes a fraction of dict memory, attribute access
+# in draw loops is cheaper and numeric fields are converted once, when the export is parsed.
+
+
+class Record:
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name)
+                                                 for name in self.__slots__)
+
+
+# Placed shape of activity diagram, kind is 'rect', 'circle' or 'diamond'
+class Shape(Record):
+    __slots__ = ('kind', 'x', 'y', 'width', 'height')
+
+    def __init__(self, kind, x, y, width, height):
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+class Caption(Record):
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x=0, y=0, width=0, height=0):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+class State(Record):
+    __slots__ = ('name', 'x', 'y', 'width', 'height', 'children', 'caption', 'font_shift', 'color')
+
+    def __init__(self, name, x, y, width, height, children, caption, font_shift, color):
+        self.name = name
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.children = children
+        self.caption = caption
+        self.font_shift = font_shift
+        self.color = color
+
+
+class Transition(Record):
+    __slots__ = ('id', 'x', 'y', 'name')
+
+    def __init__(self, id, x, y, name):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.name = name
+
+
+class Parameter(Record):
+    __slots__ = ('name', 'type', 'modifier')
+
+    def __init__(self, name, type, modifier):
+        self.name = name
+        self.type = type
+        self.modifier = modifier
+
+
+class Attribute(Record):
+    __slots__ = ('name', 'visibility', 'type', 'modifier')
+
+    def __init__(self, name, visibility, type, modifier):
+        self.name = name
+        self.visibility = visibility
+        self.type = type
+        self.modifier = modifier
+
+
+class Operation(Record):
+    __slots__ = ('name', 'visibility', 'parameters', 'return_type', 'modifier')
+
+    def __init__(self, name, visibility, parameters, return_type, modifier):
+        self.name = name
+        self.visibility = visibility
+        self.parameters = parameters
+        self.return_type = return_type
+        self.modifier = modifier
+
+
+class ModelClass(Record):
+    __slots__ = ('name', 'attributes', 'operations')
+
+    def __init__(self, name, attributes, operations):
+        self.name = name
+        self.attributes = attributes
+        self.operations = operations
+
+
+# Class as shown on a diagram, `id` is id of the shape (model id is the key it is stored under)
+class ClassShape(Record):
+    __slots__ = ('id', 'x', 'y', 'width', 'height', 'color', 'shift')
+
+    def __init__(self, id, x, y, width, height, color, shift):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.color = color
+        self.shift = shift
+
+
+# Model class joined with its shape, ready to draw
+class ClassBox(Record):
+    __slots__ = ('id', 'name', 'attributes', 'operations', 'x', 'y', 'width', 'height', 'color', 'shift')
+
+    def __init__(self, id, model_class, shape):
+        self.id = id
+        self.name = model_class.name
+        self.attributes = model_class.attributes
+        self.operations = model_class.operations
+        self.x = shape.x
+        self.y = shape.y
+        self.width = shape.width
+        self.height = shape.height
+        self.color = shape.color
+        self.shift = shape.shift
+
+
+# Bend points of one connector, list of (x, y) float tuples
+class Connector(Record):
+    __slots__ = ('id', 'points')
+
+    def __init__(self, id, points):
+        self.id = id
+        self.points = points
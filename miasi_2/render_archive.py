@@ -0,0 +1,199 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+import project_render
+
+
+# Output of batch renders into one archive instead of thousands of small SVG files.
+# On network filesystems metadata operations per file cost more than writing the data, so every
+# rendered diagram is streamed into one zip (entries stored or deflated) or tar archive.
+# Next to the archive goes an index (ARCHIVE.index.json, also stored as the last member index.json)
+# with the offset and size of every entry's data and the render metrics of its diagram.
+# A viewer or uploader reads one entry by seeking to its offset, without unpacking the archive.
+#
+#   python render_archive.py render out.zip sumxmls/*.xml --compress
+#   python render_archive.py list out.zip
+#   python render_archive.py cat out.zip simple_class/001_ClassDiagram_Klasy.svg > klasy.svg
+
+INDEX_MEMBER = 'index.json'
+
+# Rendered diagram is kept in memory up to this size, bigger ones spill to a temporary file
+SPOOL_SIZE = 1 << 20
+
+
+def archive_format(path):
+    if path.endswith('.zip'):
+        return 'zip'
+    if path.endswith('.tar'):
+        return 'tar'
+    raise ValueError(f'{path}: archive has to be .zip or .tar (compressed tar cannot be read by offset)')
+
+
+def index_file(path):
+    return path + '.index.json'
+
+
+# Renderers run on pool threads: each spools its diagram on its own, only writing into the archive is locked
+class ArchiveSink:
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.format = archive_format(path)
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.entries = {}
+        if self.format == 'zip':
+            self.archive = zipfile.ZipFile(path, 'w')
+        else:
+            self.archive = tarfile.open(path, 'w', format=tarfile.PAX_FORMAT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Consume SVG text chunks of one diagram, returns spooled file for write()
+    def spool(self, chunks):
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        for chunk in chunks:
+            spooled.write(chunk.encode('utf-8'))
+        return spooled
+
+    def write(self, name, spooled, metrics=None):
+        name = name.replace(os.sep, '/')
+        length = spooled.tell()
+        spooled.seek(0)
+        with self.lock:
+            # Second member of the same name would shadow the first one, the index keeps only one
+            if name in self.entries:
+                spooled.close()
+                raise ValueError(f'{name}: duplicate entry in {self.path}')
+            if self.format == 'zip':
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED if self.compress else zipfile.ZIP_STORED
+                info.file_size = length
+                with self.archive.open(info, 'w') as f:
+                    shutil.copyfileobj(spooled, f)
+                # Data offset is known once the local header is read back in close()
+                entry = {'header': info.header_offset, 'size': info.compress_size}
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = length
+                info.mtime = time.time()
+                self.archive.addfile(info, spooled)
+                # Data is the last thing written, padded to whole blocks
+                blocks = -(-length // tarfile.BLOCKSIZE)
+                entry = {'offset': self.archive.offset - blocks * tarfile.BLOCKSIZE, 'size': length}
+            entry['length'] = length
+            entry['compression'] = 'deflate' if self.format == 'zip' and self.compress else None
+            entry['metrics'] = metrics or {}
+            self.entries[name] = entry
+        spooled.close()
+
+    def close(self):
+        with self.lock:
+            self.archive.close()
+            if self.format == 'zip':
+                with open(self.path, 'rb') as f:
+                    for entry in self.entries.values():
+                        f.seek(entry['header'])
+                        name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+                        entry['offset'] = entry.pop('header') + 30 + name_length + extra_length
+            index = {'format': self.format, 'entries': self.entries}
+            data = json.dumps(index, indent=2, ensure_ascii=False).encode('utf-8')
+            with open(index_file(self.path), 'wb') as f:
+                f.write(data)
+            if self.format == 'zip':
+                with zipfile.ZipFile(self.path, 'a') as archive:
+                    archive.writestr(INDEX_MEMBER, data)
+            else:
+                with tarfile.open(self.path, 'a', format=tarfile.PAX_FORMAT) as archive:
+                    info = tarfile.TarInfo(INDEX_MEMBER)
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    archive.addfile(info, io.BytesIO(data))
+        return index
+
+
+# Index of archive, from the file next to it or from its index.json member
+def read_index(path):
+    try:
+        with open(index_file(path), encoding='utf-8') as f:
+            return json.load(f)
+    except OSError:
+        pass
+    if archive_format(path) == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            return json.loads(archive.read(INDEX_MEMBER))
+    with tarfile.open(path) as archive:
+        return json.load(archive.extractfile(INDEX_MEMBER))
+
+
+# SVG bytes of one entry, read by its offset
+def read_entry(path, name, index=None):
+    if index is None:
+        index = read_index(path)
+    entry = index['entries'].get(name)
+    if entry is None:
+        raise KeyError(f'{name}: no such entry in {path}')
+    with open(path, 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read(entry['size'])
+    if entry['compression'] == 'deflate':
+        data = zlib.decompress(data, -15)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render exports into one archive and read single diagrams of it')
+    commands = parser.add_subparsers(dest='command', required=True)
+    render_parser = commands.add_parser('render', help='render all diagrams of exports into archive')
+    render_parser.add_argument('archive', help='.zip or .tar file')
+    render_parser.add_argument('xml_files', nargs='+')
+    render_parser.add_argument('--compress', action='store_true', help='deflate zip entries')
+    render_parser.add_argument('--workers', type=int, default=None)
+    list_parser = commands.add_parser('list', help='entries of archive with their metrics')
+    list_parser.add_argument('archive')
+    cat_parser = commands.add_parser('cat', help='write one entry to stdout')
+    cat_parser.add_argument('archive')
+    cat_parser.add_argument('name')
+    args = parser.parse_args()
+
+    if args.command == 'render':
+        failed = False
+        with ArchiveSink(args.archive, args.compress) as sink:
+            for xml_file, results, error in project_render.render_batch(args.xml_files, '', args.workers, sink=sink):
+                if error is not None:
+                    print(f'{xml_file}: ERROR {error}', file=sys.stderr)
+                    failed = True
+                    continue
+                for result in results:
+                    if result['error'] and result['error'] != 'unsupported diagram type':
+                        print(f"{xml_file}: {result['type']} '{result['name']}' ERROR {result['error']}",
+                              file=sys.stderr)
+                        failed = True
+        print(f'{len(sink.entries)} diagrams in {args.archive}', file=sys.stderr)
+        sys.exit(1 if failed else 0)
+
+    if args.command == 'list':
+        for name, entry in read_index(args.archive)['entries'].items():
+            metrics = entry['metrics']
+            print(f"{name}\t{entry['length']} B\t{metrics.get('seconds', 0) * 1000:.1f} ms\t{metrics.get('type')}")
+        return
+
+    sys.stdout.buffer.write(read_entry(args.archive, args.name))
+
+
+if __name__ == "__main__":
+    main()
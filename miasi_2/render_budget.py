@@ -0,0 +1,135 @@
+import time
+
+import svgwrite
+
+import svg_text
+
+
+# Budgets of one render, so one pathological export (class with thousands of operations, state
+# with huge ModelChildren list) cannot pin a worker for minutes.
+# Limits are checked while the diagram is drawn. Once any of them is exceeded the renderer steps
+# down to cheaper output for the rest of the diagram instead of failing:
+#   members   class attributes/operations and state children are not listed
+#   labels    labels are cut to label_length characters
+#   wrapping  activity labels are not wrapped, one cut line is drawn
+#   straight  connectors are drawn as one straight segment, missing routes are not searched
+# Output stays a valid SVG, report() tells what was degraded and how many times.
+
+STEPS = ('members', 'labels', 'wrapping', 'straight')
+
+
+class Budget:
+    def __init__(self, max_elements=None, max_labels=None, max_seconds=None, label_length=40):
+        self.max_elements = max_elements
+        self.max_labels = max_labels
+        self.max_seconds = max_seconds
+        self.label_length = label_length
+        self.started = time.perf_counter()
+        self.elements = 0
+        self.labels = 0
+        self.exceeded = None
+        self.degraded = {}
+
+    # True once any limit was exceeded, it stays exceeded for the rest of the render
+    def over(self):
+        if self.exceeded is not None:
+            return True
+        if self.max_elements is not None and self.elements > self.max_elements:
+            self.exceeded = 'elements'
+        elif self.max_labels is not None and self.labels > self.max_labels:
+            self.exceeded = 'labels'
+        elif self.max_seconds is not None and time.perf_counter() - self.started > self.max_seconds:
+            self.exceeded = 'seconds'
+        return self.exceeded is not None
+
+    def degrade(self, step):
+        self.degraded[step] = self.degraded.get(step, 0) + 1
+
+    def report(self):
+        return {
+            'limits': {'elements': self.max_elements, 'labels': self.max_labels, 'seconds': self.max_seconds},
+            'elements': self.elements,
+            'labels': self.labels,
+            'seconds': round(time.perf_counter() - self.started, 3),
+            'exceeded': self.exceeded,
+            'degraded': dict(self.degraded),
+        }
+
+
+# Limits from options (e.g. query string of render service), None when no limit is set
+def from_options(options):
+    limits = {}
+    for name in ('max_elements', 'max_labels'):
+        if options.get(name) is not None:
+            limits[name] = int(options[name])
+    if options.get('max_seconds') is not None:
+        limits['max_seconds'] = float(options['max_seconds'])
+    return Budget(**limits) if limits else None
+
+
+# Count elements and labels while they are drawn, elements are passed on unchanged
+def watch(elements, budget):
+    if budget is None:
+        return elements
+    return counted(elements, budget)
+
+
+# Every line of a multi-line label counts as an element and a label of its own
+def counted(elements, budget):
+    for element in elements:
+        if isinstance(element, svg_text.CountedLines):
+            pass
+        elif isinstance(element, svgwrite.text.Text):
+            lines = 1 + sum(isinstance(child, svgwrite.text.TSpan) for child in element.elements)
+            budget.elements += lines
+            budget.labels += lines
+        elif isinstance(element, svgwrite.base.BaseElement):
+            budget.elements += 1
+        yield element
+
+
+# Add report of elements counted elsewhere (a worker process drawing one slice) to budget
+def merge(budget, report):
+    budget.elements += report['elements']
+    budget.labels += report['labels']
+    for step, count in report['degraded'].items():
+        budget.degraded[step] = budget.degraded.get(step, 0) + count
+    if budget.exceeded is None:
+        budget.exceeded = report['exceeded']
+    budget.over()
+
+
+# Helpers for renderers, budget may be None (no limits)
+def over(budget):
+    return budget is not None and budget.over()
+
+
+# True when the cheaper variant of `step` has to be used, the step is counted in the report
+def degrade(budget, step):
+    if not over(budget):
+        return False
+    budget.degrade(step)
+    return True
+
+
+def label(budget, text):
+    if text is None or not over(budget) or len(text) <= budget.label_length:
+        return text
+    budget.degrade('labels')
+    return text[:budget.label_length - 1] + '…'
+
+
+# One line of a label collected for svg_text.text_lines(..., counted=True), counted right away
+# so a long member list is cut as soon as the budget runs out, not after all its lines are drawn
+def line(budget, text):
+    if budget is not None:
+        budget.elements += 1
+        budget.labels += 1
+    return label(budget, text)
+
+
+# First and last point only
+def straight(budget, points):
+    if len(points) <= 2 or not degrade(budget, 'straight'):
+        return points
+    return [points[0], points[-1]]
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import export_diff
+import project_render
+import use_case_diagram
+import xml_backend
+
+
+# Minimal re-rendering of a project after an edit.
+# For every diagram the set of model elements it depends on is recorded:
+#   shapes and connectors of the diagram referencing model elements by their Model attribute
+#   model elements whose MasterView links point to shapes of the diagram
+#   elements those reference by Idref (attribute and parameter types, association ends)
+#   use case relationships between elements of the diagram, they are drawn without own connector
+# Together with content hashes of the diagram and of those elements it is kept in
+# OUTPUT_DIR/dependencies.json. Rebuild renders only diagrams that are new, lost their SVG,
+# changed themselves or depend on a changed model element; the rest is left as it is.
+#
+#   python render_deps.py export.xml project_svgs            first run renders everything
+#   python render_deps.py export.xml project_svgs --dry-run  only tell what is stale and why
+
+MANIFEST = 'dependencies.json'
+
+# Placing an element on another diagram adds MasterView link, its drawing does not change
+HASH_SKIPPED_TAGS = ('MasterView',)
+
+
+# Diagram shape Id -> model Ids that list the shape in their MasterView
+def master_views(models):
+    shown = {}
+    if models is None:
+        return shown
+    for master_view in models.iter('MasterView'):
+        model_id = master_view.getparent().get('Id')
+        if model_id is None:
+            continue
+        for link in master_view:
+            if isinstance(link.tag, str) and link.get('Idref') is not None:
+                shown.setdefault(link.get('Idref'), set()).add(model_id)
+    return shown
+
+
+# Model Ids the drawing of diagram depends on
+def diagram_dependencies(index, diagram, shown=None, relationships=None):
+    elements = index['elements']
+    if shown is None:
+        shown = master_views(index['models'])
+    ids = set()
+    for elem in diagram.iter():
+        if not isinstance(elem.tag, str):
+            continue
+        if elem.get('Model') in elements:
+            ids.add(elem.get('Model'))
+        ids.update(shown.get(elem.get('Id'), ()))
+
+    for model_id in list(ids):
+        for elem in elements[model_id].iter():
+            if elem.get('Idref') in elements:
+                ids.add(elem.get('Idref'))
+
+    if diagram.tag == 'UseCaseDiagram':
+        if relationships is None:
+            relationships = use_case_diagram.extract_relationships(index['root'])
+        ids.update(relationship['id'] for relationship in relationships
+                   if relationship['from'] in ids and relationship['to'] in ids)
+    return ids
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+# Manifest entry of every supported diagram of export: {diagram Id: {'file', 'hash', 'models'}}
+def dependency_map(index):
+    root = index['root']
+    hashes = export_diff.subtree_hashes(root, HASH_SKIPPED_TAGS)
+    shown = master_views(index['models'])
+    relationships = None
+    entries = {}
+    diagrams = root.find('Diagrams')
+    for number, diagram in enumerate(diagrams if diagrams is not None else (), start=1):
+        if diagram.tag not in project_render.RENDERERS:
+            continue
+        if diagram.tag == 'UseCaseDiagram' and relationships is None:
+            relationships = use_case_diagram.extract_relationships(root)
+        models = diagram_dependencies(index, diagram, shown, relationships)
+        entries[diagram.get('Id')] = {
+            'file': project_render.diagram_file_name(number, diagram),
+            'hash': hashes[diagram].hex(),
+            'models': {model_id: hashes[index['elements'][model_id]].hex() for model_id in sorted(models)},
+        }
+    return entries
+
+
+# Why diagram has to be rendered again, None when its SVG is up to date
+def stale_reason(entry, previous, output_dir):
+    if previous is None:
+        return 'new'
+    if not os.path.exists(os.path.join(output_dir, entry['file'])):
+        return 'missing file'
+    if entry['hash'] != previous.get('hash') or entry['file'] != previous.get('file'):
+        return 'diagram changed'
+    old_models = previous.get('models', {})
+    changed = sorted(model_id for model_id in set(entry['models']) | set(old_models)
+                     if entry['models'].get(model_id) != old_models.get(model_id))
+    if changed:
+        return 'model changed: ' + ', '.join(changed)
+    return None
+
+
+# Render stale diagrams of export into output_dir and update its manifest.
+# Returns list of (diagram Id, reason or None, result of render_one or None).
+def rebuild(xml_file, output_dir, workers=None, force=False, dry_run=False, **options):
+    root = xml_backend.parse_file(xml_file)
+    index = project_render.build_model_index(root)
+    entries = dependency_map(index)
+    previous = load_manifest(output_dir).get('diagrams', {})
+
+    diagrams = {diagram.get('Id'): diagram for diagram in root.find('Diagrams') if diagram.get('Id') in entries}
+    outcomes = []
+    jobs = []
+    for diagram_id, entry in entries.items():
+        reason = 'forced' if force else stale_reason(entry, previous.get(diagram_id), output_dir)
+        outcomes.append((diagram_id, reason))
+        if reason is not None:
+            jobs.append(diagram_id)
+    if dry_run:
+        return [(diagram_id, reason, None) for diagram_id, reason in outcomes]
+
+    os.makedirs(output_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {diagram_id: executor.submit(project_render.render_one, index, diagrams[diagram_id],
+                                               os.path.join(output_dir, entries[diagram_id]['file']), **options)
+                   for diagram_id in jobs}
+        results = {diagram_id: future.result() for diagram_id, future in futures.items()}
+
+    # Failed diagram keeps its old entry (or none), so it is tried again on the next rebuild
+    manifest = {}
+    for diagram_id, entry in entries.items():
+        result = results.get(diagram_id)
+        if result is not None and result['error'] is not None:
+            if diagram_id in previous:
+                manifest[diagram_id] = previous[diagram_id]
+            continue
+        manifest[diagram_id] = entry
+    save_manifest(output_dir, {'source': os.path.abspath(xml_file), 'diagrams': manifest})
+    return [(diagram_id, reason, results.get(diagram_id)) for diagram_id, reason in outcomes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render again only diagrams affected by changes of an export')
+    parser.add_argument('xml_file')
+    parser.add_argument('output_dir')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='render all diagrams')
+    parser.add_argument('--dry-run', action='store_true', help='only print stale diagrams')
+    args = parser.parse_args()
+
+    failed = False
+    rendered = 0
+    outcomes = rebuild(args.xml_file, args.output_dir, args.workers, args.force, args.dry_run)
+    for diagram_id, reason, result in outcomes:
+        if reason is None:
+            continue
+        if result is not None and result['error'] is not None:
+            print(f"{diagram_id}: ERROR {result['error']}")
+            failed = True
+            continue
+        rendered += result is not None
+        print(f'{diagram_id}: {reason}')
+    print(f'{rendered} of {len(outcomes)} diagrams rendered', file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
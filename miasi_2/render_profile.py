@@ -0,0 +1,210 @@
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# Opt-in profiling of renderer phases.
+# Renderers mark their phases with `with render_profile.phase('parse'):` (parse, extract, geometry,
+# emit, save). Nothing is measured until start() is called, then every phase of the calling thread gets:
+#   cProfile stats                 profile_<phase>.prof, top functions in summary
+#   tracemalloc peak and top sites peak bytes above memory at phase start, lines that allocated most
+#   sampled call stacks            stacks.collapsed, one "phase;file:function;... count" per line,
+#                                  input for flamegraph.pl or speedscope
+# When profiling is off phase() returns one shared no-op context manager.
+#
+#   python render_profile.py prof_out activity_diagram.py      runs script (its main) under profiling
+
+PHASES = ('parse', 'extract', 'geometry', 'emit', 'save')
+
+# Allocations of the profiler itself are not attributed to phases
+OWN_FILES = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__),
+             tracemalloc.Filter(False, pstats.__file__), tracemalloc.Filter(False, __file__)]
+
+NO_PHASE = contextlib.nullcontext()
+
+ACTIVE = None
+
+
+def phase(name):
+    session = ACTIVE
+    if session is None or threading.get_ident() != session.thread:
+        return NO_PHASE
+    return session.phase(name)
+
+
+class Session:
+    def __init__(self, output_dir, sample_interval=0.001, top=15):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.top = top
+        self.thread = threading.get_ident()
+        self.stack = []
+        self.phases = {}
+        self.samples = {}
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+
+    def start(self):
+        tracemalloc.start()
+        self.sampler.start()
+
+    def stats_of(self, name):
+        return self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'profile': None,
+                                             'allocations': {}})
+
+    # Inner phase pauses the outer one, time and memory go to the innermost phase only.
+    # Snapshots and their comparison run while no phase is running, they are neither timed nor sampled.
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.stack:
+            self.pause(self.stack[-1])
+        tracemalloc.reset_peak()
+        current = {'name': name, 'profiler': cProfile.Profile(), 'peak': 0, 'seconds': 0.0, 'running': False,
+                   'snapshot': tracemalloc.take_snapshot().filter_traces(OWN_FILES),
+                   'base': tracemalloc.get_traced_memory()[0]}
+        self.stack.append(current)
+        self.resume(current)
+        try:
+            yield
+        finally:
+            self.pause(current)
+            self.finish(current)
+            self.stack.pop()
+            tracemalloc.reset_peak()
+            if self.stack:
+                self.resume(self.stack[-1])
+
+    def pause(self, current):
+        current['profiler'].disable()
+        current['running'] = False
+        current['seconds'] += time.perf_counter() - current['started']
+        current['peak'] = max(current['peak'], tracemalloc.get_traced_memory()[1])
+
+    def resume(self, current):
+        current['started'] = time.perf_counter()
+        current['running'] = True
+        current['profiler'].enable()
+
+    def finish(self, current):
+        stats = self.stats_of(current['name'])
+        stats['calls'] += 1
+        stats['seconds'] += current['seconds']
+        peak = current['peak'] - current['base']
+        stats['peak_bytes'] = max(stats['peak_bytes'], peak)
+        if stats['profile'] is None:
+            stats['profile'] = pstats.Stats(current['profiler'])
+        else:
+            stats['profile'].add(current['profiler'])
+        snapshot = tracemalloc.take_snapshot().filter_traces(OWN_FILES)
+        for difference in snapshot.compare_to(current['snapshot'], 'lineno'):
+            if difference.size_diff > 0:
+                frame = difference.traceback[0]
+                site = f'{frame.filename}:{frame.lineno}'
+                stats['allocations'][site] = stats['allocations'].get(site, 0) + difference.size_diff
+
+    # Runs on its own thread, records stack of the profiled thread with name of its current phase
+    def sample(self):
+        while not self.stopped.wait(self.sample_interval):
+            frame = sys._current_frames().get(self.thread)
+            # Copy of the innermost phase, the profiled thread changes the stack meanwhile
+            top = self.stack[-1:]
+            if frame is None or not top or not top[0]['running']:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename != __file__:
+                    names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            names.append(top[0]['name'])
+            key = ';'.join(reversed(names))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+        tracemalloc.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        summary = {}
+        for name, stats in self.phases.items():
+            functions = []
+            if stats['profile'] is not None:
+                stats['profile'].dump_stats(os.path.join(self.output_dir, f'profile_{name}.prof'))
+                rows = sorted(stats['profile'].stats.items(), key=lambda item: item[1][2], reverse=True)
+                for (filename, line, function), (_, calls, own, cumulative, _) in rows[:self.top]:
+                    functions.append({'function': f'{os.path.basename(filename)}:{line}:{function}', 'calls': calls,
+                                      'own_seconds': round(own, 6), 'cumulative_seconds': round(cumulative, 6)})
+            allocations = sorted(stats['allocations'].items(), key=lambda item: item[1], reverse=True)
+            summary[name] = {
+                'calls': stats['calls'],
+                'seconds': round(stats['seconds'], 6),
+                'peak_bytes': stats['peak_bytes'],
+                'top_functions': functions,
+                'top_allocations': [{'site': site, 'bytes': size} for site, size in allocations[:self.top]],
+            }
+
+        with open(os.path.join(self.output_dir, 'stacks.collapsed'), 'w', encoding='utf-8') as f:
+            for key, count in sorted(self.samples.items()):
+                f.write(f'{key} {count}\n')
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+# Profile phases of the calling thread until stop()
+def start(output_dir, sample_interval=0.001):
+    global ACTIVE
+    if ACTIVE is not None:
+        raise RuntimeError('profiling is already running')
+    session = Session(output_dir, sample_interval)
+    session.start()
+    ACTIVE = session
+
+
+# Write profile files into output_dir and return the summary
+def stop():
+    global ACTIVE
+    session = ACTIVE
+    ACTIVE = None
+    return session.stop() if session is not None else None
+
+
+@contextlib.contextmanager
+def profiling(output_dir, sample_interval=0.001):
+    start(output_dir, sample_interval)
+    try:
+        yield
+    finally:
+        stop()
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('usage: python render_profile.py OUTPUT_DIR script.py [args...]')
+        sys.exit(2)
+    output_dir, script = sys.argv[1], sys.argv[2]
+    sys.argv = sys.argv[2:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    # Run as script this file is __main__, renderers see the module imported under its own name
+    import render_profile
+    render_profile.start(output_dir)
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        summary = render_profile.stop()
+        for name, stats in summary.items():
+            print(f"{name}: {stats['calls']} calls, {stats['seconds'] * 1000:.1f} ms, "
+                  f"peak {stats['peak_bytes'] / 1024:.0f} KiB", file=sys.stderr)
+        print(f'profile written to {output_dir}', file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import project_render
+import render_budget
+import svg_stream
+import xml_backend
+
+
+# Long-running local render server.
+# Interpreter start and imports of svgwrite/lxml cost more than rendering a small export, so this
+# server stays resident and keeps a pool of warm worker processes. It speaks plain HTTP/1.1 over
+# TCP or a Unix socket:
+#
+#   POST /render?type=state&simplify_epsilon=1     body is the XML export, response is the SVG
+#   POST /render  {"path": "sumxmls/simple_state.xml", "diagram": "<Id or Name>"}  (JSON body)
+#   GET /health                                     pool and queue state as JSON
+#
+# Every response carries X-Queue-Ms, X-Parse-Ms, X-Render-Ms and X-Total-Ms headers.
+# With max_elements, max_labels or max_seconds set (see render_budget) big diagrams are degraded
+# instead of holding the worker, X-Budget header carries the report of what was degraded.
+# At most `max_queue` requests wait or run at once, the rest gets 503 with Retry-After.
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 422: 'Unprocessable Entity', 503: 'Service Unavailable'}
+
+
+# Builds the thread-local XML parser of the worker before the first request
+def warm_worker():
+    xml_backend.get_parser()
+
+
+def warm_up(_):
+    return os.getpid()
+
+
+# Runs in worker process, returns (status, svg or error message, timings in ms and budget report)
+def render_request(data, path, diagram_type, diagram_ref, options):
+    started = time.perf_counter()
+    try:
+        root = xml_backend.parse_bytes(data) if data is not None else xml_backend.parse_file(path)
+    except Exception as e:
+        return 400, f'cannot parse export: {e}', {'parse': (time.perf_counter() - started) * 1000}
+    index = project_render.build_model_index(root)
+    parsed = time.perf_counter()
+    timings = {'parse': (parsed - started) * 1000}
+
+    diagram = project_render.find_diagram(root, diagram_type, diagram_ref)
+    if diagram is None:
+        return 404, 'no matching diagram in export', timings
+
+    drawer = project_render.DRAWERS.get(diagram.tag)
+    if drawer is None:
+        return 422, 'unsupported diagram type', timings
+    # Body is built from the streamed SVG text, the render never touches the disk
+    budget = render_budget.from_options(options)
+    try:
+        dwg, elements = drawer(index, diagram, budget=budget, **options)
+        svg = ''.join(svg_stream.stream(dwg, elements))
+    except Exception as e:
+        svg = None
+        error = str(e)
+    timings['render'] = (time.perf_counter() - parsed) * 1000
+    if budget is not None:
+        timings['budget'] = budget.report()
+    if svg is None:
+        return 422, error, timings
+    return 200, svg, timings
+
+
+# Options from query string or JSON body, numbers and booleans converted
+def read_options(params):
+    options = {}
+    if 'auto_layout' in params:
+        value = params['auto_layout']
+        options['auto_layout'] = value if isinstance(value, bool) or value is None else value.lower() in ('1', 'true', 'yes')
+    if 'simplify_epsilon' in params:
+        options['simplify_epsilon'] = float(params['simplify_epsilon'])
+    # Budget limits stay plain numbers, render_one makes the budget in the worker
+    for name, convert in (('max_elements', int), ('max_labels', int), ('max_seconds', float)):
+        if name in params:
+            options[name] = convert(params[name])
+    return options
+
+
+class RenderService:
+    def __init__(self, workers=None, max_queue=32, max_body=64 * 1024 * 1024):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.executor = None
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        # Make every worker start now, not with the first request
+        list(self.executor.map(warm_up, range(self.workers)))
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    async def handle(self, reader, writer):
+        try:
+            status, body, headers = await self.respond(reader)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, body, headers = 400, str(e), {}
+        except Exception as e:
+            # Broken worker pool or a bug must still get an answer, not a dropped connection
+            status, body, headers = 500, f'{type(e).__name__}: {e}', {}
+        await self.send(writer, status, body, headers)
+
+    async def respond(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            raise ValueError('empty request')
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        if url.path == '/health':
+            return 200, json.dumps(self.health()), {'Content-Type': 'application/json'}
+        if url.path != '/render':
+            return 404, 'unknown path', {}
+        if method != 'POST':
+            return 405, 'use POST', {'Allow': 'POST'}
+
+        length = int(headers.get('content-length', '0'))
+        if length > self.max_body:
+            return 413, 'export too big', {}
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            return 503, 'render queue is full', {'Retry-After': '1'}
+
+        # Slot is taken before the body is read, so slow uploads count against the queue too
+        self.pending += 1
+        try:
+            params = dict(parse_qsl(url.query))
+            data = await reader.readexactly(length) if length else None
+            path = None
+            if headers.get('content-type', '').startswith('application/json'):
+                body = json.loads(data or b'{}')
+                if not isinstance(body, dict):
+                    return 400, 'JSON body has to be an object', {}
+                params.update(body)
+                path = params.get('path')
+                if not isinstance(params.get('xml', ''), str) or not isinstance(path, (str, type(None))):
+                    return 400, '"xml" and "path" have to be strings', {}
+                data = params['xml'].encode('utf-8') if 'xml' in params else None
+            if data is None and path is None:
+                return 400, 'send export as body or its path as JSON', {}
+
+            return await self.render(data, path, params.get('type'), params.get('diagram'), read_options(params))
+        finally:
+            self.pending -= 1
+
+    async def render(self, data, path, diagram_type, diagram_ref, options):
+        received = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        status, body, timings = await loop.run_in_executor(self.executor, render_request, data, path,
+                                                           diagram_type, diagram_ref, options)
+        self.served += 1
+
+        total = (time.perf_counter() - received) * 1000
+        busy = timings.get('parse', 0) + timings.get('render', 0)
+        headers = {
+            'Content-Type': 'image/svg+xml' if status == 200 else 'text/plain; charset=utf-8',
+            'X-Queue-Ms': f'{max(total - busy, 0):.1f}',
+            'X-Parse-Ms': f"{timings.get('parse', 0):.1f}",
+            'X-Render-Ms': f"{timings.get('render', 0):.1f}",
+            'X-Total-Ms': f'{total:.1f}',
+        }
+        if 'budget' in timings:
+            headers['X-Budget'] = json.dumps(timings['budget'])
+        return status, body, headers
+
+    def health(self):
+        return {'workers': self.workers, 'pending': self.pending, 'max_queue': self.max_queue,
+                'served': self.served, 'rejected': self.rejected}
+
+    async def send(self, writer, status, body, headers):
+        payload = body.encode('utf-8')
+        head = [f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}', f'Content-Length: {len(payload)}',
+                'Connection: close']
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        if 'Content-Type' not in headers:
+            head.append('Content-Type: text/plain; charset=utf-8')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+        with contextlib.suppress(ConnectionError):
+            await writer.drain()
+        writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8765, unix_socket=None):
+    if unix_socket is not None:
+        server = await asyncio.start_unix_server(service.handle, path=unix_socket)
+        print(f'Render service listening on {unix_socket}')
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        print(f'Render service listening on http://{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident SVG render service for Visual Paradigm exports')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-queue', type=int, default=32)
+    args = parser.parse_args()
+
+    service = RenderService(args.workers, args.max_queue)
+    service.start()
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import heapq
+
+import path_simplify
+
+
+# Orthogonal connector routing around shapes.
+#
+# Boxes are (x, y, width, height) tuples. Shapes are kept in a uniform grid index, so every
+# connector only looks at obstacles near its own ends. A* then searches a sparse visibility
+# graph made of lines running along obstacle borders, its nodes are created lazily while searching.
+
+BEND_PENALTY = 30
+
+
+# Uniform grid index: cell -> list of keys whose boxes touch the cell
+def build_index(boxes, cell_size=None):
+    if cell_size is None:
+        sizes = [max(box[2], box[3]) for box in boxes.values()]
+        cell_size = max(50, 2 * sum(sizes) / len(sizes)) if sizes else 100
+    cells = {}
+    for key, box in boxes.items():
+        for cell in box_cells(box, cell_size):
+            cells.setdefault(cell, []).append(key)
+    return {'cell_size': cell_size, 'cells': cells, 'boxes': boxes}
+
+
+def box_cells(box, cell_size):
+    x, y, width, height = box
+    for cell_x in range(int(x // cell_size), int((x + width) // cell_size) + 1):
+        for cell_y in range(int(y // cell_size), int((y + height) // cell_size) + 1):
+            yield cell_x, cell_y
+
+
+# Keys of all boxes intersecting given area
+def query_index(index, area):
+    found = set()
+    x, y, width, height = area
+    for cell in box_cells(area, index['cell_size']):
+        for key in index['cells'].get(cell, ()):
+            if key in found:
+                continue
+            bx, by, bw, bh = index['boxes'][key]
+            if bx <= x + width and x <= bx + bw and by <= y + height and y <= by + bh:
+                found.add(key)
+    return found
+
+
+def center(box):
+    return (box[0] + box[2] / 2, box[1] + box[3] / 2)
+
+
+# Middle of the box side facing `toward`, together with outward direction of that side
+def border_port(box, toward):
+    x, y, width, height = box
+    cx, cy = center(box)
+    dx = toward[0] - cx
+    dy = toward[1] - cy
+    # Compare relative to box proportions, so wide boxes prefer top and bottom sides
+    if abs(dx) * height >= abs(dy) * width:
+        if dx >= 0:
+            return (x + width, cy), (1, 0)
+        return (x, cy), (-1, 0)
+    if dy >= 0:
+        return (cx, y + height), (0, 1)
+    return (cx, y), (0, -1)
+
+
+# Simple Z shaped route used when search finds nothing
+def fallback_route(start, start_dir, end, end_dir):
+    if start_dir[0] != 0:
+        middle_x = (start[0] + end[0]) / 2
+        return path_simplify.merge_collinear([start, (middle_x, start[1]), (middle_x, end[1]), end])
+    middle_y = (start[1] + end[1]) / 2
+    return path_simplify.merge_collinear([start, (start[0], middle_y), (end[0], middle_y), end])
+
+
+def inside(point, obstacles):
+    px, py = point
+    for x, y, width, height in obstacles:
+        if x < px < x + width and y < py < y + height:
+            return True
+    return False
+
+
+# A* over grid made of interesting coordinates, state is (x index, y index, direction)
+def search(xs, ys, start, end, start_dir, obstacles):
+    x_index = {x: i for i, x in enumerate(xs)}
+    y_index = {y: i for i, y in enumerate(ys)}
+    goal = (x_index[end[0]], y_index[end[1]])
+    begin = (x_index[start[0]], y_index[start[1]])
+
+    def heuristic(i, j):
+        return abs(xs[i] - xs[goal[0]]) + abs(ys[j] - ys[goal[1]])
+
+    blocked = {}
+
+    def is_blocked(a, b):
+        key = (a, b) if a < b else (b, a)
+        if key not in blocked:
+            middle = ((xs[a[0]] + xs[b[0]]) / 2, (ys[a[1]] + ys[b[1]]) / 2)
+            blocked[key] = inside(middle, obstacles) or inside((xs[b[0]], ys[b[1]]), obstacles)
+        return blocked[key]
+
+    start_state = (begin[0], begin[1], start_dir)
+    costs = {start_state: 0}
+    came_from = {start_state: None}
+    queue = [(heuristic(*begin), 0, start_state)]
+
+    while queue:
+        _, cost, state = heapq.heappop(queue)
+        if cost > costs[state]:
+            continue
+        i, j, direction = state
+        if (i, j) == goal:
+            path = []
+            while state is not None:
+                path.append((xs[state[0]], ys[state[1]]))
+                state = came_from[state]
+            path.reverse()
+            return path
+
+        for step in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            if step[0] == -direction[0] and step[1] == -direction[1]:
+                continue
+            ni, nj = i + step[0], j + step[1]
+            if not (0 <= ni < len(xs) and 0 <= nj < len(ys)):
+                continue
+            if is_blocked((i, j), (ni, nj)):
+                continue
+            new_cost = cost + abs(xs[ni] - xs[i]) + abs(ys[nj] - ys[j])
+            if step != direction:
+                new_cost += BEND_PENALTY
+            new_state = (ni, nj, step)
+            if new_cost < costs.get(new_state, float('inf')):
+                costs[new_state] = new_cost
+                came_from[new_state] = state
+                heapq.heappush(queue, (new_cost + heuristic(ni, nj), new_cost, new_state))
+    return None
+
+
+# Orthogonal route from border of one box to border of another, avoiding boxes in `index`
+def route_orthogonal(index, source_key, target_key, margin=10, attempts=3):
+    source_box = index['boxes'][source_key]
+    target_box = index['boxes'][target_key]
+    start, start_dir = border_port(source_box, center(target_box))
+    end, end_dir = border_port(target_box, center(source_box))
+    # Leave and enter every box perpendicular to its side
+    start_out = (start[0] + start_dir[0] * margin, start[1] + start_dir[1] * margin)
+    end_out = (end[0] + end_dir[0] * margin, end[1] + end_dir[1] * margin)
+
+    padding = max(source_box[2], source_box[3], target_box[2], target_box[3]) + margin
+    for _ in range(attempts):
+        left = min(start_out[0], end_out[0]) - padding
+        top = min(start_out[1], end_out[1]) - padding
+        area = (left, top, max(start_out[0], end_out[0]) + padding - left,
+                max(start_out[1], end_out[1]) + padding - top)
+
+        obstacles = []
+        xs = {start_out[0], end_out[0], area[0], area[0] + area[2]}
+        ys = {start_out[1], end_out[1], area[1], area[1] + area[3]}
+        for key in query_index(index, area):
+            x, y, width, height = index['boxes'][key]
+            obstacle = (x - margin, y - margin, width + 2 * margin, height + 2 * margin)
+            obstacles.append(obstacle)
+            xs.update((obstacle[0], obstacle[0] + obstacle[2]))
+            ys.update((obstacle[1], obstacle[1] + obstacle[3]))
+
+        # Own boxes are obstacles too, but their exit points have to stay reachable
+        obstacles = [obstacle for obstacle in obstacles if not inside(start_out, [obstacle])
+                     and not inside(end_out, [obstacle])]
+
+        path = search(sorted(xs), sorted(ys), start_out, end_out, start_dir, obstacles)
+        if path is not None:
+            return path_simplify.merge_collinear([start] + path + [end])
+        padding *= 3
+
+    return fallback_route(start, start_dir, end, end_dir)
@@ -1,6 +1,19 @@
-import lxml.etree as ET
+import itertools
+import logging
+
 import svgwrite
 
+import name_index
+import path_simplify
+import render_profile
+import render_budget
+import svg_stream
+import svg_text
+import xml_backend
+from records import Caption, State, Transition
+
+log = logging.getLogger(__name__)
+
 
 def parse_model_children(elem):
     """ Parse the ModelChildren elements and return their text content. """
@@ -19,8 +32,8 @@ def parse_caption_pos(elem):
             y = int(child.attrib.get('Y'))
             height = int(elem.attrib.get('Height', 0))
             width = int(elem.attrib.get('Width', 0))
-            return {'height':height, 'width':width, 'x': x, 'y': y}
-    return {'x': 0, 'y': 0}
+            return Caption(x, y, width, height)
+    return Caption()
 
 def parse_font_shift(elem):
     shift = 0
@@ -45,13 +58,28 @@ def rgb_to_hex(rgb_string):
     # Format the integers as hexadecimal and return the combined string
     return f'#{r:02X}{g:02X}{b:02X}'
 
-def parse(xml_file, output_file):
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
 
+CANVAS_SIZE = ('1000px', '800px')
+
+
+# Draw one state diagram, models are searched for states whose children belong to drawn states
+# budget (render_budget.Budget) makes the renderer degrade output of too big diagrams
+def render_state_diagram(models, diagram, output_file, simplify_epsilon=0.5, budget=None):
     # SVG setup
-    dwg = svgwrite.Drawing(output_file, profile='full', size=('1000px', '800px'))
+    dwg = svgwrite.Drawing(output_file, profile='full', size=CANVAS_SIZE)
+    svg_stream.save(dwg, render_budget.watch(draw_state_diagram(dwg, models, diagram, simplify_epsilon, budget), budget))
+    log.info('SVG file ' + output_file + ' created successfully.')
+
 
+# Same as render_state_diagram, but yields SVG text in chunks while the diagram is drawn
+def stream_state_diagram(models, diagram, simplify_epsilon=0.5, chunk_size=16384, budget=None):
+    dwg = svgwrite.Drawing(profile='full', size=CANVAS_SIZE)
+    elements = draw_state_diagram(dwg, models, diagram, simplify_epsilon, budget)
+    return svg_stream.stream(dwg, render_budget.watch(elements, budget), chunk_size)
+
+
+# Yield elements of diagram in paint order: states, then transitions
+def draw_state_diagram(dwg, models, diagram, simplify_epsilon=0.5, budget=None):
     # Define arrow marker for transitions
     arrow_marker = dwg.marker(id='arrow', insert=(10, 5), size=(10, 10), orient='auto')
     arrow_marker.add(dwg.path(d='M0,0 L0,10 L10,5 Z', fill='black'))
@@ -64,65 +92,66 @@ def parse(xml_file, output_file):
     points = {}
 
     # Parse states and transitions
-    for elem in root.iter():
-        if 'State' in elem.tag:
-            state_id = elem.attrib.get('Id', None)
-            state_name = get_state_name(elem)
-            state_x = int(elem.attrib.get('X', 0))
-            state_y = int(elem.attrib.get('Y', 0))
-            height = int(elem.attrib.get('Height', 0))
-            width = int(elem.attrib.get('Width', 0))
-            color = rgb_to_hex(elem.attrib.get('Background', 'rgb(0,0,0)'))
-            model_children = parse_model_children(elem)
-            align_to_grid = elem.attrib.get('AlignToGrid')
-            font_shift_y = int(parse_font_shift(elem))
-            print(parse_caption_pos(elem))
-            print(
-                f'Parsed state: ID={state_id}, Name={state_name}, X={state_x}, Y={state_y}, ModelChildren={model_children}, Width={width}, Height={height}')
-            if state_x == 0.0 and state_y == 0.0 and state_id and len(model_children) > 0 and align_to_grid is None:
-                special_states[state_id] = {'name': state_name, 'children': model_children, 'caption': parse_caption_pos(elem)}
-            elif state_id and align_to_grid is None:
-                print('xd')
-                states[state_id] = {'name': state_name, 'x': state_x, 'y': state_y, 'children': model_children,
-                                    'height': height, 'width': width, 'caption': parse_caption_pos(elem), 'fontShift': font_shift_y, 'color': color}
-        elif elem.tag == 'Transition2':
-            x = int(elem.attrib.get('X',0))
-            y = int(elem.attrib.get('Y',0))
-            transition_name = elem.attrib.get('Name', '')
-            id = elem.attrib.get('Id', '')
-            print(f'Parsed transition: Id={id}, X={x}, Y={y}, Name={transition_name}')
-            if x and y and id:
-                transitions.append({'id': id, 'x': x, 'y': y, 'name': transition_name})
-        elif elem.tag == 'Points':
-            pointPoints = []
-            for child in elem.iterchildren():
-                x = child.attrib.get('X')
-                y = child.attrib.get('Y')
-                pointPoints.append({'x': x, 'y': y})
-            points[elem.getparent().attrib.get('Id')] = pointPoints
+    with render_profile.phase('extract'):
+        elements = itertools.chain(models.iter() if models is not None else (), diagram.iter())
+        for elem in elements:
+            if 'State' in elem.tag:
+                state_id = elem.attrib.get('Id', None)
+                state_name = get_state_name(elem)
+                state_x = int(elem.attrib.get('X', 0))
+                state_y = int(elem.attrib.get('Y', 0))
+                height = int(elem.attrib.get('Height', 0))
+                width = int(elem.attrib.get('Width', 0))
+                color = rgb_to_hex(elem.attrib.get('Background', 'rgb(0,0,0)'))
+                model_children = parse_model_children(elem)
+                align_to_grid = elem.attrib.get('AlignToGrid')
+                font_shift_y = int(parse_font_shift(elem))
+                log.debug(parse_caption_pos(elem))
+                log.debug(
+                    f'Parsed state: ID={state_id}, Name={state_name}, X={state_x}, Y={state_y}, ModelChildren={model_children}, Width={width}, Height={height}')
+                if state_x == 0.0 and state_y == 0.0 and state_id and len(model_children) > 0 and align_to_grid is None:
+                    special_states[state_id] = State(state_name, 0, 0, 0, 0, model_children, parse_caption_pos(elem), 0, None)
+                elif state_id and align_to_grid is None:
+                    states[state_id] = State(state_name, state_x, state_y, width, height, model_children,
+                                             parse_caption_pos(elem), font_shift_y, color)
+            elif elem.tag == 'Transition2':
+                x = int(elem.attrib.get('X',0))
+                y = int(elem.attrib.get('Y',0))
+                transition_name = elem.attrib.get('Name', '')
+                id = elem.attrib.get('Id', '')
+                log.debug(f'Parsed transition: Id={id}, X={x}, Y={y}, Name={transition_name}')
+                if x and y and id:
+                    transitions.append(Transition(id, x, y, transition_name))
+            elif elem.tag == 'Points':
+                pointPoints = []
+                for child in elem.iterchildren():
+                    x = float(child.attrib.get('X'))
+                    y = float(child.attrib.get('Y'))
+                    pointPoints.append((x, y))
+                points[elem.getparent().attrib.get('Id')] = pointPoints
 
     # Integrate special states into their parent states
     for special_state_id, special_state_info in special_states.items():
         for parent_id, parent_info in states.items():
-            if special_state_info['name'] in parent_info['name']:
-                print(f'Parent: {parent_info} \n Special: {special_state_info}')
-                parent_info['children'] += "\n" + special_state_info['children']
+            if special_state_info.name in parent_info.name:
+                log.debug(f'Parent: {parent_info} \n Special: {special_state_info}')
+                parent_info.children += "\n" + special_state_info.children
 
     for state_id, state_info in states.items():
-        children_lines = state_info['children'].split('\n')
+        children_lines = state_info.children.split('\n')
         repeat = children_lines.count('')
         for i in range(repeat):
             children_lines.remove('')
 
-        states[state_id]['children'] = ''
+        states[state_id].children = ''
         for child in children_lines:
-            states[state_id]['children'] += child + '\n'
+            states[state_id].children += child + '\n'
 
     toRemove = []
 
     for transition in transitions:
-        print(transition['id'])
-        if points.get(transition['id']) is None:
+        log.debug(transition.id)
+        if points.get(transition.id) is None:
             toRemove.append(transition)
 
     for transition in toRemove:
@@ -130,34 +159,41 @@ def parse(xml_file, output_file):
 
     # Draw states
     for state_id, state_info in states.items():
-        x, y = state_info['x'], state_info['y']
-        rect_width = state_info['width']
-        rect_height = state_info['height']
-        caption = state_info['caption']
-        font_shift = state_info['fontShift']
-        color = state_info['color']
-        print(rect_width)
-        print(rect_height)
-        dwg.add(dwg.rect(insert=(x, y), size=(rect_width, rect_height),
-                         rx=10, ry=10, fill=color, stroke='black'))
-        if caption['x'] != 0 and caption['y'] != 0:
-            dwg.add(
-                dwg.text(state_info['name'], insert=(caption['x']+caption['width']/2, caption['y']+font_shift), text_anchor='middle', font_size='11px',
-                         font_family='Arial'))
-        dwg.add(dwg.line(start=(x, y+font_shift+2), end=(x + rect_width, y+font_shift+2),
-                         stroke='black'))
-        if state_info['children']:
-            children_lines = state_info['children'].split('\n')
+        yield svg_stream.Owner(state_id)
+        x, y = state_info.x, state_info.y
+        rect_width = state_info.width
+        rect_height = state_info.height
+        caption = state_info.caption
+        font_shift = state_info.font_shift
+        color = state_info.color
+        log.debug(rect_width)
+        log.debug(rect_height)
+        yield dwg.rect(insert=(x, y), size=(rect_width, rect_height),
+                       rx=10, ry=10, fill=color, stroke='black')
+        if caption.x != 0 and caption.y != 0:
+            yield dwg.text(render_budget.label(budget, state_info.name), insert=(caption.x+caption.width/2, caption.y+font_shift), text_anchor='middle', font_size='11px',
+                           font_family='Arial')
+        yield dwg.line(start=(x, y+font_shift+2), end=(x + rect_width, y+font_shift+2),
+                       stroke='black')
+        if state_info.children:
+            children_lines = state_info.children.split('\n')
             children_lines.reverse()
-            for i, line in enumerate(children_lines):
-                dwg.add(dwg.text(line, insert=(x+2, y + font_shift * (i+1.3)), text_anchor='start',
-                                 font_size='10px',
-                                 font_family='Arial'))
+            lines = []
+            for line in children_lines:
+                # Budget can run out in the middle of a long list, rest of it is left out
+                if render_budget.degrade(budget, 'members'):
+                    break
+                lines.append(render_budget.line(budget, line))
+            yield from svg_text.text_lines(lines, x+2, y + font_shift * 1.3, font_shift, True, text_anchor='start',
+                                           font_size='10px', font_family='Arial')
 
     # Draw transitions
     for transition in transitions:
-        print(transition['id'])
-        pointsOfTransition = points.get(transition['id'])
+        yield svg_stream.Owner(transition.id)
+        log.debug(transition.id)
+        # Drop duplicated and collinear bend points before they go to SVG
+        pointsOfTransition = render_budget.straight(
+            budget, path_simplify.simplify_points(points.get(transition.id), simplify_epsilon))
         previous = None
         for i in range(len(pointsOfTransition)):
             if previous is None:
@@ -165,23 +201,27 @@ def parse(xml_file, output_file):
                 continue
             actualPoint = pointsOfTransition[i]
             if i == len(pointsOfTransition) - 1:
-                dwg.add(dwg.line(start=(previous.get('x'), previous.get('y')),
-                                 end=(actualPoint.get('x'), actualPoint.get('y')), stroke='black',
-                                 marker_end=arrow_marker.get_funciri()))
+                yield dwg.line(start=previous,
+                               end=actualPoint, stroke='black',
+                               marker_end=arrow_marker.get_funciri())
                 break
-            dwg.add(
-                dwg.line(start=(previous.get('x'), previous.get('y')), end=(actualPoint.get('x'), actualPoint.get('y')),
-                         stroke='black'))
+            yield dwg.line(start=previous, end=actualPoint,
+                           stroke='black')
             previous = actualPoint
-        dwg.add(dwg.text(transition['name'], insert=(transition['x']+120, transition['y']+47), text_anchor='middle', font_size='10px',
-                         font_family='Arial'))
+        yield dwg.text(render_budget.label(budget, transition.name), insert=(transition.x+120, transition.y+47), text_anchor='middle', font_size='10px',
+                       font_family='Arial')
+
 
-    # Save the SVG file
-    dwg.save()
-    print('SVG file ' + output_file + ' created successfully.')
+# With index_db the parsed export also updates the name index (see name_index)
+def parse(xml_file, output_file, simplify_epsilon=0.5, index_db=None):
+    root = xml_backend.parse_file(xml_file)
+    if index_db is not None:
+        name_index.update_db(index_db, xml_file, root)
+    render_state_diagram(root.find('Models'), root.find('Diagrams'), output_file, simplify_epsilon)
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     xml_file = 'sumxmls/simple_state.xml'
     output_file = 'simple_state.svg'
     parse(xml_file, output_file)
@@ -0,0 +1,68 @@
+import itertools
+
+import render_profile
+
+
+# Streaming output of renderers.
+# Every renderer has a draw_* generator that yields svgwrite elements in paint order
+# (containers, nodes, connectors). They are either added to the drawing and saved at once,
+# or serialized here one by one, so the first bytes are out before the rest of the diagram
+# is drawn and the whole document is never held in memory.
+
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8" ?>\n'
+
+
+# Yielded by draw_* generators before elements of one model element, carries Id of that element.
+# It is not drawn, live preview uses it to key fragments of the diagram.
+class Owner:
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+# Opening <svg> tag with <defs>, everything before the first element
+def svg_header(dwg):
+    svg = dwg.tostring()
+    return svg[:svg.rindex('</svg>')]
+
+
+# Add all elements to drawing and save it, same output as adding them in place
+def save(dwg, elements):
+    with render_profile.phase('emit'):
+        for element in elements:
+            if not isinstance(element, Owner):
+                dwg.add(element)
+    with render_profile.phase('save'):
+        dwg.save()
+
+
+# Yield SVG text chunks: header with defs first, then elements joined into chunks of about chunk_size chars
+def stream(dwg, elements, chunk_size=16384):
+    elements = iter(elements)
+    # Renderer adds its markers and sets canvas size before the first element, header has to wait for it
+    first = next(elements, None)
+    yield XML_DECLARATION + svg_header(dwg)
+    if first is not None:
+        elements = itertools.chain([first], elements)
+
+    chunk = []
+    length = 0
+    for element in elements:
+        if isinstance(element, Owner):
+            continue
+        text = element.tostring()
+        chunk.append(text)
+        length += len(text)
+        if length >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    chunk.append('</svg>')
+    yield ''.join(chunk)
+
+
+def write_stream(chunks, svg_file):
+    with open(svg_file, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(chunk)
@@ -0,0 +1,23 @@
+import svgwrite
+
+
+# Multi-line labels.
+# All lines of one label go into one <text> with the label styling, every next line is a <tspan>
+# moved down by dy, instead of a separate <text> repeating font attributes and position per line.
+
+
+# <text> whose lines were already counted one by one against a render budget (render_budget.line)
+class CountedLines(svgwrite.text.Text):
+    pass
+
+
+# [] for a label without lines, otherwise list with one <text>; attributes are svgwrite keywords of the text
+# counted marks lines that went through render_budget.line, so the budget does not count them again
+def text_lines(lines, x, y, line_height, counted=False, **attributes):
+    if not lines:
+        return []
+    text_class = CountedLines if counted else svgwrite.text.Text
+    text = text_class(lines[0], insert=(x, y), **attributes)
+    for line in lines[1:]:
+        text.add(svgwrite.text.TSpan(line, x=[x], dy=[line_height]))
+    return [text]
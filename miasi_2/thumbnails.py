@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml.etree as ET
+
+
+# Previews of rendered diagrams for catalog pages.
+# For every SVG a low-detail SVG (shapes only, text dropped, view box cut to the drawn area,
+# scaled to thumbnail size) and a PNG thumbnail of it are written. Work runs on a process pool.
+# Outputs are keyed by SHA-1 of the source SVG and preview size, kept in previews.json in the
+# output directory, so unchanged diagrams are skipped on the next run.
+# PNGs are made only by a rasterizer installed on this machine (rsvg-convert, inkscape,
+# ImageMagick or the cairosvg package), without one only low-detail SVGs are written.
+
+SVG_NS = '{http://www.w3.org/2000/svg}'
+MANIFEST = 'previews.json'
+
+# Dropped from low-detail SVG
+DETAIL_TAGS = ('text', 'tspan', 'textPath', 'title', 'desc')
+
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+TRANSLATE = re.compile(r'translate\(\s*([^,\s)]+)[,\s]*([^)\s]*)\s*\)')
+
+
+def number(value, default=0.0):
+    try:
+        return float(NUMBER.match(value or '').group())
+    except AttributeError:
+        return default
+
+
+# Box (min x, min y, max x, max y) of one shape element, None for elements that have no box
+def element_box(elem):
+    tag = elem.tag.replace(SVG_NS, '')
+    get = elem.get
+    if tag == 'rect':
+        x, y = number(get('x')), number(get('y'))
+        return x, y, x + number(get('width')), y + number(get('height'))
+    if tag in ('circle', 'ellipse'):
+        cx, cy = number(get('cx')), number(get('cy'))
+        rx = number(get('r') or get('rx'))
+        ry = number(get('r') or get('ry'))
+        return cx - rx, cy - ry, cx + rx, cy + ry
+    if tag == 'line':
+        xs = (number(get('x1')), number(get('x2')))
+        ys = (number(get('y1')), number(get('y2')))
+        return min(xs), min(ys), max(xs), max(ys)
+    if tag in ('polygon', 'polyline', 'path'):
+        # Path commands with relative coordinates are rare in renderer output, pairs of numbers are enough
+        values = [float(value) for value in NUMBER.findall(get('points') or get('d') or '')]
+        xs, ys = values[0::2], values[1::2]
+        if xs and ys:
+            return min(xs), min(ys), max(xs), max(ys)
+    return None
+
+
+# Sum of translate() of element and its ancestors, fragments reused by fragment_cache are placed by it
+def offset(elem):
+    dx = dy = 0.0
+    while elem is not None:
+        match = TRANSLATE.search(elem.get('transform') or '')
+        if match:
+            dx += number(match.group(1))
+            dy += number(match.group(2))
+        elem = elem.getparent()
+    return dx, dy
+
+
+def placed_box(elem):
+    box = element_box(elem)
+    if box is None:
+        return None
+    dx, dy = offset(elem)
+    return box[0] + dx, box[1] + dy, box[2] + dx, box[3] + dy
+
+
+# Low-detail copy of SVG text: no labels, view box around drawn shapes, width and height of thumbnail
+def low_detail_svg(svg_text, width=320, height=240, margin=10):
+    root = ET.fromstring(svg_text.encode('utf-8'))
+    for elem in list(root.iter(*[SVG_NS + tag for tag in DETAIL_TAGS])):
+        elem.getparent().remove(elem)
+
+    # Marker shapes in <defs> are not drawn where they stand
+    defs = root.find(SVG_NS + 'defs')
+    in_defs = set(defs.iter()) if defs is not None else set()
+    boxes = [placed_box(elem) for elem in root.iter(SVG_NS + '*') if elem not in in_defs]
+    boxes = [box for box in boxes if box is not None]
+    if boxes:
+        left = min(box[0] for box in boxes) - margin
+        top = min(box[1] for box in boxes) - margin
+        right = max(box[2] for box in boxes) + margin
+        bottom = max(box[3] for box in boxes) + margin
+        root.set('viewBox', f'{left:g} {top:g} {right - left:g} {bottom - top:g}')
+        # Keep aspect ratio of the drawing inside the thumbnail box
+        scale = min(width / (right - left), height / (bottom - top))
+        width, height = max(int((right - left) * scale), 1), max(int((bottom - top) * scale), 1)
+    root.set('width', str(width))
+    root.set('height', str(height))
+    return ET.tostring(root, xml_declaration=True, encoding='utf-8').decode('utf-8'), (width, height)
+
+
+# Command that turns svg_file into png_file of given size, None when no rasterizer is installed
+def find_rasterizer():
+    if shutil.which('rsvg-convert'):
+        return 'rsvg-convert'
+    if shutil.which('inkscape'):
+        return 'inkscape'
+    if shutil.which('magick'):
+        return 'magick'
+    try:
+        import cairosvg  # noqa: F401
+        return 'cairosvg'
+    except ImportError:
+        return None
+
+
+def rasterize(rasterizer, svg_file, png_file, size):
+    width, height = size
+    if rasterizer == 'cairosvg':
+        import cairosvg
+        cairosvg.svg2png(url=svg_file, write_to=png_file, output_width=width, output_height=height)
+        return
+    commands = {
+        'rsvg-convert': ['rsvg-convert', '-w', str(width), '-h', str(height), '-o', png_file, svg_file],
+        'inkscape': ['inkscape', svg_file, '--export-type=png', f'--export-filename={png_file}',
+                     '-w', str(width), '-h', str(height)],
+        'magick': ['magick', '-background', 'white', svg_file, '-resize', f'{width}x{height}', png_file],
+    }
+    subprocess.run(commands[rasterizer], check=True, capture_output=True, timeout=120)
+
+
+def content_key(svg_bytes, width, height):
+    digest = hashlib.sha1(svg_bytes)
+    digest.update(f'|{width}x{height}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Diagrams of different exports share file names (001_ClassDiagram_Klasy.svg), so output names
+# also carry a hash of the absolute source path
+def preview_paths(output_dir, svg_file):
+    path = os.path.abspath(svg_file)
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+    name = f'{os.path.splitext(os.path.basename(path))[0]}.{digest}'
+    return os.path.join(output_dir, f'{name}.thumb.svg'), os.path.join(output_dir, f'{name}.png')
+
+
+# Runs in worker process, returns entry for manifest
+def make_preview(svg_file, output_dir, width, height, rasterizer, key):
+    thumb_file, png_file = preview_paths(output_dir, svg_file)
+    with open(svg_file, encoding='utf-8') as f:
+        thumb_svg, size = low_detail_svg(f.read(), width, height)
+    with open(thumb_file, 'w', encoding='utf-8') as f:
+        f.write(thumb_svg)
+    entry = {'key': key, 'thumb': thumb_file, 'png': None, 'size': list(size), 'error': None}
+    if rasterizer is not None:
+        try:
+            rasterize(rasterizer, thumb_file, png_file, size)
+            entry['png'] = png_file
+        except (OSError, subprocess.SubprocessError) as e:
+            entry['error'] = f'{rasterizer} failed: {e}'
+    return entry
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+# Entries written under an older naming scheme are made again
+def up_to_date(entry, key, thumb_file):
+    if entry is None or entry.get('key') != key or entry.get('error') or entry.get('thumb') != thumb_file:
+        return False
+    return all(path is None or os.path.exists(path) for path in (entry.get('thumb'), entry.get('png')))
+
+
+# Make previews of all svg_files into output_dir, returns {svg path: manifest entry with 'skipped'}
+def make_previews(svg_files, output_dir, width=320, height=240, workers=None, rasterizer='auto'):
+    os.makedirs(output_dir, exist_ok=True)
+    if rasterizer == 'auto':
+        rasterizer = find_rasterizer()
+    manifest = load_manifest(output_dir)
+
+    jobs = []
+    results = {}
+    for svg_file in svg_files:
+        path = os.path.abspath(svg_file)
+        with open(path, 'rb') as f:
+            key = content_key(f.read(), width, height)
+        # PNG missing because no rasterizer was there before does not count as up to date
+        entry = manifest.get(path)
+        thumb_file = preview_paths(output_dir, path)[0]
+        if up_to_date(entry, key, thumb_file) and (entry['png'] is not None or rasterizer is None):
+            results[path] = dict(entry, skipped=True)
+        else:
+            jobs.append((path, key))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(path, executor.submit(make_preview, path, output_dir, width, height, rasterizer, key))
+                       for path, key in jobs]
+            for path, future in futures:
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    entry = {'key': None, 'thumb': None, 'png': None, 'size': None, 'error': str(e)}
+                manifest[path] = entry
+                results[path] = dict(entry, skipped=False)
+        save_manifest(output_dir, manifest)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PNG thumbnails and low-detail SVG previews of rendered diagrams')
+    parser.add_argument('svg_files', nargs='+')
+    parser.add_argument('--out', default='previews', help='output directory')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--rasterizer', default='auto',
+                        choices=['auto', 'rsvg-convert', 'inkscape', 'magick', 'cairosvg', 'none'])
+    args = parser.parse_args()
+
+    rasterizer = None if args.rasterizer == 'none' else args.rasterizer
+    if rasterizer == 'auto' and find_rasterizer() is None:
+        print('No rasterizer installed (rsvg-convert, inkscape, magick or cairosvg), writing SVG previews only',
+              file=sys.stderr)
+    results = make_previews(args.svg_files, args.out, args.width, args.height, args.workers, rasterizer)
+    failed = False
+    for path, entry in results.items():
+        state = 'unchanged' if entry['skipped'] else ('ERROR ' + entry['error'] if entry['error'] else 'done')
+        failed = failed or bool(entry['error'])
+        print(f"{path}: {state}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
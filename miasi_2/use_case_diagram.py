@@ -1,86 +1,91 @@
-import xml.etree.ElementTree as ET
 import svgwrite
 import math
 
-def arrowhead_coordinates(x1, y1, x2, y2):
-    arrow_length = 10
-    arrow_angle_degrees = 45
-    theta = math.atan2(y2 - y1, x2 - x1)
-
-    alpha = math.radians(arrow_angle_degrees)
-
-    x3 = x2 - arrow_length * math.cos(theta - alpha)
-    y3 = y2 - arrow_length * math.sin(theta - alpha)
-
-    x4 = x2 - arrow_length * math.cos(theta + alpha)
-    y4 = y2 - arrow_length * math.sin(theta + alpha)
-
-    return (x3, y3), (x4, y4)
+import render_budget
+import render_profile
+import svg_stream
+import xml_backend
+
+# Relationship kinds of use case models, in paint order
+RELATIONSHIP_KINDS = ('Association', 'Dependency', 'Include', 'Extend', 'Generalization')
+
+# Arrowhead of every kind but Association, shared in <defs> and placed with <use>.
+# Tiny profile has no <marker>, heads point along +x with the tip at (0, 0).
+HEADS = {
+    'Dependency': ('M-10,-5 L0,0 L-10,5', 'none'),
+    'Include': ('M-10,-5 L0,0 L-10,5', 'none'),
+    'Extend': ('M-10,-5 L0,0 L-10,5', 'none'),
+    'Generalization': ('M-12,-7 L0,0 L-12,7 Z', 'white'),
+}
+DASHED_KINDS = ('Dependency', 'Include', 'Extend')
+STEREOTYPES = {'Include': '«include»', 'Extend': '«extend»'}
+
+
+# Ends of association, attributes of the Association itself or Idrefs in its FromEnd/ToEnd
+def association_ends(association):
+    source = association.get('EndRelationshipFromMetaModelElement')
+    target = association.get('EndRelationshipToMetaModelElement')
+    if source is not None and target is not None:
+        return source, target
+    ends = []
+    for tag in ('FromEnd', 'ToEnd'):
+        end = association.find(tag)
+        ref = None
+        if end is not None:
+            for elem in end.iter('UseCase', 'Actor'):
+                ref = elem.get('Idref')
+                break
+        ends.append(ref)
+    return tuple(ends)
+
+
+# Typed edge list of all relationships of the model: one walk over ModelRelationshipContainer.
+# References inside relationships (MasterView, Type) carry Idref only and are skipped.
+def extract_relationships(root):
+    container = root.find(".//Models/ModelRelationshipContainer")
+    relationships = []
+    if container is None:
+        return relationships
+    for elem in container.iter(*RELATIONSHIP_KINDS):
+        if elem.get('Id') is None:
+            continue
+        if elem.tag == 'Association':
+            source, target = association_ends(elem)
+        else:
+            # Other kinds are drawn only when some diagram shows them
+            if elem.find('MasterView') is None:
+                continue
+            source, target = elem.get('From'), elem.get('To')
+        if source is None or target is None:
+            continue
+        relationships.append({'kind': elem.tag, 'id': elem.get('Id'), 'from': source, 'to': target})
+    return relationships
 
-def parse_usecase_diagram(xml_file):
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-    diagrams = root.find(".//Diagrams")
-    system = root.find(".//UseCaseDiagram")
-    relations = root.find(".//Models/ModelRelationshipContainer/ModelChildren")
 
+# Extract elements of one already parsed UseCaseDiagram, relations come from project models
+def extract_usecase_diagram(root, diagram):
     actors = {}
     use_cases = []
-    associations = []
-    dependencies = []
     systems = []
 
     actor_coords = {actor.get('Id'): (actor.get('X'), actor.get('Y'))
-                    for actor in root.findall(".//Diagrams/UseCaseDiagram/Shapes/Actor")}
+                    for actor in diagram.findall("./Shapes/Actor")}
 
-    for actor in diagrams.findall(".//Actor"):
+    for actor in diagram.iter('Actor'):
         actor_id = actor.get('Id')
-        actor_name = actor.get('Name')
-        if actor_id in actor_coords:
-            coords = actor_coords[actor_id]
-            actors[actor_id] = {'name': actor_name, 'coords': coords}
-        else:
-            actors[actor_id] = {'name': actor_name, 'coords': (None, None)}
+        actors[actor_id] = {'name': actor.get('Name'), 'model': actor.get('Model'),
+                            'coords': actor_coords.get(actor_id, (None, None))}
 
-    for use_case in system.findall(".//UseCase"):
+    for use_case in diagram.iter('UseCase'):
         use_cases.append({
             'id': use_case.get('Id'),
+            'model': use_case.get('Model'),
             'name': use_case.get('Name'),
             'x': use_case.get('X'),
             'y': use_case.get('Y')
         })
 
-    for association in relations.findall(".//Association"):
-        new_association = {"source": "", "destination": ""}
-        if association.find('.//FromEnd') is None:
-            continue
-        from_end = association.find('.//FromEnd')
-        use_case = from_end.find('.//UseCase')
-        actor = from_end.find('.//Actor')
-        if use_case is not None:
-            new_association["source"] = use_case.get("Idref")
-        elif actor is not None:
-            new_association["source"] = actor.get("Idref")
-
-        to_end = association.find('.//ToEnd')
-        use_case = to_end.find('.//UseCase')
-        actor = to_end.find('.//Actor')
-        if use_case is not None:
-            new_association["destination"] = use_case.get("Idref")
-        elif actor is not None:
-            new_association["destination"] = actor.get("Idref")
-
-        associations.append(new_association)
-
-    for dependency in relations.findall(".//Dependency"):
-        if dependency.find('.//MasterView') is None:
-            continue
-        dependencies.append({
-            'from': dependency.get("From"),
-            'to': dependency.get("To")
-        })
-
-    for system in diagrams.findall('.//System'):
+    for system in diagram.iter('System'):
         systems.append({
             'id': system.get('Id'),
             'name': system.get('Name'),
@@ -90,73 +95,124 @@ def parse_usecase_diagram(xml_file):
             'height': int(system.get('Height'))
         })
 
-    return actors, use_cases, associations, dependencies, systems
+    return actors, use_cases, extract_relationships(root), systems
+
 
+def parse_usecase_diagram(xml_file):
+    root = xml_backend.parse_file(xml_file)
+    with render_profile.phase('extract'):
+        return extract_usecase_diagram(root, root.find(".//UseCaseDiagram"))
 
-def draw_usecase_diagram(actors, use_cases, associations, dependencies, systems, svg_file):
-    coords_map = {}
 
-    for id, actor in actors.items():
+def draw_usecase_diagram(actors, use_cases, relationships, systems, svg_file, budget=None):
+    dwg = svgwrite.Drawing(svg_file, profile='tiny')
+    elements = draw_usecase_elements(dwg, actors, use_cases, relationships, systems, budget)
+    svg_stream.save(dwg, render_budget.watch(elements, budget))
+
+
+# Same as draw_usecase_diagram, but yields SVG text in chunks while the diagram is drawn
+def stream_usecase_diagram(actors, use_cases, relationships, systems, chunk_size=16384, budget=None):
+    dwg = svgwrite.Drawing(profile='tiny')
+    elements = draw_usecase_elements(dwg, actors, use_cases, relationships, systems, budget)
+    return svg_stream.stream(dwg, render_budget.watch(elements, budget), chunk_size)
+
+
+# Point where line from (x1, y1) to the middle of ellipse (x2, y2) enters it
+def ellipse_entry(x1, y1, x2, y2, rx, ry):
+    dx, dy = x2 - x1, y2 - y1
+    length = math.hypot(dx / rx, dy / ry)
+    if length <= 1:
+        return x2, y2
+    return round(x2 - dx / length, 4), round(y2 - dy / length, 4)
+
+
+# Yield elements of diagram in paint order: systems, actors, use cases, then relations by kind.
+# Relations are straight lines already, over budget (render_budget) only labels are cut.
+def draw_usecase_elements(dwg, actors, use_cases, relationships, systems, budget=None):
+    # Shapes of model elements, relationship ends are resolved through it
+    positions = {}
+    ellipses = set()
+
+    for actor in actors.values():
         x, y = map(int, actor['coords'])
-        coords_map[id[:-1]] = (x, y)
+        positions[actor['model']] = (x, y)
 
     for use_case in use_cases:
-        coords_map[use_case['id'][:-1]] = (int(use_case['x']), int(use_case['y']))
+        positions[use_case['model']] = (int(use_case['x']), int(use_case['y']))
+        ellipses.add(use_case['model'])
 
-    dwg = svgwrite.Drawing(svg_file, profile='tiny')
+    shown = [relationship for relationship in relationships
+             if relationship['from'] in positions and relationship['to'] in positions]
+    shown.sort(key=lambda relationship: RELATIONSHIP_KINDS.index(relationship['kind']))
 
-    actor_positions = {}
-    use_case_positions = {}
+    # One head per kind in <defs>, only kinds present on this diagram
+    for kind in RELATIONSHIP_KINDS:
+        if kind in HEADS and any(relationship['kind'] == kind for relationship in shown):
+            path, fill = HEADS[kind]
+            dwg.defs.add(dwg.path(d=path, id=f'{kind.lower()}-head', fill=fill, stroke='black'))
 
     for system in systems:
+        yield svg_stream.Owner(system['id'])
         x, y, width, height = system['x'], system['y'], system['width'], system['height']
         new_width = width * 1.3
         new_x = x - (new_width - width)
-        dwg.add(dwg.rect(insert=(new_x, y), size=(new_width, height), fill='#7acff5', stroke='black'))
-        dwg.add(dwg.text(system['name'], insert=(new_x + 10, y + 20), font_size=15, font_weight="bold"))
+        yield dwg.rect(insert=(new_x, y), size=(new_width, height), fill='#7acff5', stroke='black')
+        yield dwg.text(render_budget.label(budget, system['name']), insert=(new_x + 10, y + 20), font_size=15, font_weight="bold")
 
     for actor_id, actor_details in actors.items():
+        yield svg_stream.Owner(actor_id)
         x, y = map(int, actor_details['coords'])
-        actor_positions[actor_id] = (x, y)
-        dwg.add(
-            dwg.circle(center=(x, y - 20), r=10, fill='#7acff5', stroke='black', stroke_width=1))  # Głowa z konturem
-        dwg.add(dwg.line(start=(x, y - 10), end=(x, y + 20), stroke='black'))  # Ciało
-        dwg.add(dwg.line(start=(x, y), end=(x - 10, y + 10), stroke='black'))  # Lewa ręka
-        dwg.add(dwg.line(start=(x, y), end=(x + 10, y + 10), stroke='black'))  # Prawa ręka
-        dwg.add(dwg.line(start=(x, y + 20), end=(x - 10, y + 30), stroke='black'))  # Lewa noga
-        dwg.add(dwg.line(start=(x, y + 20), end=(x + 10, y + 30), stroke='black'))  # Prawa noga
-        dwg.add(dwg.text(actor_details["name"], insert=(int(x) - 20, int(y) - 30)))
+        yield dwg.circle(center=(x, y - 20), r=10, fill='#7acff5', stroke='black', stroke_width=1)  # Głowa z konturem
+        yield dwg.line(start=(x, y - 10), end=(x, y + 20), stroke='black')  # Ciało
+        yield dwg.line(start=(x, y), end=(x - 10, y + 10), stroke='black')  # Lewa ręka
+        yield dwg.line(start=(x, y), end=(x + 10, y + 10), stroke='black')  # Prawa ręka
+        yield dwg.line(start=(x, y + 20), end=(x - 10, y + 30), stroke='black')  # Lewa noga
+        yield dwg.line(start=(x, y + 20), end=(x + 10, y + 30), stroke='black')  # Prawa noga
+        yield dwg.text(render_budget.label(budget, actor_details["name"]), insert=(int(x) - 20, int(y) - 30))
 
     for use_case in use_cases:
+        yield svg_stream.Owner(use_case['id'])
         x, y = map(int, (use_case['x'], use_case['y']))
-        use_case_positions[use_case['id']] = (x, y)
-        dwg.add(dwg.ellipse(center=(x, y), r=(60, 30), fill='none', stroke='black'))
-        dwg.add(dwg.text(use_case['name'], insert=(x - 25, y)))
-
-    for association in associations:
-        id_source = association['source'][:-1]
-        id_destination = association['destination'][:-1]
-        line_begin = coords_map[id_source]
-        line_end = coords_map[id_destination]
-        dwg.add(dwg.line(start=line_begin, end=line_end, stroke=svgwrite.rgb(0, 0, 0, '%')))
-
-    for dependency in dependencies:
-        id_source = dependency['from'][:-1]
-        id_destination = dependency['to'][:-1]
-        line_begin = coords_map[id_source]
-        line_end = coords_map[id_destination]
-        dwg.add(dwg.line(start=line_begin, end=line_end, stroke=svgwrite.rgb(0, 0, 0, '%'), stroke_dasharray="5,5"))
-        (x2, y2),(x1, y1) =arrowhead_coordinates(*line_begin, *line_end )
-        dwg.add(dwg.line(start=(x1, y1), end=line_end, stroke=svgwrite.rgb(0, 0, 0, '%')))
-        dwg.add(dwg.line(start=(x2, y2), end=line_end, stroke=svgwrite.rgb(0, 0, 0, '%')))
-
-    dwg.save()
-
-
-xml_file = 'usecase_diagram.xml'
-svg_file = 'usecase_diagram.svg'
-
-actors, use_cases, associations, dependencies, systems = parse_usecase_diagram(xml_file)
-draw_usecase_diagram(actors, use_cases, associations, dependencies, systems, svg_file)
+        yield dwg.ellipse(center=(x, y), r=(60, 30), fill='none', stroke='black')
+        yield dwg.text(render_budget.label(budget, use_case['name']), insert=(x - 25, y))
+
+    for relationship in shown:
+        yield svg_stream.Owner(relationship['id'])
+        kind = relationship['kind']
+        line_begin = positions[relationship['from']]
+        line_end = positions[relationship['to']]
+        if kind == 'Association':
+            yield dwg.line(start=line_begin, end=line_end, stroke=svgwrite.rgb(0, 0, 0, '%'))
+            continue
 
-print(f'Diagram zapisany w {svg_file}')
+        # Line runs between edges of use case ellipses, not their middles
+        if relationship['to'] in ellipses:
+            line_end = ellipse_entry(*line_begin, *line_end, 60, 30)
+        if relationship['from'] in ellipses:
+            line_begin = ellipse_entry(*line_end, *line_begin, 60, 30)
+        line = dwg.line(start=line_begin, end=line_end, stroke=svgwrite.rgb(0, 0, 0, '%'))
+        if kind in DASHED_KINDS:
+            line['stroke-dasharray'] = '5,5'
+        yield line
+        head = dwg.use(f'#{kind.lower()}-head')
+        head.translate(*line_end)
+        head.rotate(round(math.degrees(math.atan2(line_end[1] - line_begin[1], line_end[0] - line_begin[0])), 2))
+        yield head
+        if kind in STEREOTYPES:
+            middle = (round((line_begin[0] + line_end[0]) / 2, 1), round((line_begin[1] + line_end[1]) / 2 - 4, 1))
+            yield dwg.text(render_budget.label(budget, STEREOTYPES[kind]), insert=middle, font_size=11,
+                           text_anchor='middle')
+
+
+def main():
+    xml_file = 'usecase_diagram.xml'
+    svg_file = 'usecase_diagram.svg'
+
+    actors, use_cases, relationships, systems = parse_usecase_diagram(xml_file)
+    draw_usecase_diagram(actors, use_cases, relationships, systems, svg_file)
+
+    print(f'Diagram zapisany w {svg_file}')
+
+
+if __name__ == "__main__":
+    main()
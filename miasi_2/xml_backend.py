@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import io
+import mmap
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import lxml.etree as ET
+
+import render_profile
+
+
+# One lxml parsing backend for all renderers.
+# lxml releases the GIL while it parses, so exports parsed on a thread pool really run in parallel,
+# without forking. XMLParser instances must not be shared by threads running at the same time,
+# every thread creates its own once and reuses it for all following documents.
+#
+# Sources can be plain exports, gzip compressed exports or members of zip bundles, written as
+# 'bundle.zip!path/in/zip.xml' ('bundle.zip' alone when it holds one .xml). Format is told by
+# the first bytes, not by the name. Compressed exports are decompressed while lxml reads them,
+# no temporary file is written. Plain files are parsed straight from a memory map, so the export
+# is never copied into a Python bytes object.
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+local = threading.local()
+
+
+def make_parser():
+    return ET.XMLParser(huge_tree=True, remove_blank_text=True)
+
+
+def get_parser():
+    parser = getattr(local, 'parser', None)
+    if parser is None:
+        parser = local.parser = make_parser()
+    return parser
+
+
+# (archive path, member) for 'bundle.zip!member.xml', (path, None) for everything else
+def split_member(source):
+    if '!' in source and not os.path.exists(source):
+        path, member = source.rsplit('!', 1)
+        return path, member
+    return source, None
+
+
+# The only .xml member of zip, members have to be named when there are more of them
+def zip_member(archive, member=None):
+    if member is not None:
+        return member
+    names = [name for name in archive.namelist() if name.lower().endswith('.xml')]
+    if len(names) != 1:
+        raise ValueError(f'zip holds {len(names)} XML files, name one as bundle.zip!member.xml')
+    return names[0]
+
+
+# Paths with zip bundles expanded to one 'bundle.zip!member.xml' source per XML member
+def expand_sources(paths):
+    sources = []
+    for path in paths:
+        if os.path.isfile(path) and zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                sources += [f'{path}!{name}' for name in archive.namelist() if name.lower().endswith('.xml')]
+        else:
+            sources.append(path)
+    return sources
+
+
+# Name of export without directories and extensions: 'bundle.zip!a/x.xml' -> 'x', 'y.xml.gz' -> 'y'
+def source_name(source):
+    path, member = split_member(os.fspath(source))
+    name = os.path.basename(member or path)
+    if name.lower().endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+
+# source_name of every source, made unique within the list: exports of the same name in different
+# directories ('a/x.xml', 'b/x.xml') get a hash of their absolute path appended ('x.3e4de2b27e7c')
+def unique_names(sources):
+    names = [source_name(source) for source in sources]
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    unique = []
+    for source, name in zip(sources, names):
+        if counts[name] > 1:
+            path, member = split_member(os.fspath(source))
+            key = os.path.abspath(path) + ('!' + member if member is not None else '')
+            name = f"{name}.{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+        unique.append(name)
+    return unique
+
+
+def parse_stream(stream):
+    return ET.parse(stream, get_parser()).getroot()
+
+
+# Parse file (path, bundle member or file object) and return root element
+def parse_file(source):
+    with render_profile.phase('parse'):
+        if not isinstance(source, (str, os.PathLike)):
+            return parse_stream(source)
+        path, member = split_member(os.fspath(source))
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return parse_stream(f)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic = data[:4]
+                if magic.startswith(GZIP_MAGIC) and member is None:
+                    with gzip.GzipFile(fileobj=f) as stream:
+                        return parse_stream(stream)
+                if magic == ZIP_MAGIC:
+                    with zipfile.ZipFile(f) as archive, archive.open(zip_member(archive, member)) as stream:
+                        return parse_stream(stream)
+                if member is not None:
+                    raise ValueError(f'{path} is not a zip bundle')
+                return ET.fromstring(data, get_parser())
+
+
+# Parse export already held in memory, gzip compressed data is decompressed while it is parsed
+def parse_bytes(data):
+    with render_profile.phase('parse'):
+        if data[:2] == GZIP_MAGIC:
+            with gzip.GzipFile(fileobj=io.BytesIO(data)) as stream:
+                return parse_stream(stream)
+        return ET.fromstring(data, get_parser())
+
+
+# Parse many files on a thread pool, roots are returned in order of sources
+def parse_many(sources, workers=None):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_file, sources))
+
+
+# Run job(*args) for every tuple of args on a thread pool. Errors do not stop the batch,
+# every job gives back (result, None) or (None, error message) in order of jobs.
+def run_batch(job, jobs, workers=None):
+    def run(args):
+        try:
+            return job(*args), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, jobs))